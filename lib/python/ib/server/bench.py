@@ -0,0 +1,150 @@
+#! /usr/bin/env python
+# ****************************************************************************
+# Licensed to Qualys, Inc. (QUALYS) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# QUALYS licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ****************************************************************************
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import tempfile
+import threading
+import subprocess
+
+class IbServerReadyPoller( threading.Thread ) :
+    """
+    Poll a TCP port until it accepts a connection, the process exits, or
+    the timeout expires; then call the ready function (with True if the
+    port is ready).
+    """
+    def __init__( self, host, port, process, timeout, ready, interval=0.01 ) :
+        threading.Thread.__init__( self, name='ib-ready-poller' )
+        self.daemon = True
+        self._address = ( host, port )
+        self._process = process
+        self._timeout = timeout
+        self._ready = ready
+        self._interval = interval
+
+    def _Connect( self ) :
+        try :
+            sock = socket.create_connection( self._address, 0.5 )
+            sock.close( )
+            return True
+        except socket.error :
+            return False
+
+    def run( self ) :
+        end = time.time( ) + self._timeout
+        while time.time( ) < end  and  self._process.poll( ) is None :
+            if self._Connect( ) :
+                self._ready( True )
+                return
+            time.sleep( self._interval )
+        self._ready( False )
+
+class IbServerBench( object ) :
+    """
+    Run a server launcher repeatedly (cold starts, with wiped configuration
+    and an empty generator cache, then warm starts), collecting each run's
+    phase laps from a results file, and report per-phase statistics.
+    """
+    _modes = ( 'cold', 'warm' )
+
+    def __init__( self, argv, runs, verbose=0 ) :
+        self._argv = argv
+        self._runs = runs
+        self._verbose = verbose
+        self._results = dict( [(mode, [ ]) for mode in self._modes] )
+        self._phases = [ ]
+        self._failed = 0
+
+    def _RunOnce( self, mode, tmpdir, num ) :
+        outpath = os.path.join( tmpdir, '{}.{}.json'.format(mode, num) )
+        cmd = [ sys.executable ] + self._argv + [ '--bench-out', outpath ]
+        if mode == 'cold' :
+            cmd += [ '--wipe', '--set', 'GeneratorCache='+os.path.join(tmpdir, 'cache.{}'.format(num)) ]
+        if self._verbose :
+            print 'Bench {} run {}: {}'.format( mode, num, cmd )
+        spawned = time.time( )
+        status = subprocess.call( cmd )
+        try :
+            with open( outpath ) as fp :
+                result = json.load( fp )
+        except (IOError, ValueError) :
+            result = None
+        if status != 0  or  result is None  or  not result['ready'] :
+            print 'Bench {} run {} failed (status {})'.format( mode, num, status )
+            self._failed += 1
+            return
+        laps = [ ( 'interpreter', result['start'] - spawned ) ]
+        last = 0.0
+        for name, elapsed in result['laps'] :
+            laps.append( (name, elapsed - last) )
+            last = elapsed
+            if name == 'ready' :
+                laps.append( ('total-to-ready', elapsed + laps[0][1]) )
+        for name, value in laps :
+            if name not in self._phases :
+                self._phases.append( name )
+        self._results[mode].append( dict(laps) )
+
+    def Run( self ) :
+        tmpdir = tempfile.mkdtemp( prefix='ib-bench-' )
+        try :
+            for mode in self._modes :
+                for num in range( self._runs ) :
+                    self._RunOnce( mode, tmpdir, num )
+        finally :
+            shutil.rmtree( tmpdir, ignore_errors=True )
+        return 1 if self._failed else 0
+
+    @staticmethod
+    def _Stats( values ) :
+        values = sorted( values )
+        n = len(values)
+        median = values[n//2] if n % 2 else (values[n//2-1] + values[n//2]) / 2.0
+        return values[0], sum(values) / n, median, values[-1]
+
+    def FormatReport( self ) :
+        lines = [ ]
+        for mode in self._modes :
+            results = self._results[mode]
+            lines.append( '{} starts: {} of {} runs ready'.format(mode.capitalize(), len(results), self._runs) )
+            if len(results) == 0 :
+                continue
+            lines.append( '  {:<16s} {:>9s} {:>9s} {:>9s} {:>9s}'.format(
+                'Phase', 'Min', 'Mean', 'Median', 'Max') )
+            for phase in self._phases :
+                values = [ r[phase] for r in results if phase in r ]
+                if len(values) :
+                    lines.append( '  {:<16s} {:8.3f}s {:8.3f}s {:8.3f}s {:8.3f}s'.format(
+                        phase, *self._Stats(values)) )
+        return lines
+
+class IbModule_server_bench( object ) :
+    modulePath = __file__
+
+if __name__ == "__main__" :
+    assert False, "not stand-alone"
+
+### Local Variables: ***
+### py-indent-offset:4 ***
+### python-indent:4 ***
+### python-continuation-offset:4 ***
+### tab-width:4  ***
+### End: ***
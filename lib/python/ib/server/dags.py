@@ -21,6 +21,11 @@ import collections
 class IbServerDags( object ) :
     def __init__( self ) :
         self._dags = collections.OrderedDict()
+        self._stopwatch = None
+
+    def SetStopwatch( self, stopwatch ) :
+        """ Record a stopwatch lap as each top level DAG finishes executing """
+        self._stopwatch = stopwatch
 
     def _AddDag( self, name, *args, **kwargs ) :
         dag = IbDag( name, *args, **kwargs )
@@ -60,6 +65,18 @@ class IbServerDags( object ) :
     def GetDag( self, name ) :
         return self._dags.get(name)
 
+    def AllNodes( self ) :
+        dags = list( self._dags.values() )
+        seen = set( )
+        while len(dags) :
+            dag = dags.pop( 0 )
+            if dag in seen :
+                continue
+            seen.add( dag )
+            for node in dag.Nodes :
+                yield node
+            dags += list( dag.Children )
+
     def Evaluate( self, *args, **kwargs ) :
         for dag in self._dags.values() :
             dag.Evaluate( *args, **kwargs )
@@ -67,6 +84,8 @@ class IbServerDags( object ) :
     def Execute( self, *args, **kwargs ) :
         for dag in self._dags.values() :
             dag.Execute( *args, **kwargs )
+            if self._stopwatch is not None :
+                self._stopwatch.Lap( dag.Name )
 
     def Dump( self, debug=0, debug_fp=sys.stdout ) :
         for name,dag in self._dags.items() :
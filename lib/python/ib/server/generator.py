@@ -19,6 +19,7 @@ import os
 import re
 import shutil
 
+from ib.util.copier            import *
 from ib.server.exceptions      import *
 from ib.server.template        import *
 from ib.server.template_engine import *
@@ -29,9 +30,11 @@ class IbServerBaseGenerator( IbServerSiteOptions ) :
     def __init__( self, defs, src, dest ) :
         IbServerSiteOptions.__init__( self, defs )
         self._engine = IbServerTemplateEngine( defs, src, dest )
+        self._copier = None
 
     SourceRoot     = property( lambda self : self._engine.SourceRoot )
     DestRoot       = property( lambda self : self._engine.DestRoot )
+    Deps           = property( lambda self : self._engine.Deps )
 
     @classmethod
     def SiteNames( cls ) :
@@ -49,6 +52,15 @@ class IbServerBaseGenerator( IbServerSiteOptions ) :
     def RenderTemplate( self, template ) :
         template.Render( self )
 
+    def ResetCaches( self ) :
+        self._engine.ResetCaches( )
+
+    def FormatCacheStats( self ) :
+        return self._engine.FormatCacheStats( )
+
+    def EnableDepTracking( self ) :
+        self._engine.EnableDepTracking( )
+
     def _getSources( self, sources, inpath ) :
         if sources is None :
             return [inpath]
@@ -111,25 +123,37 @@ class IbServerBaseGenerator( IbServerSiteOptions ) :
                 'Failed to create directory "{:s}": {:s}'.format(path, str(e))
             )
 
+    def _GetCopier( self ) :
+        if self._copier is None :
+            mode = self._defs.Lookup( 'CopyMode' )
+            self._copier = IbFileCopier( 'reflink' if mode is None else mode )
+        return self._copier
+    Copier = property( _GetCopier )
+
     def CopyFile( self, source, dest ) :
         if not self.Execute :
             return
         try :
-            shutil.copy( source, dest )
-        except OSError as e :
+            if self.Copier.CopyFile( source, dest )  and  self.Verbose > 1 :
+                print 'Copied "{:s}" to "{:s}"'.format( source, dest )
+        except (OSError, IOError, IbCopierError) as e :
             raise IbServerNodeError(
                 'Failed to copy "{:s}" to "{:s}: {:s}'.format(source, dest, str(e))
             )
 
     def CopyDir( self, source, dest ) :
-        if not self.Execute  or  os.path.isdir( dest ):
+        if not self.Execute :
             return
+        copier = self.Copier
+        copier.ResetStats( )
         try :
-            shutil.copytree( source, dest )
-        except OSError as e :
+            copier.SyncDir( source, dest )
+        except (OSError, IOError, IbCopierError) as e :
             raise IbServerNodeError(
                 'Failed to copy "{:s}" to "{:s}: {:s}'.format(source, dest, str(e))
             )
+        if self.Verbose :
+            print 'Synchronized "{:s}" from "{:s}": {:s}'.format( dest, source, copier.FormatStats() )
 
     def _DefaultFileNodeFn( self, dag, dirname, fname, *args, **kwargs ) :
         if fname.endswith( '.in' ) :
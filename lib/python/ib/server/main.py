@@ -15,18 +15,23 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ****************************************************************************
+import time
+_import_start = time.time()
+
 import re
 import os
 import sys
 import math
 import copy
 import glob
+import json
 import subprocess
 import argparse
 import shutil
+import signal
 import collections
+import multiprocessing
 from functools import partial
-import imp
 import resource
 import platform
 
@@ -36,22 +41,33 @@ from ib.util.version        import *
 from ib.util.version_reader import *
 from ib.util.parser         import *
 from ib.util.dag            import *
+from ib.util.stopwatch      import *
+from ib.util.module_loader  import *
+from ib.util.proc_sampler   import *
+from ib.util.core_triage    import *
+from ib.util.compress       import *
+from ib.util.output_tee     import *
+from ib.util.trash          import *
 
 import ib.server.tool.base
 import ib.server.tool.gdb
 import ib.server.tool.strace
 import ib.server.tool.valgrind
+import ib.server.tool.perf
+import ib.server.bench
 
 from ib.server.exceptions import *
 from ib.server.generator  import *
 from ib.server.node       import *
 from ib.server.dags       import *
 from ib.server.template   import *
+from ib.server.bench      import *
 
 from ib.server.tool.base     import *
 from ib.server.tool.gdb      import *
 from ib.server.tool.strace   import *
 from ib.server.tool.valgrind import *
+from ib.server.tool.perf     import *
 
 class _ServerParser( IbBaseParser ) :
     def __init__( self, main ) :
@@ -96,6 +112,10 @@ class _ServerParser( IbBaseParser ) :
         group.add_argument( "--tool-arg",
                             action="append", dest="tool_args",
                             help="Specify single tool-specific argument")
+        group.add_argument( "--valgrind-xml", "--xml",
+                            action="store_true", dest="valgrind_xml", default=False,
+                            help="Write valgrind XML output, and summarize it after exit "+
+                            "(valgrind, helgrind and drd tools)")
 
         group = self.Parser.add_argument_group( )
         class IbAction(argparse.Action):
@@ -142,10 +162,28 @@ class _ServerParser( IbBaseParser ) :
         group.add_argument( "--no-wipe",
                             action="store_true", dest="wipe",
                             help="Force wipe of etc directories (default=auto)")
+        group.add_argument( "--fine-grained", "--fine",
+                            action="store_true", dest="fine_grained", default=False,
+                            help="Regenerate only the files which use changed definitions "+
+                            "instead of wiping (default=off)")
 
         self.Parser.add_argument( "--clear-logs", "-c",
                                    action="store_true", dest="clear_logs", default=False,
                                    help="Clear log files before starting {}".format(main.ServerName) )
+        self.Parser.add_argument( "--async-cleanup",
+                                  action="store_true", dest="async_cleanup", default=False,
+                                  help="Move wiped / cleared directories to ${TrashDir}, "+
+                                  "delete them in the background" )
+        self.Parser.add_argument( "--trash-keep-size",
+                                  action=self.MakeSizeAction("trash_keep_size"), default=0,
+                                  help="Keep the newest trash up to the specified size (default=0)" )
+        self.Parser.add_argument( "--trash-keep-age",
+                                  action=self.MakeTimeAction("trash_keep_age"), default=0.0,
+                                  help="Keep trash newer than the specified age (default=0)" )
+        self.Parser.add_argument( "--copy-mode",
+                                  action="store", dest="copy_mode", default=None,
+                                  choices=IbFileCopier.Modes,
+                                  help="Specify how to copy files (default=reflink)" )
 
         group = self.Parser.add_argument_group( )
         group.add_argument( "--out", "-o",
@@ -155,6 +193,23 @@ class _ServerParser( IbBaseParser ) :
                             action="store_const", dest="output",
                             const="${DefaultOut}",
                             help="Use default stdout file" )
+        group.add_argument( "--tee",
+                            action="store_true", dest="tee", default=False,
+                            help="Tee output to the console and output files" )
+        group.add_argument( "--compress-out",
+                            action="store", dest="compress_out", default="none",
+                            choices=IbCompress.Methods,
+                            help="Specify compression of output files (default=none)" )
+        group.add_argument( "--out-level",
+                            action="store", dest="out_level", default=None,
+                            type=str.upper, choices=IbLogLevels,
+                            help="Drop output log lines above the specified level" )
+        group.add_argument( "--out-include",
+                            action="append", dest="out_include", default=[],
+                            help="Keep output lines matching regex, regardless of level" )
+        group.add_argument( "--out-exclude",
+                            action="append", dest="out_exclude", default=[],
+                            help="Drop output lines matching regex" )
 
         group = self.Parser.add_argument_group( )
         group.add_argument( "--log", "-l",
@@ -163,6 +218,19 @@ class _ServerParser( IbBaseParser ) :
         group.add_argument( "--tmp",
                             action="store_true", dest="tmp", default=False,
                             help='Change to $QLYS_TMP directory before starting')
+        group.add_argument( "--sample-interval",
+                            dest="sample_interval", type=float, default=1.0,
+                            help='Specify /proc resource sampling interval in seconds, '+
+                            '0 to disable (default=1)')
+        group.add_argument( "--no-core-triage",
+                            action="store_false", dest="core_triage", default=True,
+                            help='Disable batch gdb backtrace collection of core dumps')
+        group.add_argument( "--core-timeout",
+                            dest="core_timeout", type=float, default=60.0,
+                            help='Specify per-core gdb timeout in seconds (default=60)')
+        group.add_argument( "--core-jobs",
+                            dest="core_jobs", type=int, default=multiprocessing.cpu_count(),
+                            help='Specify number of concurrent gdb processes (default=#cpus)')
 
         group = self.Parser.add_argument_group( )
         group.add_argument( "--disable-pre", "--no-pre",
@@ -265,6 +333,36 @@ class _ServerParser( IbBaseParser ) :
         group.add_argument( "--dag-debug-file",
                             dest="dag_debug_file", type=argparse.FileType('w'), default=sys.stdout,
                             help="Specify DAG debug file" )
+        group = self.Parser.add_argument_group( )
+        group.add_argument( "--instances",
+                            dest="instances", type=int, default=1,
+                            help="Launch the specified number of server instances in parallel "
+                            "(requires an integer *Port def)" )
+        group.add_argument( "--instance",
+                            dest="instance", type=int, default=None,
+                            help="Run as instance N, with its own var / etc dirs and ports" )
+        group.add_argument( "--instance-port-step",
+                            dest="instance_port_step", type=int, default=10,
+                            help="Specify port offset between instances (default=10)" )
+        group = self.Parser.add_argument_group( )
+        group.add_argument( "--bench",
+                            dest="bench", type=int, default=0,
+                            help="Benchmark startup to ready latency over N cold and N warm starts" )
+        group.add_argument( "--bench-out",
+                            dest="bench_out", default=None,
+                            help=argparse.SUPPRESS )
+        group.add_argument( "--ready-port",
+                            dest="ready_port", type=int, default=None,
+                            help="Specify port to poll for readiness (default=${ReadyPort})" )
+        group.add_argument( "--ready-host",
+                            dest="ready_host", default="localhost",
+                            help="Specify host to poll for readiness (default=localhost)" )
+        group.add_argument( "--ready-timeout",
+                            dest="ready_timeout", type=float, default=60.0,
+                            help="Specify readiness timeout in seconds (default=60)" )
+        group.add_argument( "--startup-time",
+                            action="store_true", dest="startup_time", default=False,
+                            help="Report time from import to first DAG evaluation" )
 
 
 class _ServerDags( IbServerDags ) :
@@ -310,6 +408,8 @@ class _ServerDags( IbServerDags ) :
         self._main.ImportDag( dag, 'ServerGenerator' )
         IbDagNode( dag, 'write-last',
                    recipe=self._main.WriteLastFile )
+        IbDagNode( dag, 'write-deps',
+                   recipe=self._main.WriteDepsFile )
 
 
 _Generator = collections.namedtuple( 'Generator', ( 'Name', 'Module', 'Generator' ) )
@@ -396,6 +496,13 @@ class IbServerMain( object ) :
             "IbRuleLogLevel"   : "debug",
             "IbRuleDebugLevel" : "debug",
             "LastFile"         : '.ib-${ServerNameLower}.last',
+            "DepsFile"         : '.ib-${ServerNameLower}.deps',
+            "CopyMode"         : "reflink",
+            "GeneratorCache"   : "${Tmp}/ib-generator-cache",
+            "TrashDir"         : "${Var}/.ib-trash",
+            "SampleFile"       : "${BaseLogDir}/${ServerNameLower}-samples.${Run}.tsv",
+            "CoreSummary"      : "${ServerNameLower}.cores.${Run}.txt",
+            "ValgrindSuppressions" : "${Devel}/valgrind.suppressions",
             "LuaDir"           : os.path.join("${IbLibDir}", "lua"),
             "LuaPath"          : ";".join([s+"/?.lua" for s in
                                            ("${IbLibDir}", "${LuaDir}", "${Etc}/ironbee")]),
@@ -434,6 +541,15 @@ class IbServerMain( object ) :
         self._defs.Set( "ServerNameUpper", name.upper() )
         self._wipe = False
         self._generators = { }
+        self._loader = None
+        self._sampler = None
+        self._trash = None
+        self._trash_purged = False
+        self._ready = False
+        self._bench_stopped = False
+        self._deps = None
+        self._stopwatch = IbStopwatch( _import_start )
+        self._stopwatch.Lap( 'import' )
 
     IronBeeVersion  = property(lambda self : self._ib_version)
     ServerNameFull  = property(lambda self : self._defs.Lookup("ServerNameFull"))
@@ -507,25 +623,45 @@ class IbServerMain( object ) :
         if not self._args.quiet :
             print 'Wiping {:s} configuration in "{:s}"'.format(pretty, path)
         if self._args.execute  and  os.path.isdir( path ) :
-            shutil.rmtree( path )
+            self._RemoveDir( path )
         if self._args.execute :
             print 'Creating {:s} configuration in "{:s}"'.format(pretty, path)
             os.makedirs( path )
         return 0, None
 
+    def _RemoveDir( self, path ) :
+        if not self._args.async_cleanup :
+            shutil.rmtree( path )
+            return
+        if self._trash is None :
+            self._trash = IbTrash( self._defs.Lookup('TrashDir'),
+                                   self._args.trash_keep_size, self._args.trash_keep_age )
+        moved = self._trash.Move( path )
+        if self._args.verbose  and  moved is not None :
+            print 'Moved "{:s}" to "{:s}"'.format( path, moved )
+
+    def _StartPurge( self ) :
+        """ Start the background trash purge, once """
+        if self._trash is None  or  self._trash_purged :
+            return
+        self._trash_purged = True
+        pid = self._trash.StartPurge( )
+        if self._args.verbose  and  pid is not None :
+            print 'Purging "{:s}" in the background'.format( self._trash.Dir )
+
     def ClearLogs( self, node ) :
         if not self._args.clear_logs :
             return 0, None
         dirs = set()
         for name in ( 'LogDir', 'IbLogDir', 'ServerLogDir' ) :
             logdir = self._defs.Lookup( name )
-            if logdir is None  or  name in dirs :
+            if logdir is None  or  logdir in dirs :
                 continue
-            dirs.add( name )
+            dirs.add( logdir )
             if not self._args.quiet :
                 print 'Clearing logs in "{:s}"'.format( logdir )
             if self._args.execute  and  os.path.isdir( logdir ) :
-                shutil.rmtree( logdir )
+                self._RemoveDir( logdir )
         return 0, None
 
     def CreateVarDirs( self, node ) :
@@ -535,6 +671,12 @@ class IbServerMain( object ) :
                 os.makedirs( logdir )
         return 0, None
 
+    def _GetLoader( self ) :
+        if self._loader is None :
+            cache_dir = self._defs.Lookup( 'GeneratorCache' )
+            self._loader = IbModuleLoader( cache_dir or None, self._args.verbose )
+        return self._loader
+
     def _Generator( self, name ) :
         if name in self._generators :
             return self._generators[name]
@@ -548,10 +690,8 @@ class IbServerMain( object ) :
             if path == '' :
                 pypath = None
             else :
-                pypath = [path]+os.environ['PYTHONPATH'].split(':')
-            print pypath
-            fp, modpath, descr = imp.find_module( filename, pypath )
-            mod = imp.load_module( filename, fp, modpath, descr )
+                pypath = [path]+os.environ.get('PYTHONPATH', '').split(':')
+            mod = self._GetLoader().Load( filename, pypath )
             try :
                 obj = mod.Instantiate(self._defs)
                 assert isinstance( obj, IbServerBaseGenerator )
@@ -608,6 +748,9 @@ class IbServerMain( object ) :
         names = [ key for key in self._defs.Keys(lambda k,v : regex.search(k)) ]
         return names
 
+    # Changes to these can't be handled by regenerating individual files
+    _structural_regex = re.compile( r'(EtcIn|Generator|Version|Install|LibDir|^IbEnable$)' )
+
     def _PostParse( self ) :
         # Setup DAGs, hostname, etc
         self._dags = _ServerDags( self )
@@ -631,6 +774,8 @@ class IbServerMain( object ) :
         self._defs['Execute'] = self._args.execute
         self._defs['Verbose'] = self._args.verbose
         self._defs['Quiet']   = self._args.quiet
+        if self._args.copy_mode is not None :
+            self._defs['CopyMode'] = self._args.copy_mode
 
         # Import IronBee log-level settings
         if self._args.log_level is not None :
@@ -661,13 +806,106 @@ class IbServerMain( object ) :
         # by the mode setting
         for name,value in self._args.defs.items() :
             self._defs.Set( name, value )
+        if self._args.instance is not None :
+            self._SetupInstance( self._args.instance )
 
         self._tool = self._tools[self._args.tool]
         self._tool.SetVerbose( self._args.verbose )
+        if self._args.valgrind_xml :
+            if not getattr( self._tool, 'XmlSupported', False ) :
+                self.Parser.Error( '--valgrind-xml is not supported by tool "{}"'.format(self._args.tool) )
+            self._tool.SetXml( True )
         self._defs.SetDict( self._tool.Defs, over=False )
         self._FindExecutable( )
         self._dags.SetupDags( )
 
+    def _SetupInstance( self, instance ) :
+        """ Derive per-instance var / etc dirs, last files and ports """
+        self._defs['Instance'] = instance
+        for name in ( 'Var', 'Etc' ) :
+            self._defs[name] = os.path.join( self._defs.Get(name), 'instance-{}'.format(instance) )
+        for name in ( 'LastFile', 'DepsFile' ) :
+            self._defs[name] = '{}.{}'.format( self._defs.Get(name), instance )
+        for name, value in list(self._defs.KeyValues(filter=lambda k, v : k.endswith('Port'))) :
+            try :
+                port = int( value )
+            except (TypeError, ValueError) :
+                continue
+            if isinstance( value, bool ) :
+                continue
+            self._defs[name] = str( port + instance * self._args.instance_port_step )
+        if self._args.ready_port is not None :
+            self._args.ready_port += instance * self._args.instance_port_step
+        if self._args.verbose :
+            print 'Instance {}: Var="{}" Etc="{}"'.format(
+                instance, self._defs.Lookup('Var'), self._defs.Lookup('Etc') )
+
+    def _RunInstances( self ) :
+        """
+        Run each instance as a child invocation of this program, wait for
+        them all, and report their exit status and resource usage.
+        """
+        # No generator defines a port; the ports which the instances'
+        # configurations listen on have to come from *Port defs
+        ports = [ ]
+        for name, value in self._args.defs.items( ) :
+            try :
+                if name.endswith( 'Port' )  and  not isinstance( value, bool ) :
+                    ports.append( int(value) )
+            except (TypeError, ValueError) :
+                pass
+        if len(ports) == 0 :
+            self.Parser.Error( '--instances requires an integer *Port def (e.g. -d ListenPort=8080) '
+                               'for the instances to listen on different ports' )
+
+        # Keep the Popen objects: if they're dropped, the next Popen() may
+        # reap an instance before wait4() gets to report it
+        children = { }
+        start = time.time( )
+        for instance in range( self._args.instances ) :
+            cmd = [ sys.executable ] + sys.argv + [ '--instance', str(instance) ]
+            if self._args.verbose :
+                print 'Starting instance', instance, cmd
+            p = subprocess.Popen( cmd )
+            children[p.pid] = ( instance, p )
+        results = { }
+        while len(results) < len(children) :
+            try :
+                pid, status, usage = os.wait4( -1, 0 )
+            except KeyboardInterrupt :
+                # Instances get the same SIGINT; keep waiting for them
+                continue
+            except OSError :
+                break
+            if pid in children :
+                instance, p = children[pid]
+                code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+                p.returncode = code
+                results[instance] = ( pid, code, usage, time.time() - start )
+        elapsed = time.time( ) - start
+        lost = sorted( instance for instance, p in children.values() if instance not in results )
+
+        print '{} instances finished in {:.2f}s'.format( len(results), elapsed )
+        print '  {:>8s} {:>8s} {:>6s} {:>9s} {:>9s} {:>10s} {:>9s}'.format(
+            'Instance', 'PID', 'Status', 'User', 'System', 'MaxRSS', 'Elapsed' )
+        totals = [ 0.0, 0.0, 0 ]
+        for instance in sorted( results ) :
+            pid, code, usage, finished = results[instance]
+            print '  {:8d} {:8d} {:6d} {:8.2f}s {:8.2f}s {:8d}KB {:8.2f}s'.format(
+                instance, pid, code, usage.ru_utime, usage.ru_stime, usage.ru_maxrss, finished )
+            totals[0] += usage.ru_utime
+            totals[1] += usage.ru_stime
+            totals[2] += usage.ru_maxrss
+        print '  {:>8s} {:8s} {:6s} {:8.2f}s {:8.2f}s {:8d}KB'.format(
+            'Total', '', '', totals[0], totals[1], totals[2] )
+        for instance in lost :
+            print 'Instance {} exited unreported'.format( instance )
+        failed = [ instance for instance, r in results.items() if r[1] != 0 ] + lost
+        if len(failed) :
+            print '{} of {} instances failed'.format( len(failed), len(children) )
+            return 1
+        return 0
+
     def _ReadLastFile( self ) :
         fpath = self._defs.Lookup( 'LastFile' )
         try :
@@ -693,6 +931,139 @@ class IbServerMain( object ) :
             print >>sys.stderr, "Failed to write to last file", fpath, ":", e
             return 1, 'WriteLastFile() Failed'
 
+    def _ReadDepsFile( self ) :
+        fpath = self._defs.Lookup( 'DepsFile' )
+        try :
+            with open( fpath ) as fp :
+                deps = json.load( fp )
+        except (IOError, ValueError) :
+            return None
+        # Files written before options were recorded can't be trusted
+        if not isinstance( deps, dict )  or  'files' not in deps  or  'options' not in deps :
+            return None
+        return deps
+
+    def _OptionState( self ) :
+        """
+        The generator options and sites which make up the Opts and Sites
+        template variables, in the form they're stored in the deps file
+        """
+        state = { 'Sites' : self._defs.Get( 'Sites', { } ) }
+        for name, generator in self._generators.items() :
+            if generator is not None :
+                state[name] = { 'site' : generator.Generator.SiteOptions,
+                                'local' : generator.Generator.LocalOptions }
+        return json.loads( json.dumps(state, sort_keys=True) )
+
+    def WriteDepsFile( self, node ) :
+        fpath = self._defs.Lookup( 'DepsFile' )
+        if fpath is None  or  not self._args.fine_grained  or  not self._args.write_last :
+            return 0, None
+        files = { } if self._deps is None or self._wipe else dict(self._deps['files'])
+        for generator in self._generators.values() :
+            if generator is not None  and  generator.Generator.Deps is not None :
+                files.update( generator.Generator.Deps )
+        deps = { 'options' : self._OptionState(), 'files' : files }
+        if self._args.verbose :
+            print "Writing dependency file", fpath
+        try :
+            with open( fpath, 'w' ) as fp :
+                json.dump( deps, fp, indent=1, sort_keys=True )
+            return 0, None
+        except IOError as e :
+            print >>sys.stderr, "Failed to write to dependency file", fpath, ":", e
+            return 1, 'WriteDepsFile() Failed'
+
+    def _CheckWipeNames( self ) :
+        for name in self._WipeNames( ) :
+            if self._defs.Lookup(name) != self._last_defs.Get(name) :
+                if not self._args.quiet :
+                    print 'Triggering wipe: name={:s} "{:s}" != "{:s}"'.format(
+                        name, str(self._defs.Lookup(name)), str(self._last_defs.Get(name))
+                    )
+                return True
+        return False
+
+    def _ChangedDefs( self, names ) :
+        return set( [ name for name in names
+                      if str(self._defs.Lookup(name)) != str(self._last_defs.Get(name)) ] )
+
+    def _InvalidReason( self, node, changed ) :
+        record = self._deps['files'].get( node.Path )
+        if record is None :
+            return 'no dependency record'
+        used = set( record['defs'] )
+        if '*' in used :
+            return 'dynamic template reference'
+        hits = used.intersection( changed )
+        if 'Opts' in used  and  any( ['.' in name for name in changed] ) :
+            hits.add( 'Opts' )
+        if len(hits) :
+            return 'changed ' + ','.join( sorted(hits) )
+        try :
+            mtime = os.path.getmtime( node.Path )
+            for path in record['includes'] :
+                if os.path.getmtime( path ) > mtime :
+                    return 'template "{:s}" changed'.format( path )
+        except OSError :
+            return 'missing file'
+        return None
+
+    def _CheckFineGrained( self ) :
+        """
+        Compare the definitions used by each generated file with the last
+        run, and invalidate only the nodes of the files which use changed
+        definitions.  Returns True if a full wipe is still required.
+        """
+        self._deps = self._ReadDepsFile( )
+        if self._deps is None :
+            if not self._args.quiet :
+                print 'No dependency file, using wipe names'
+            return self._CheckWipeNames( )
+
+        names = set( self._WipeNames() )
+        for record in self._deps['files'].values() :
+            names.update( record['defs'] )
+        dotted = lambda k,v : '.' in k
+        names.update( self._defs.Keys(dotted) )
+        names.update( self._last_defs.Keys(dotted) )
+        changed = self._ChangedDefs( names )
+
+        # Opts and Sites are also built from the generators' site / local
+        # options, which aren't definitions
+        options = self._OptionState( )
+        last = self._deps['options']
+        if options.get('Sites') != last.get('Sites') :
+            changed.add( 'Sites' )
+        if any( [options.get(name) != last.get(name) for name in set(options).union(last)
+                 if name != 'Sites'] ) :
+            changed.add( 'Opts' )
+        for name in sorted(changed) :
+            if self._structural_regex.search( name ) :
+                if not self._args.quiet :
+                    print 'Triggering wipe: name={:s} "{:s}" != "{:s}"'.format(
+                        name, str(self._defs.Lookup(name)), str(self._last_defs.Get(name))
+                    )
+                return True
+
+        IbDagNode.SetUseModTimes( True )
+        total = 0
+        forced = 0
+        for node in self._dags.AllNodes( ) :
+            if not isinstance( node, IbServerDagNodeTemplate ) :
+                continue
+            total += 1
+            reason = self._InvalidReason( node, changed )
+            if reason is not None :
+                node.Invalidate( )
+                forced += 1
+                if self._args.verbose :
+                    print 'Regenerating "{:s}": {:s}'.format( node.Path, reason )
+        if not self._args.quiet :
+            print 'Regenerating {:d} of {:d} templates; changed definitions: {:s}'.format(
+                forced, total, ', '.join(sorted(changed)) if len(changed) else 'none' )
+        return False
+
     def _DumpTable( self ) :
         if self._args.dump_mode is None :
             return
@@ -706,21 +1077,125 @@ class IbServerMain( object ) :
             self._last_defs = IbExpander( )
         if self._args.require_core  and  'CoreFile' not in self._defs :
             self.Parser.Error( "No core file specified" )
-        if self._args.wipe is None :
-            for name in self._WipeNames( ) :
-                if self._defs.Lookup(name) != self._last_defs.Get(name) :
-                    if not self._args.quiet :
-                        print 'Triggering wipe: name={:s} "{:s}" != "{:s}"'.format(
-                            name, str(self._defs.Lookup(name)), str(self._last_defs.Get(name))
-                        )
-                    self._wipe = True
-                    break
-            else :
-                self._wipe = False
-        else :
+        if self._args.fine_grained :
+            for generator in self._generators.values() :
+                if generator is not None :
+                    generator.Generator.EnableDepTracking( )
+        if self._args.wipe is not None :
             self._wipe = self._args.wipe
+        elif self._args.fine_grained :
+            self._wipe = self._CheckFineGrained( )
+        else :
+            self._wipe = self._CheckWipeNames( )
+
+    def _StartSampler( self, pid ) :
+        if self._args.sample_interval <= 0 :
+            return
+        outpath = self._defs.Lookup( 'SampleFile' )
+        if outpath is not None :
+            logdir = os.path.dirname( outpath )
+            if logdir != ''  and  not os.path.isdir( logdir ) :
+                os.makedirs( logdir )
+        self._sampler = IbProcSampler( pid, self._args.sample_interval, outpath )
+        self._sampler.start( )
+
+    def _StopSampler( self ) :
+        sampler = self._sampler
+        if sampler is None :
+            return
+        sampler.Stop( )
+        self._sampler = None
+        if self._args.quiet :
+            return
+        for line in sampler.FormatSummary( ) :
+            print line
+        if sampler.OutPath is not None :
+            print "Resource samples are in", sampler.OutPath
+
+    def _StartReadyPoller( self, p ) :
+        port = self._args.ready_port
+        if port is None  and  self._defs.Lookup( 'ReadyPort' ) is not None :
+            port = int( self._defs.Lookup('ReadyPort') )
+        if port is None :
+            if self._args.bench_out is not None :
+                print 'No ready port: use --ready-port or set ReadyPort'
+                p.terminate( )
+            return
+        poller = IbServerReadyPoller( self._args.ready_host, port, p, self._args.ready_timeout,
+                                      partial(self._Ready, p, port) )
+        poller.start( )
+
+    def _Ready( self, p, port, ready ) :
+        self._ready = ready
+        if ready :
+            elapsed = self._stopwatch.Lap( 'ready' )
+            if not self._args.quiet :
+                print 'Port {} ready {:.3f}s after startup'.format( port, elapsed )
+        else :
+            print 'Port {} not ready'.format( port )
+        if self._args.bench_out is not None :
+            self._bench_stopped = True
+            p.terminate( )
+
+    def _WriteBenchResults( self ) :
+        with open( self._args.bench_out, 'w' ) as fp :
+            json.dump( { 'start' : self._stopwatch.Start,
+                         'laps'  : self._stopwatch.Laps,
+                         'ready' : self._ready }, fp )
+
+    def _OpenOutput( self, output, path ) :
+        """ Open an output file (or use an opened one), compressed as requested """
+        method = self._args.compress_out
+        if output is not None  and  not isinstance( output, str ) :
+            return IbCompress.Wrap( output, method )
+        if output is not None :
+            path = output
+        path = self._defs.ExpandStr( path ) + IbCompress.Suffix( method )
+        # Line buffered, so uncompressed output files can be followed live
+        return IbCompress.Open( path, method, bufsize=1 )
+
+    def _FindCores( self, tool_out, start ) :
+        """ Find the tool's core files, plus any core files dumped since start """
+        cores = [ ]
+        if tool_out is not None :
+            cores += glob.glob( tool_out+'.core*' )
+        for pattern in ( 'core', 'core.*', 'vgcore.*' ) :
+            for path in glob.glob( pattern ) :
+                try :
+                    if path not in cores  and  os.path.getmtime( path ) >= start :
+                        cores.append( path )
+                except OSError :
+                    pass
+        return [ core for core in cores if not core.endswith('.bt') ]
+
+    def _TriageCores( self, cores ) :
+        if not self._args.core_triage  or  len(cores) == 0 :
+            return
+        if self._args.tool in IbServerToolGdbTools :
+            return
+        executable = self._defs.Lookup( "Executable" )
+        if executable is None :
+            return
+        if not self._args.quiet :
+            print "Collecting backtraces from", len(cores), "core(s)"
+        triage = IbCoreTriage( executable, self._args.core_jobs, self._args.core_timeout )
+        triage.Run( cores )
+        summary = triage.FormatSummary( )
+        outpath = self._defs.Lookup( "CoreSummary" )
+        if outpath is not None :
+            with open( outpath, 'w' ) as fp :
+                for line in summary :
+                    print >>fp, line
+            self._defs['CoreSummary'] = outpath
+        if not self._args.quiet :
+            for line in summary[:1] :
+                print line
+            if outpath is not None :
+                print "Core dump summary is in", outpath
 
     def RunMain( self, node ) :
+        self._StartPurge( )
+        self._tool.PreRun( self._defs )
         tmp = [ ]
         tmp += self._tool.Prefix( )
         tmp += self._tool.ToolArgs(self._args.tool_args)
@@ -761,67 +1236,137 @@ class IbServerMain( object ) :
             answer = raw_input( 'Start "{}" (Y/n)? ' )
             if answer.lower in ('no','n') :
                 return 0
+        start = time.time( )
         try :
             resource.setrlimit(resource.RLIMIT_CORE,
                                (resource.RLIM_INFINITY,resource.RLIM_INFINITY))
-            if self._args.output is None  and  outfile is None :
-                status = subprocess.call( cmd )
+            if self._args.output is None  and  outfile is None  and  not self._args.tee :
+                self._stopwatch.Lap( 'main-setup' )
+                p = subprocess.Popen( cmd )
+                self._StartSampler( p.pid )
+                self._StartReadyPoller( p )
+                status = p.wait()
                 if self._args.logfile is not None :
-                    print >>self._args.logfile, '  PID {} "{}" status {}'.format('?', cmd, status)
+                    print >>self._args.logfile, '  PID {} "{}" status {}'.format(p.pid, cmd, status)
             else :
-                outfile = self._defs.ExpandStr( '.ib-${ServerNameLower}.${PID}.out' )
-                errfile = self._defs.ExpandStr( '.ib-${ServerNameLower}.${PID}.err' )
-                if self._args.output is not None :
-                    out = self._args.output
-                else :
-                    out = open( outfile, "w+", 0 )
-                err = open( errfile, 'w', 0 )
-                p = subprocess.Popen( cmd, stdout=out, stderr=err )
+                if outfile is None :
+                    outfile = '.ib-${ServerNameLower}.${PID}.out'
+                out = self._OpenOutput( self._args.output, outfile )
+                err = self._OpenOutput( None, '.ib-${ServerNameLower}.${PID}.err' )
+                self._stopwatch.Lap( 'main-setup' )
+                p = subprocess.Popen( cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE )
                 pid = p.pid
+                self._StartSampler( pid )
+                self._StartReadyPoller( p )
                 if self._args.verbose :
                     print "Process is", p.pid
-                for line in out :
-                    if out != sys.stdout  and  self._args.verbose >= 2 :
-                        print line.strip()
-                status = p.wait()
+                console = self._args.tee  or  self._args.verbose >= 2
+                tee = IbOutputTee( IbLogLineFilter(self._args.out_level,
+                                                   self._args.out_include,
+                                                   self._args.out_exclude) )
+                if out is sys.stdout :
+                    # Write stdout once, through the console lock
+                    tee.AddStream( 'stdout', p.stdout, None, sys.stdout )
+                else :
+                    tee.AddStream( 'stdout', p.stdout, out, sys.stdout if console else None )
+                tee.AddStream( 'stderr', p.stderr, err, sys.stderr if console else None )
+                tee.Start( )
+                try :
+                    status = p.wait()
+                finally :
+                    tee.Join( )
+                    for fp in out, err :
+                        if fp is not sys.stdout :
+                            fp.close( )
+                if self._args.verbose :
+                    for line in tee.FormatStats( ) :
+                        print line
                 if self._args.logfile is not None :
                     print >>self._args.logfile, '  PID {} "{}" status {}'.format(pid, cmd, status)
         except KeyboardInterrupt:
             status = 0
+        finally :
+            self._StopSampler( )
+        self._stopwatch.Lap( 'run' )
+        if self._bench_stopped  and  status == -signal.SIGTERM :
+            status = 0
         if status :
             print "Exit status is", status
         tool_out = None if self._tool.ToolOut is None else self._defs.ExpandStr(self._tool.ToolOut)
         if tool_out is not None :
             self._defs['ToolOutput'] = tool_out
             print self._tool.ToolName, "output is in", tool_out
-            cores = glob.glob(tool_out+'.core*')
-            if len(cores) :
-                print "Core dumps found:", cores
+        cores = self._FindCores( tool_out, int(start) )
+        if len(cores) :
+            print "Core dumps found:", cores
             self._defs['CoreFiles'] = cores
+        self._TriageCores( cores )
+        self._tool.PostRun( self._defs, tool_out, status )
 
         return status, 'Exit status is {}'.format(status)
 
     Defs = property( lambda self : self._defs )
 
+    def _ResetGeneratorCaches( self ) :
+        for generator in self._generators.values() :
+            if generator is not None :
+                generator.Generator.ResetCaches( )
+
+    def _PrintGeneratorCacheStats( self ) :
+        for name,generator in sorted(self._generators.items()) :
+            if generator is not None :
+                print 'Template path cache for {:s}: {:s}'.format(
+                    name, generator.Generator.FormatCacheStats() )
+        if self._loader is not None :
+            print 'Generator code cache: {:s}'.format( self._loader.FormatStats() )
+
     def GetTool( self, name ) :
         return self._tools[name]
 
+    def _PrintStartupTime( self ) :
+        print 'Startup time:'
+        for line in self._stopwatch.Format( ) :
+            print line
+        print '  jinja2 loaded: {}, libmagic loaded: {}'.format(
+            'jinja2' in sys.modules, 'magic' in sys.modules )
+
     def Main( self ) :
         self._parser = _ServerParser( self )
         self._Parse( )
+        if self._args.instances > 1  and  self._args.instance is None :
+            sys.exit( self._RunInstances() )
+        if self._args.bench > 0  and  self._args.bench_out is None :
+            bench = IbServerBench( sys.argv, self._args.bench, self._args.verbose )
+            status = bench.Run( )
+            for line in bench.FormatReport( ) :
+                print line
+            sys.exit( status )
         self._PostParse( )
+        self._stopwatch.Lap( 'parse' )
         self._PreMain( )
+        self._stopwatch.Lap( 'pre-main' )
         self._DumpTable( )
         if self._args.tmp :
             os.chdir( self._defs.Lookup("Tmp") )
         if self._args.logfile is not None :
             print >>self._args.logfile, '-- Starting {} @ {} --'.format(os.getpid(), time.asctime())
             print >>self._args.logfile, '  {}'.format(sys.argv)
+        self._ResetGeneratorCaches( )
         self._dags.Evaluate( )
+        self._stopwatch.Lap( 'evaluate' )
+        if self._args.startup_time :
+            self._PrintStartupTime( )
         if self._args.dag_debug :
             print >>self._args.dag_debug_file, '---- DAG debug Start -----'
             self._dags.Dump( debug=self._args.dag_debug-1, debug_fp=self._args.dag_debug_file )
+        if self._args.bench_out is not None :
+            self._dags.SetStopwatch( self._stopwatch )
         self._dags.Execute( debug=self._args.dag_debug, debug_fp=self._args.dag_debug_file )
+        self._StartPurge( )
+        if self._args.bench_out is not None :
+            self._WriteBenchResults( )
+        if self._args.verbose > 1 :
+            self._PrintGeneratorCacheStats( )
         if self._args.dag_debug :
             #s = raw_input( 'OK / Failed? ' )
             s = ''
@@ -53,9 +53,13 @@ class IbServerDagNodeDirectory( IbServerDagNodeBase ) :
         self._generator.CreateDir( self._dirpath )
         return 0, None
 
+    # Directories only order the nodes for the files in them; a directory's
+    # mtime changes whenever an entry is added, which mustn't make its files stale.
+    ModTime = property( lambda self : None if self._mtime is None else 0.0 )
+
 class IbServerDagNodeCopy( IbServerDagNodeBase ) :
     def __init__( self, dag, name, generator, source, dest, *args, **kwargs ) : 
-        IbServerDagNodeBase.__init__( self, dag, name, generator, path=source, *args, **kwargs )
+        IbServerDagNodeBase.__init__( self, dag, name, generator, path=dest, *args, **kwargs )
         assert type(source) == str, 'Type of source is {}, should be str'.format( type(source) )
         assert type(dest) == str, 'Type of dest is {}, should be str'.format( type(dest) )
         assert source != dest, 'Source "{}" is the same as dest "{}"'.format( source, dest )
@@ -19,8 +19,6 @@ import sys
 import os
 import re
 import pprint
-import jinja2
-import jinja2.ext
 
 from ib.util.version           import *
 from ib.server.exceptions      import *
@@ -90,6 +88,7 @@ class IbServerTemplate( object ) :
         text = template.render( tvars )
         print >>fp, text
         fp.close( )
+        self._engine.RecordDeps( self._out, self._in )
 
 class IbModule_server_template( object ) :
     modulePath = __file__
@@ -18,104 +18,34 @@
 import sys
 import os
 import re
-import jinja2
-import jinja2.ext
 
 from ib.util.version import *
 from ib.server.exceptions import *
 
-class FileLineExtension( jinja2.ext.Extension ) :
-    r""" Adds a filename, basename and lineno tags to Jinja. """
-
-    tags = set(['filename', 'basename', 'lineno'])
-
-    def parse(self, parser):
-        token = next(parser.stream)
-        if token.value == 'filename' :
-            node = jinja2.nodes.Const(parser.filename)
-        elif token.value == 'basename' :
-            node = jinja2.nodes.Const(os.path.basename(parser.filename))
-        elif token.value == 'lineno' :
-            node = jinja2.nodes.Const(str(token.lineno))
-        else :
-            assert False, 'Unknown token "{:s}"'.format(token.value)
-        return node
-
-class RuleIdExtension( jinja2.ext.Extension ) :
-    r""" Adds a {% baseid %}, {% ruleid %}, and {% pruleid %} tags to Jinja. """
-
-    tags = set(['baseid', 'ruleid', 'pruleid'])
-
-    _ruleid = ''
-    _regex = re.compile( r'\..+' )
-    def parse(self, parser):
-        token = next(parser.stream)
-        if token.value == 'pruleid' :
-            return jinja2.nodes.Const(self._ruleid)
-        baseid = self._regex.sub('', os.path.basename(parser.filename))
-        if token.value == 'ruleid' :
-            ruleid = '{:s}/{:03d}'.format(baseid, token.lineno)
-            parser.environment.globals['RuleId'] = ruleid
-            self._ruleid = ruleid
-            node = jinja2.nodes.Const(ruleid)
-        elif token.value == 'baseid' :
-            parser.environment.globals['BaseId'] = baseid
-            node = jinja2.nodes.Const(baseid)
-        else :
-            assert False, 'Unknown token "{:s}"'.format(token.value)
-        return node
-
-class IbVersionExtension( jinja2.ext.Extension ) :
-    r""" Adds a {% ibvercmp(op,value) %} tag to Jinja. """
-
-    tags = set(['ibversion'])
-
-    def parse(self, parser):
-        token = next(parser.stream)
-        args = parser.parse_expression()
-        print 'Token is "{:s}"'.format(token)
-        print 'Args:', type(args), args
-        print 'args.expr:', type(args.expr), args.expr
-        print 'args.ops:', type(args.ops), args.ops
-        for n,op in enumerate(args.ops) :
-            print n, type(op), op
-        node = jinja2.nodes.Const(True)
-        return node
-
-class _RelativeEnvironment(jinja2.Environment):
-    """Override join_path() to enable relative template paths."""
-    def join_path(self, template, parent):
-        searchpath = self.loader.searchpath + [os.path.dirname(parent)]
-        for root in searchpath :
-            full = os.path.join(root, template)
-            if os.path.exists(full) :
-                prefix = os.path.commonprefix([full, root])
-                path = full.replace(prefix+'/', '')
-                return path
-        return
-
 class IbServerTemplateEngine( object ) :
     def __init__( self, defs, src_root, dst_root ) :
         assert src_root != dst_root, 'src_root="{}" == dst_root="{}"'.format(src_root, dst_root)
-        paths = [ src_root ]
         self._defs = defs
         self._src_root = src_root
         self._dst_root = dst_root
-        self._loader = jinja2.FileSystemLoader( searchpath=paths )
-        self._env = _RelativeEnvironment(loader=self._loader,
-                                         lstrip_blocks=True,
-                                         extensions=[FileLineExtension,
-                                                     RuleIdExtension])
-        self._env.filters['ibversion'] = self._IbVersionFilter
-        self._env.filters['Map'] = self._IbMapFilter
-        self._env.filters['Size'] = self._SizeFilter
-        self._env.tests['rule_enable'] = self._IsRuleEnable
-
-    def _IsRuleEnable( self, name ) :
+        self._env = None
+        self._deps = None
+        self._dep_memo = { }
+        self._lookups = set( )
+
+    def _GetEnv( self ) :
+        if self._env is None :
+            from ib.server.template_env import IbServerCreateTemplateEnv
+            self._env = IbServerCreateTemplateEnv( self )
+        return self._env
+
+    def IsRuleEnable( self, name ) :
+        # Dynamic lookups aren't visible to the template parser
+        if self._deps is not None :
+            self._lookups.add( name )
         return self._defs.Get( name, False )
 
-    @jinja2.environmentfilter
-    def _IbMapFilter(self, env, name, _map, value) :
+    def IbMapFilter(self, name, _map, value) :
         if value in _map :
             return _map[value]
         elif value in _map.values():
@@ -123,8 +53,7 @@ class IbServerTemplateEngine( object ) :
         else :
             assert False, 'Invalid {:s} identifier "{:s}"'.format(name, str(value))
 
-    @jinja2.contextfilter
-    def _IbVersionFilter(self, context, value) :
+    def IbVersionFilter(self, value) :
         if value == "" :
             return self._ib_version
         else :
@@ -133,12 +62,60 @@ class IbServerTemplateEngine( object ) :
     def SetIbVersion( self, ib_version ) :
         self._ib_version = ib_version
 
+    def ResetCaches( self ) :
+        if self._env is not None :
+            self._env.ResetPathCache( )
+        self._dep_memo = { }
+
+    def EnableDepTracking( self ) :
+        if self._deps is None :
+            self._deps = { }
+
+    def _FindTemplateDeps( self, name, seen ) :
+        """
+        Find the variables referenced by template name and the templates it
+        includes, imports or extends (recursively).  A '*' variable is
+        returned if the template references a template dynamically.
+        """
+        if name in self._dep_memo :
+            return self._dep_memo[name]
+        from ib.server.template_env import IbServerFindTemplateRefs
+        names, refs = IbServerFindTemplateRefs( self.Env, name )
+        includes = set( )
+        for ref in refs :
+            path = None if ref is None else self._env.join_path( ref, name )
+            if path is None :
+                names.add( '*' )
+                continue
+            if path in seen :
+                continue
+            seen.add( path )
+            includes.add( os.path.join(self._src_root, path) )
+            sub_names, sub_includes = self._FindTemplateDeps( path, seen )
+            names.update( sub_names )
+            includes.update( sub_includes )
+        self._dep_memo[name] = ( names, includes )
+        return names, includes
+
+    def RecordDeps( self, outpath, name ) :
+        if self._deps is None :
+            return
+        names, includes = self._FindTemplateDeps( name, set([name]) )
+        names = names.union( self._lookups )
+        self._lookups = set( )
+        self._deps[outpath] = { 'defs' : sorted(names), 'includes' : sorted(includes) }
+
+    def FormatCacheStats( self ) :
+        if self._env is None :
+            return 'not loaded'
+        stats = self._env.PathCacheStats
+        return ', '.join( [ '{}={}'.format(k, stats[k]) for k in sorted(stats) ] )
+
     __mults = { 'k':1024, 'K':1000,
                 'm':1024*1024, 'M':1000*1000,
                 'g':1024*1024*1024, 'G':1000*1000*1000, }
     __keys = tuple(__mults.keys())
-    @jinja2.contextfilter
-    def _SizeFilter(self, context, value) :
+    def SizeFilter(self, value) :
         mult = 1
         if value.endswith( self.__keys ) :
             mult = self.__mults[value[-1]]
@@ -150,7 +127,8 @@ class IbServerTemplateEngine( object ) :
 
     IronBeeVersion = property( lambda self : self._ib_version )
     Defs       = property( lambda self : self._defs )
-    Env        = property( lambda self : self._env )
+    Deps       = property( lambda self : self._deps )
+    Env        = property( _GetEnv )
     SourceRoot = property( lambda self : self._src_root )
     DestRoot   = property( lambda self : self._dst_root )
     Verbose    = property( lambda self : self._defs['Verbose'] )
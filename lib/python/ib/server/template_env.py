@@ -0,0 +1,170 @@
+#! /usr/bin/env python
+# ****************************************************************************
+# Licensed to Qualys, Inc. (QUALYS) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# QUALYS licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ****************************************************************************
+import os
+import re
+import jinja2
+import jinja2.ext
+import jinja2.meta
+
+class FileLineExtension( jinja2.ext.Extension ) :
+    r""" Adds a filename, basename and lineno tags to Jinja. """
+
+    tags = set(['filename', 'basename', 'lineno'])
+
+    def parse(self, parser):
+        token = next(parser.stream)
+        if token.value == 'filename' :
+            node = jinja2.nodes.Const(parser.filename)
+        elif token.value == 'basename' :
+            node = jinja2.nodes.Const(os.path.basename(parser.filename))
+        elif token.value == 'lineno' :
+            node = jinja2.nodes.Const(str(token.lineno))
+        else :
+            assert False, 'Unknown token "{:s}"'.format(token.value)
+        return node
+
+class RuleIdExtension( jinja2.ext.Extension ) :
+    r""" Adds a {% baseid %}, {% ruleid %}, and {% pruleid %} tags to Jinja. """
+
+    tags = set(['baseid', 'ruleid', 'pruleid'])
+
+    _ruleid = ''
+    _regex = re.compile( r'\..+' )
+    def parse(self, parser):
+        token = next(parser.stream)
+        if token.value == 'pruleid' :
+            return jinja2.nodes.Const(self._ruleid)
+        baseid = self._regex.sub('', os.path.basename(parser.filename))
+        if token.value == 'ruleid' :
+            ruleid = '{:s}/{:03d}'.format(baseid, token.lineno)
+            parser.environment.globals['RuleId'] = ruleid
+            self._ruleid = ruleid
+            node = jinja2.nodes.Const(ruleid)
+        elif token.value == 'baseid' :
+            parser.environment.globals['BaseId'] = baseid
+            node = jinja2.nodes.Const(baseid)
+        else :
+            assert False, 'Unknown token "{:s}"'.format(token.value)
+        return node
+
+class IbVersionExtension( jinja2.ext.Extension ) :
+    r""" Adds a {% ibvercmp(op,value) %} tag to Jinja. """
+
+    tags = set(['ibversion'])
+
+    def parse(self, parser):
+        token = next(parser.stream)
+        args = parser.parse_expression()
+        print 'Token is "{:s}"'.format(token)
+        print 'Args:', type(args), args
+        print 'args.expr:', type(args.expr), args.expr
+        print 'args.ops:', type(args.ops), args.ops
+        for n,op in enumerate(args.ops) :
+            print n, type(op), op
+        node = jinja2.nodes.Const(True)
+        return node
+
+class _RelativeEnvironment(jinja2.Environment):
+    """
+    Override join_path() to enable relative template paths.
+    Resolved paths (and failed lookups) are cached by requested name and
+    parent directory until ResetPathCache() is called.
+    """
+    def __init__(self, *args, **kwargs):
+        jinja2.Environment.__init__(self, *args, **kwargs)
+        self.ResetPathCache()
+
+    def ResetPathCache(self):
+        self._path_cache = { }
+        self._path_stats = dict.fromkeys( ('lookups', 'hits', 'negative_hits',
+                                           'probes', 'probes_avoided'), 0 )
+
+    PathCacheStats = property( lambda self : dict(self._path_stats) )
+
+    def _ResolvePath(self, template, parent):
+        searchpath = self.loader.searchpath + [os.path.dirname(parent)]
+        probes = 0
+        for root in searchpath :
+            full = os.path.join(root, template)
+            probes += 1
+            if os.path.exists(full) :
+                prefix = os.path.commonprefix([full, root])
+                path = full.replace(prefix+'/', '')
+                return path, probes
+        return None, probes
+
+    def join_path(self, template, parent):
+        stats = self._path_stats
+        stats['lookups'] += 1
+        key = ( template, os.path.dirname(parent) )
+        try :
+            path, probes = self._path_cache[key]
+            stats['hits'] += 1
+            if path is None :
+                stats['negative_hits'] += 1
+            stats['probes_avoided'] += probes
+            return path
+        except KeyError :
+            pass
+        path, probes = self._ResolvePath(template, parent)
+        stats['probes'] += probes
+        self._path_cache[key] = ( path, probes )
+        return path
+
+def IbServerCreateTemplateEnv( engine ) :
+    """
+    Create the Jinja environment for engine.  This module is only imported
+    when the first template is rendered, so that runs which don't render
+    anything never pay for importing jinja2.
+    """
+    loader = jinja2.FileSystemLoader( searchpath=[engine.SourceRoot] )
+    env = _RelativeEnvironment(loader=loader,
+                               lstrip_blocks=True,
+                               extensions=[FileLineExtension,
+                                           RuleIdExtension])
+    env.filters['ibversion'] = jinja2.contextfilter(
+        lambda context, value : engine.IbVersionFilter(value) )
+    env.filters['Map'] = jinja2.environmentfilter(
+        lambda env, name, _map, value : engine.IbMapFilter(name, _map, value) )
+    env.filters['Size'] = jinja2.contextfilter(
+        lambda context, value : engine.SizeFilter(value) )
+    env.tests['rule_enable'] = engine.IsRuleEnable
+    return env
+
+def IbServerFindTemplateRefs( env, name ) :
+    """
+    Parse template name, return the set of undeclared variables and the
+    list of templates it references (None for dynamic references).
+    """
+    source, filename, uptodate = env.loader.get_source( env, name )
+    ast = env.parse( source, name, filename )
+    return ( set(jinja2.meta.find_undeclared_variables(ast)),
+             list(jinja2.meta.find_referenced_templates(ast)) )
+
+class IbModule_server_template_env( object ) :
+    modulePath = __file__
+
+if __name__ == "__main__" :
+    assert False, "not stand-alone"
+
+### Local Variables: ***
+### py-indent-offset:4 ***
+### python-indent:4 ***
+### python-continuation-offset:4 ***
+### tab-width:4  ***
+### End: ***
@@ -62,6 +62,15 @@ class IbServerToolBase( object ) :
     def AppendProgArgs( self, args ) :
         assert type(args) in (list,tuple)
         self._prog_args += args
+    def PreRun( self, defs ) :
+        """ Called before the program's command line is built """
+        pass
+    def PostRun( self, defs, tool_out, status ) :
+        """
+        Called after the program exits.  tool_out is the expanded tool
+        output path (or None), status is the program's exit status.
+        """
+        pass
 
 IbServerToolBaseTools = \
 {
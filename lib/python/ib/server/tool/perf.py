@@ -0,0 +1,145 @@
+#! /usr/bin/env python
+# ****************************************************************************
+# Licensed to Qualys, Inc. (QUALYS) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# QUALYS licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ****************************************************************************
+import re
+import os
+import sys
+import collections
+import subprocess
+
+from ib.server.tool.base import *
+
+class IbServerToolPerf( IbServerToolBase ) :
+    def __init__( self, name, prefix, args=None ) :
+        IbServerToolBase.__init__( self, name, prefix=prefix, tool_args=args )
+
+    def _RunPerf( self, cmd, outpath ) :
+        if self._verbose :
+            print "Running:", cmd, "->", outpath
+        try :
+            with open( outpath, 'w' ) as out :
+                status = subprocess.call( cmd, stdout=out )
+        except OSError as e :
+            print >>sys.stderr, 'Failed to run "{}": {}'.format( cmd[0], e )
+            return False
+        if status :
+            print >>sys.stderr, '"{}" exit status is {}'.format( ' '.join(cmd), status )
+            return False
+        return True
+
+class IbServerToolPerfRecord( IbServerToolPerf ) :
+    _perf_prefix = ( "perf", "record", "-g", "-o", "${ToolOut}" )
+
+    def __init__( self, name, args=None ) :
+        IbServerToolPerf.__init__( self, name, self._perf_prefix, args )
+
+    _sym_offset_re = re.compile( r'\+0x[0-9a-f]+$' )
+    @classmethod
+    def _Frame( cls, line ) :
+        # "    7f1c2a3b4c5d func+0x1d (/usr/lib/libfoo.so)"
+        parts = line.strip().split( None, 1 )
+        if len(parts) < 2 :
+            return None
+        sym = parts[1]
+        dso = None
+        if sym.endswith( ')' )  and  ' (' in sym :
+            sym, dso = sym.rsplit( ' (', 1 )
+            dso = dso[:-1]
+        sym = cls._sym_offset_re.sub( '', sym.strip() )
+        if sym in ( '', '[unknown]' )  and  dso is not None :
+            sym = '[{}]'.format( os.path.basename(dso) )
+        return sym.replace( ';', ':' )
+
+    # "comm pid[/tid] [cpu] time: ..."; comm may contain spaces
+    _header_re = re.compile( r'(.*?)\s+\d+(?:/\d+)?\s+(?:\[\d+\]\s+)?[\d\.]+:' )
+    @classmethod
+    def FoldStacks( cls, lines ) :
+        """
+        Collapse "perf script" output into folded stacks, returning a
+        Counter of "comm;outer;...;leaf" -> sample count.
+        """
+        folded = collections.Counter( )
+        comm = None
+        frames = [ ]
+        for line in lines :
+            if line.startswith( ('\t', ' ') ) :
+                if comm is not None :
+                    frame = cls._Frame( line )
+                    if frame is not None :
+                        frames.append( frame )
+            elif line.strip() == '' :
+                if comm is not None :
+                    folded[';'.join([comm]+frames[::-1])] += 1
+                comm = None
+                frames = [ ]
+            elif not line.startswith( '#' ) :
+                m = cls._header_re.match( line )
+                comm = line.split( None, 1 )[0] if m is None else m.group(1)
+                frames = [ ]
+        if comm is not None :
+            folded[';'.join([comm]+frames[::-1])] += 1
+        return folded
+
+    def PostRun( self, defs, tool_out, status ) :
+        if tool_out is None  or  not os.path.exists( tool_out ) :
+            return
+        report = tool_out+'.report'
+        if self._RunPerf( ["perf", "report", "--stdio", "-i", tool_out], report ) :
+            print "perf report is in", report
+        script = tool_out+'.script'
+        if not self._RunPerf( ["perf", "script", "-i", tool_out], script ) :
+            return
+        folded = tool_out+'.folded'
+        with open( script ) as fp :
+            stacks = self.FoldStacks( fp )
+        with open( folded, 'w' ) as fp :
+            for stack, count in sorted( stacks.items() ) :
+                print >>fp, stack, count
+        os.unlink( script )
+        print "Folded stacks ({} unique) are in {}".format( len(stacks), folded )
+
+class IbServerToolPerfStat( IbServerToolPerf ) :
+    _perf_prefix = ( "perf", "stat", "-o", "${ToolOut}" )
+
+    def __init__( self, name, args=None ) :
+        IbServerToolPerf.__init__( self, name, self._perf_prefix, args )
+
+    def PostRun( self, defs, tool_out, status ) :
+        if tool_out is None  or  not os.path.exists( tool_out ) :
+            return
+        for line in open( tool_out ) :
+            if line.strip() != ''  and  not line.startswith( '#' ) :
+                print line.rstrip()
+
+IbServerToolPerfTools = \
+{
+    "perf"      : IbServerToolPerfRecord( "perf" ),
+    "perf-stat" : IbServerToolPerfStat( "perf-stat", args=("-d",) ),
+}
+
+class IbModule_server_tool_perf( object ) :
+    modulePath = __file__
+
+if __name__ == "__main__" :
+    assert False, "not stand-alone"
+
+### Local Variables: ***
+### py-indent-offset:4 ***
+### python-indent:4 ***
+### python-continuation-offset:4 ***
+### tab-width:4  ***
+### End: ***
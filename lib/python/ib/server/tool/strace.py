@@ -15,14 +15,31 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ****************************************************************************
-from ib.server.tool.base import *
+import os
+
+from ib.server.tool.base     import *
+from ib.util.strace_analyzer import *
 
 class IbServerToolStrace( IbServerToolBase ) :
     _strace_prefix = ("${ToolName}",
+                      "-f", "-tt", "-T",
                       "-o", "${ToolOut}")
     def __init__( self, name ) :
         IbServerToolBase.__init__( self, name, prefix=self._strace_prefix )
 
+    def PostRun( self, defs, tool_out, status ) :
+        if tool_out is None  or  not os.path.exists( tool_out ) :
+            return
+        analyzer = IbStraceAnalyzer( top=10 )
+        analyzer.FeedFile( tool_out )
+        summary = tool_out+'.summary'
+        with open( summary, 'w' ) as fp :
+            for line in analyzer.FormatReport( ) :
+                print >>fp, line
+        for line in analyzer.FormatSummary( ) :
+            print line
+        print "strace summary is in", summary
+
 IbServerToolStraceTools = \
 {
     "strace" : IbServerToolStrace( "strace" ),
@@ -15,23 +15,130 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ****************************************************************************
-from ib.server.tool.base import *
+import os
+
+from ib.server.tool.base    import *
+from ib.util.callgrind      import *
+from ib.util.massif         import *
+from ib.util.valgrind_log   import *
 
 class IbServerToolValgrind( IbServerToolBase ) :
     _valgrind_prefix = ( "valgrind",
                          "--tool=${SubTool}",
                          "--log-file=${ToolOut}")
 
+    _xml_args = ( "--xml=yes",
+                  "--xml-file=${ToolOut}.xml",
+                  "--gen-suppressions=all" )
+    XmlSupported = True
+
     def __init__( self, name, defs, args=None ) :
         IbServerToolBase.__init__( self, name,
                                    prefix=self._valgrind_prefix,
                                    tool_args=args,
                                    defs=defs )
+        self._xml = False
+        self._suppressions = None
+
+    def SetXml( self, xml ) :
+        assert self.XmlSupported  or  not xml
+        self._xml = xml
+    Xml = property( lambda self : self._xml )
+
+    def PreRun( self, defs ) :
+        path = defs.Lookup( 'ValgrindSuppressions' )
+        if path is not None  and  os.path.isfile( path ) :
+            self._suppressions = path
+        else :
+            self._suppressions = None
 
     def Prefix( self ) :
         prefix = list(self._prefix) + [ "-v" for i in range(self._verbose) ]
+        if self._suppressions is not None :
+            prefix.append( "--suppressions="+self._suppressions )
+        if self._xml :
+            prefix += self._xml_args
         return prefix
 
+    def PostRun( self, defs, tool_out, status ) :
+        if not self._xml  or  tool_out is None  or  not os.path.exists( tool_out+'.xml' ) :
+            return
+        analyzer = IbValgrindXmlAnalyzer( )
+        try :
+            with open( tool_out+'.xml' ) as fp :
+                analyzer.Feed( fp )
+        except SyntaxError as e :
+            # ElementTree.ParseError; valgrind may have been killed
+            print "Failed to parse", tool_out+'.xml:', e
+            return
+        summary = tool_out+'.summary'
+        with open( summary, 'w' ) as fp :
+            for line in analyzer.FormatReport( top=50 ) :
+                print >>fp, line
+        for line in analyzer.FormatReport( top=5, stacks=False ) :
+            print line
+        print self.ToolName, "summary is in", summary
+
+        known = IbValgrindSuppressions( self._suppressions )
+        candidates = known.Candidates( analyzer.Ranked() )
+        if len(candidates) :
+            supp = tool_out+'.supp'
+            with open( supp, 'w' ) as fp :
+                for candidate in candidates :
+                    print >>fp, candidate.Format( )
+                    print >>fp
+            print len(candidates), "new suppression candidates are in", supp
+
+class IbServerToolValgrindProfile( IbServerToolValgrind ) :
+    """
+    Callgrind / cachegrind: write the profile to ${ToolOut}.out, and
+    summarize it once the server exits.
+    """
+    XmlSupported = False
+
+    def __init__( self, name, defs, args=None ) :
+        args = [ "--${SubTool}-out-file=${ToolOut}.out" ] + list( self._ToList(args) )
+        IbServerToolValgrind.__init__( self, name, defs, args )
+
+    def PostRun( self, defs, tool_out, status ) :
+        if tool_out is None  or  not os.path.exists( tool_out+'.out' ) :
+            return
+        try :
+            profile = IbCallgrindProfile( tool_out+'.out' )
+        except IbCallgrindException as e :
+            print "Failed to parse", tool_out+'.out:', e
+            return
+        report = tool_out+'.report'
+        with open( report, 'w' ) as fp :
+            for line in profile.FormatReport( top=50 ) :
+                print >>fp, line
+        for cost, key in profile.Top( top=10 ) :
+            print '  {:>15d}  {}'.format( cost, profile.FormatFunction(key) )
+        print self.ToolName, "profile is in", tool_out+'.out', "report is in", report
+
+class IbServerToolValgrindMassif( IbServerToolValgrindProfile ) :
+    """
+    Massif: summarize peak heap usage and write heap usage over time to
+    ${ToolOut}.csv once the server exits.
+    """
+    def PostRun( self, defs, tool_out, status ) :
+        if tool_out is None  or  not os.path.exists( tool_out+'.out' ) :
+            return
+        try :
+            profile = IbMassifProfile( tool_out+'.out' )
+        except IbMassifException as e :
+            print "Failed to parse", tool_out+'.out:', e
+            return
+        report = tool_out+'.report'
+        with open( report, 'w' ) as fp :
+            for line in profile.FormatSummary( top=20, depth=8 ) :
+                print >>fp, line
+        with open( tool_out+'.csv', 'w' ) as fp :
+            profile.WriteCsv( fp )
+        for line in profile.FormatSummary( top=5, tree=False ) :
+            print line
+        print "massif profile is in", tool_out+'.out', "report is in", report
+
 IbServerToolValgrindTools = \
 {
     "valgrind" : IbServerToolValgrind("valgrind",
@@ -46,10 +153,12 @@ IbServerToolValgrindTools = \
                                       defs={"SubTool":"helgrind"}),
     "drd" : IbServerToolValgrind("drd",
                                  defs={"SubTool":"drd"}),
-    "cachegrind" : IbServerToolValgrind("cachegrind",
-                                        defs={"SubTool":"cachegrind"}),
-    "callgrind" : IbServerToolValgrind("callgrind",
-                                       defs={"SubTool":"callgrind"}),
+    "cachegrind" : IbServerToolValgrindProfile("cachegrind",
+                                               defs={"SubTool":"cachegrind"}),
+    "callgrind" : IbServerToolValgrindProfile("callgrind",
+                                              defs={"SubTool":"callgrind"}),
+    "massif" : IbServerToolValgrindMassif("massif",
+                                          defs={"SubTool":"massif"}),
 }
 
 class IbModule_server_tool_valgrind( object ) :
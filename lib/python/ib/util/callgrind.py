@@ -0,0 +1,319 @@
+#! /usr/bin/env python
+# ****************************************************************************
+# Licensed to Qualys, Inc. (QUALYS) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# QUALYS licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ****************************************************************************
+import re
+import os
+import sys
+import collections
+
+class IbCallgrindException( BaseException ) : pass
+class IbCallgrindParseError( IbCallgrindException ) : pass
+
+class IbCallgrindProfile( object ) :
+    """
+    Parser for callgrind and cachegrind output files.  Builds exclusive
+    and inclusive cost tables per function (keyed by (file, function))
+    and exclusive cost per source file.  Handles name compression
+    ("fn=(id) name"), file switches (fi= / fe=), call costs (calls=) and
+    position compression.
+    """
+    _name_re = re.compile( r'\((\d+)\)(?:\s+(.*))?$' )
+    _namespaces = { 'fl':'file', 'fi':'file', 'fe':'file', 'cfl':'file', 'cfi':'file',
+                    'fn':'fn', 'cfn':'fn', 'ob':'obj', 'cob':'obj' }
+
+    def __init__( self, path=None ) :
+        self._path = path
+        self._events = [ ]
+        self._positions = [ 'line' ]
+        self._totals = None
+        self._summary = None
+        self._header = collections.OrderedDict( )
+        self._exclusive = { }
+        self._inclusive = { }
+        self._calls = collections.Counter( )
+        self._files = { }
+        if path is not None :
+            self.ParseFile( path )
+
+    Path      = property( lambda self : self._path )
+    Events    = property( lambda self : list(self._events) )
+    Header    = property( lambda self : dict(self._header) )
+    Exclusive = property( lambda self : self._exclusive )
+    Inclusive = property( lambda self : self._inclusive )
+    Files     = property( lambda self : self._files )
+    Calls     = property( lambda self : self._calls )
+
+    def _GetTotals( self ) :
+        if self._totals is not None :
+            return self._totals
+        if self._summary is not None :
+            return self._summary
+        totals = [ 0 ] * len(self._events)
+        for cost in self._exclusive.values() :
+            self._Add( totals, cost )
+        return totals
+    Totals = property( _GetTotals )
+
+    def EventIndex( self, event ) :
+        if event is None :
+            return 0
+        try :
+            return self._events.index( event )
+        except ValueError :
+            raise IbCallgrindException( 'Unknown event "{}" (events: {})'.format(event, ' '.join(self._events)) )
+
+    @staticmethod
+    def _Add( dest, values ) :
+        for n, v in enumerate( values ) :
+            dest[n] += v
+
+    @staticmethod
+    def _Sum( current, value ) :
+        values = [ int(v) for v in value.split() ]
+        if current is None :
+            return values
+        if len(current) < len(values) :
+            current += [ 0 ] * ( len(values) - len(current) )
+        for n, v in enumerate( values ) :
+            current[n] += v
+        return current
+
+    def _Name( self, names, key, value ) :
+        m = self._name_re.match( value )
+        if m is None :
+            return value
+        table = names[self._namespaces[key]]
+        if m.group(2) is not None :
+            table[m.group(1)] = m.group(2)
+            return m.group(2)
+        try :
+            return table[m.group(1)]
+        except KeyError :
+            raise IbCallgrindParseError( 'Undefined compressed name "{}" for {}'.format(value, key) )
+
+    def _Costs( self, fields ) :
+        values = [ 0 ] * len(self._events)
+        for n, v in enumerate( fields[len(self._positions):len(self._positions)+len(self._events)] ) :
+            values[n] = int( v )
+        return values
+
+    def _Cost( self, table, key ) :
+        cost = table.get( key )
+        if cost is None :
+            cost = [ 0 ] * len(self._events)
+            table[key] = cost
+        return cost
+
+    def ParseFile( self, path ) :
+        self._path = path
+        if path == '-' :
+            self.Parse( sys.stdin )
+        else :
+            with open( path ) as fp :
+                self.Parse( fp )
+
+    def Parse( self, lines ) :
+        names = { 'file':{ }, 'fn':{ }, 'obj':{ } }
+        fl = fi = None
+        fn = None
+        in_call = False
+        call_target = None
+        for lineno, line in enumerate( lines, 1 ) :
+            line = line.strip( )
+            if line == ''  or  line.startswith( '#' ) :
+                continue
+            c = line[0]
+            if c.isdigit( )  or  c in '+-*' :
+                if len(self._events) == 0 :
+                    raise IbCallgrindParseError( 'Line {}: cost line before "events:"'.format(lineno) )
+                values = self._Costs( line.split() )
+                key = ( fl, fn )
+                if in_call :
+                    self._Add( self._Cost(self._inclusive, key), values )
+                    self._calls[(key, call_target)] += 1
+                    in_call = False
+                else :
+                    self._Add( self._Cost(self._exclusive, key), values )
+                    self._Add( self._Cost(self._inclusive, key), values )
+                    self._Add( self._Cost(self._files, fi or fl), values )
+                continue
+            name, sep, value = line.partition( '=' )
+            if sep :
+                if name in ( 'fl', 'fi', 'fe', 'fn', 'cfl', 'cfi', 'cfn', 'ob', 'cob' ) :
+                    value = self._Name( names, name, value )
+                    if name == 'fl' :
+                        fl = value
+                        fi = None
+                    elif name in ( 'fi', 'fe' ) :
+                        fi = None if value == fl else value
+                    elif name == 'fn' :
+                        fn = value
+                        fi = None
+                    elif name in ( 'cfn', ) :
+                        call_target = value
+                elif name == 'calls' :
+                    in_call = True
+                # jump=, jcnd= and unknown specifications are ignored
+                continue
+            name, sep, value = line.partition( ':' )
+            if not sep :
+                raise IbCallgrindParseError( 'Line {}: unrecognized line "{}"'.format(lineno, line) )
+            value = value.strip( )
+            if name == 'events' :
+                self._SetEvents( value.split() )
+            elif name == 'positions' :
+                self._positions = value.split( )
+            elif name == 'totals' :
+                # Each part of a multi-part profile has its own totals
+                self._totals = self._Sum( self._totals, value )
+            elif name == 'summary' :
+                self._summary = self._Sum( self._summary, value )
+            else :
+                self._header[name] = value
+
+    def _SetEvents( self, events ) :
+        if len(self._events) != 0  and  events != self._events :
+            raise IbCallgrindParseError( 'Event list changed from "{}" to "{}"'.format(
+                ' '.join(self._events), ' '.join(events)) )
+        self._events = events
+
+    def Top( self, event=None, inclusive=False, top=20 ) :
+        """ Return the top functions as [ ( cost, (file, function) ) ] """
+        index = self.EventIndex( event )
+        table = self._inclusive if inclusive else self._exclusive
+        items = [ (cost[index], key) for key, cost in table.items() ]
+        items.sort( key=lambda i : (-i[0], i[1]) )
+        return items[:top]
+
+    @staticmethod
+    def FormatFunction( key ) :
+        fl, fn = key
+        return '{}:{}'.format( fl or '???', fn or '???' )
+
+    def FormatReport( self, event=None, top=20 ) :
+        index = self.EventIndex( event )
+        event = self._events[index]
+        total = self.Totals[index] or 1
+        lines = [ ]
+        if 'cmd' in self._header :
+            lines.append( 'Command: {}'.format(self._header['cmd']) )
+        lines.append( 'Events: {}'.format(' '.join(self._events)) )
+        lines.append( 'Totals: {}'.format(' '.join([str(v) for v in self.Totals])) )
+        for title, inclusive in ( ('exclusive', False), ('inclusive', True) ) :
+            lines.append( '' )
+            lines.append( 'Top {} functions by {} {}:'.format(top, title, event) )
+            for cost, key in self.Top( event, inclusive, top ) :
+                lines.append( '  {:>15d} {:6.2f}%  {}'.format(
+                    cost, 100.0 * cost / total, self.FormatFunction(key)) )
+        lines.append( '' )
+        lines.append( 'Top {} files by exclusive {}:'.format(top, event) )
+        files = sorted( self._files.items(), key=lambda i : -i[1][index] )[:top]
+        for name, cost in files :
+            lines.append( '  {:>15d} {:6.2f}%  {}'.format(
+                cost[index], 100.0 * cost[index] / total, name or '???') )
+        return lines
+
+class IbCallgrindDiff( object ) :
+    """
+    Compare a baseline and a candidate profile for one event, ranking the
+    functions whose cost changed the most.
+    """
+    def __init__( self, base, cand, event=None, inclusive=False ) :
+        self._base = base
+        self._cand = cand
+        self._event = base.Events[base.EventIndex( event )]
+        self._inclusive = inclusive
+        bi = base.EventIndex( self._event )
+        ci = cand.EventIndex( self._event )
+        btable = base.Inclusive if inclusive else base.Exclusive
+        ctable = cand.Inclusive if inclusive else cand.Exclusive
+        self._base_total = base.Totals[bi]
+        self._cand_total = cand.Totals[ci]
+        self._changes = [ ]
+        for key in set(btable) | set(ctable) :
+            b = btable[key][bi] if key in btable else None
+            c = ctable[key][ci] if key in ctable else None
+            self._changes.append( (key, b, c) )
+
+    Event     = property( lambda self : self._event )
+    BaseTotal = property( lambda self : self._base_total )
+    CandTotal = property( lambda self : self._cand_total )
+
+    def _GetTotalChangePct( self ) :
+        if self._base_total == 0 :
+            return 0.0
+        return 100.0 * (self._cand_total - self._base_total) / self._base_total
+    TotalChangePct = property( _GetTotalChangePct )
+
+    @staticmethod
+    def _Delta( change ) :
+        key, b, c = change
+        return (c or 0) - (b or 0)
+
+    def Regressions( self, min_cost=0 ) :
+        """ Functions whose cost increased, largest increase first """
+        items = [ c for c in self._changes if self._Delta(c) > min_cost ]
+        return sorted( items, key=lambda c : -self._Delta(c) )
+
+    def Improvements( self, min_cost=0 ) :
+        """ Functions whose cost decreased, largest decrease first """
+        items = [ c for c in self._changes if -self._Delta(c) > min_cost ]
+        return sorted( items, key=self._Delta )
+
+    def _FormatChange( self, change ) :
+        key, b, c = change
+        delta = self._Delta( change )
+        if b is None :
+            pct = 'new'
+        elif c is None :
+            pct = 'gone'
+        elif b == 0 :
+            pct = '+inf%'
+        else :
+            pct = '{:+.2f}%'.format( 100.0 * delta / b )
+        share = 100.0 * delta / (self._base_total or 1)
+        return '  {:>+15d} {:>9s} {:>+8.3f}%tot  {:>13s} -> {:<13s} {}'.format(
+            delta, pct, share, str(b if b is not None else '-'), str(c if c is not None else '-'),
+            IbCallgrindProfile.FormatFunction(key) )
+
+    def FormatReport( self, top=20, min_cost=0 ) :
+        lines = [ ]
+        lines.append( '{} {}: {} -> {} ({:+.3f}%)'.format(
+            'Inclusive' if self._inclusive else 'Exclusive', self._event,
+            self._base_total, self._cand_total, self.TotalChangePct) )
+        lines.append( '' )
+        lines.append( 'Top {} regressions:'.format(top) )
+        for change in self.Regressions( min_cost )[:top] :
+            lines.append( self._FormatChange(change) )
+        lines.append( '' )
+        lines.append( 'Top {} improvements:'.format(top) )
+        for change in self.Improvements( min_cost )[:top] :
+            lines.append( self._FormatChange(change) )
+        return lines
+
+class IbModule_util_callgrind( object ) :
+    modulePath = __file__
+
+if __name__ == "__main__" :
+    assert False, "not stand-alone"
+
+### Local Variables: ***
+### py-indent-offset:4 ***
+### python-indent:4 ***
+### python-continuation-offset:4 ***
+### tab-width:4  ***
+### End: ***
@@ -0,0 +1,257 @@
+#! /usr/bin/env python
+# ****************************************************************************
+# Licensed to Qualys, Inc. (QUALYS) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# QUALYS licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ****************************************************************************
+import os
+import io
+import sys
+import gzip
+import bz2
+import subprocess
+
+class IbCompressException( BaseException ) : pass
+class IbCompressError( IbCompressException ) : pass
+
+class _PipeWriter( object ) :
+    """ File-like writer which pipes the data through a compression program """
+    def __init__( self, fp, args, close_fp=False ) :
+        self._fp = fp
+        self._close_fp = close_fp
+        try :
+            self._proc = subprocess.Popen( args, stdin=subprocess.PIPE, stdout=fp )
+        except OSError as e :
+            raise IbCompressError( 'Unable to run {}: {}'.format(args[0], e) )
+
+    def write( self, data ) :
+        self._proc.stdin.write( data )
+
+    def flush( self ) :
+        self._proc.stdin.flush( )
+
+    def close( self ) :
+        if self._proc is not None :
+            self._proc.stdin.close( )
+            self._proc.wait( )
+            self._proc = None
+        if self._close_fp :
+            self._fp.close( )
+
+class _ZstdWriter( _PipeWriter ) :
+    """
+    File-like zstd writer; uses the zstandard module if it's available,
+    otherwise pipes the data through the zstd program.
+    """
+    def __init__( self, fp, level, close_fp=False ) :
+        self._writer = None
+        try :
+            import zstandard
+        except ImportError :
+            _PipeWriter.__init__( self, fp, ('zstd', '-q', '-c', '-{}'.format(level)), close_fp )
+            return
+        self._fp = fp
+        self._close_fp = close_fp
+        self._proc = None
+        self._writer = zstandard.ZstdCompressor( level=level ).stream_writer( fp )
+
+    def write( self, data ) :
+        if self._writer is not None :
+            self._writer.write( data )
+        else :
+            _PipeWriter.write( self, data )
+
+    def flush( self ) :
+        if self._writer is not None :
+            self._writer.flush( )
+        else :
+            _PipeWriter.flush( self )
+
+    def close( self ) :
+        if self._writer is not None :
+            self._writer.close( )
+            self._writer = None
+        _PipeWriter.close( self )
+
+class _PipeReader( object ) :
+    """
+    File-like reader which decompresses a file through a pipe from a
+    decompression program, which runs in parallel with the reader.
+    """
+    def __init__( self, path, args, bufsize ) :
+        self._name = path
+        with open( path, 'rb' ) as fp :
+            self._proc = subprocess.Popen( args, stdin=fp, stdout=subprocess.PIPE,
+                                           bufsize=bufsize, close_fds=True )
+        self._fp = self._proc.stdout
+
+    name = property( lambda self : self._name )
+
+    def __iter__( self ) :
+        return iter( self._fp )
+
+    def __enter__( self ) :
+        return self
+
+    def __exit__( self, *args ) :
+        self.close( )
+
+    def read( self, size=-1 ) :
+        return self._fp.read( size )
+
+    def readline( self, size=-1 ) :
+        return self._fp.readline( size )
+
+    def close( self ) :
+        if self._proc is None :
+            return
+        self._fp.close( )
+        status = self._proc.wait( )
+        self._proc = None
+        # A negative status is a signal, i.e. SIGPIPE if closed early
+        if status > 0 :
+            raise IbCompressError( 'Decompression of "{}" failed ({})'.format(self._name, status) )
+
+class IbCompress( object ) :
+    """ Compressed file helpers """
+    Methods = ( 'none', 'gzip', 'bzip2', 'xz', 'zstd' )
+    _suffixes = { 'none' : '', 'gzip' : '.gz', 'bzip2' : '.bz2', 'xz' : '.xz', 'zstd' : '.zst' }
+    _levels = { 'gzip' : 6, 'bzip2' : 9, 'xz' : 6, 'zstd' : 3 }
+    _magic = ( ( 'gzip',  '\x1f\x8b' ),
+               ( 'bzip2', 'BZh' ),
+               ( 'xz',    '\xfd7zXZ\x00' ),
+               ( 'zstd',  '\x28\xb5\x2f\xfd' ) )
+    _programs = { 'gzip' : 'gzip', 'bzip2' : 'bzip2', 'xz' : 'xz', 'zstd' : 'zstd' }
+
+    @classmethod
+    def Suffix( cls, method ) :
+        return cls._suffixes[method]
+
+    @classmethod
+    def MethodFromPath( cls, path ) :
+        for method, suffix in cls._suffixes.items( ) :
+            if suffix != ''  and  path.endswith( suffix ) :
+                return method
+        return 'none'
+
+    @classmethod
+    def StripSuffix( cls, path ) :
+        """ Strip path's compression suffix, if any """
+        return path[:len(path) - len(cls.Suffix(cls.MethodFromPath(path)))]
+
+    @classmethod
+    def Detect( cls, path ) :
+        """ Detect the compression method of path from its magic bytes """
+        with open( path, 'rb' ) as fp :
+            head = fp.read( 8 )
+        for method, magic in cls._magic :
+            if head.startswith( magic ) :
+                return method
+        return 'none'
+
+    @classmethod
+    def _Program( cls, method, level, decompress=False ) :
+        args = [ cls._programs[method], '-c' ]
+        if decompress :
+            args.append( '-d' )
+        else :
+            args.append( '-{}'.format(level) )
+        if method == 'zstd' :
+            args.append( '-q' )
+        return args
+
+    @classmethod
+    def Wrap( cls, fp, method, level=None ) :
+        """
+        Wrap the binary file object fp in a compressing writer; closing
+        the writer doesn't close fp
+        """
+        assert method in cls.Methods, 'Invalid compression method "{}"'.format( method )
+        if level is None :
+            level = cls._levels.get( method )
+        if method == 'gzip' :
+            return gzip.GzipFile( fileobj=fp, mode='wb', compresslevel=level )
+        elif method == 'zstd' :
+            return _ZstdWriter( fp, level )
+        elif method != 'none' :
+            return _PipeWriter( fp, cls._Program(method, level) )
+        return fp
+
+    @classmethod
+    def Open( cls, path, method=None, level=None, append=False, bufsize=-1 ) :
+        """
+        Open path for writing (or appending: all of the methods accept
+        concatenated streams); method defaults to one matching its suffix
+        """
+        if method is None :
+            method = cls.MethodFromPath( path )
+        assert method in cls.Methods, 'Invalid compression method "{}"'.format( method )
+        if level is None :
+            level = cls._levels.get( method )
+        mode = 'ab' if append else 'wb'
+        if method == 'gzip' :
+            return gzip.open( path, mode, level )
+        elif method == 'zstd' :
+            return _ZstdWriter( open(path, mode), level, close_fp=True )
+        elif method != 'none' :
+            return _PipeWriter( open(path, mode), cls._Program(method, level), close_fp=True )
+        return open( path, mode, bufsize )
+
+    @classmethod
+    def OpenRead( cls, path, method=None, bufsize=1024*1024 ) :
+        """
+        Open path for reading, decompressing it if its magic bytes (or
+        method) say it's compressed.  Decompression is done by piping
+        through the method's program if it's available, otherwise by the
+        Python module.  "-" is standard input, which is read as is.
+        """
+        if path == '-' :
+            return sys.stdin
+        if method is None :
+            method = cls.Detect( path )
+        assert method in cls.Methods, 'Invalid compression method "{}"'.format( method )
+        if method == 'none' :
+            return open( path, 'rb', bufsize )
+        try :
+            return _PipeReader( path, cls._Program(method, None, True), bufsize )
+        except OSError :
+            pass
+        if method == 'gzip' :
+            return gzip.open( path, 'rb' )
+        elif method == 'bzip2' :
+            return bz2.BZ2File( path, 'rb', bufsize )
+        try :
+            if method == 'xz' :
+                import lzma
+                return lzma.open( path, 'rb' )
+            else :
+                import zstandard
+                reader = zstandard.ZstdDecompressor( ).stream_reader( open(path, 'rb') )
+                return io.BufferedReader( reader, bufsize )
+        except ImportError :
+            raise IbCompressError( 'Unable to read {} file "{}": no {} program or module'.
+                                   format(method, path, cls._programs[method]) )
+
+class IbModule_util_compress( object ) :
+    modulePath = __file__
+
+if __name__ == "__main__" :
+    assert False, "not stand-alone"
+
+### Local Variables: ***
+### py-indent-offset:4 ***
+### python-indent:4 ***
+### python-continuation-offset:4 ***
+### tab-width:4  ***
+### End: ***
@@ -0,0 +1,187 @@
+#! /usr/bin/env python
+# ****************************************************************************
+# Licensed to Qualys, Inc. (QUALYS) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# QUALYS licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ****************************************************************************
+import os
+import sys
+import stat
+import errno
+import shutil
+import fcntl
+
+class IbCopierException( BaseException ) : pass
+class IbCopierError( IbCopierException ) : pass
+
+class IbFileCopier( object ) :
+    """
+    Copy files and synchronize directory trees, only touching files that
+    differ (size / mtime) from their source.  Depending on the mode, files
+    are hard linked, reflinked (copy-on-write clone) or copied with
+    sendfile() (or a large buffered copy if sendfile() isn't available).
+    Each method falls back to the next one when it's not permitted by the
+    file system.
+    """
+    Modes = ( 'copy', 'reflink', 'link' )
+
+    _FICLONE = 0x40049409
+    _bufsize = 1024 * 1024
+    _no_clone_errors = ( errno.EXDEV, errno.EPERM, errno.EINVAL,
+                         errno.ENOTTY, errno.EOPNOTSUPP, errno.EMLINK )
+
+    def __init__( self, mode='reflink', delete=True ) :
+        assert mode in self.Modes, 'Invalid copy mode "{}"'.format( mode )
+        self._mode = mode
+        self._delete = delete
+        self._sendfile = getattr( os, 'sendfile', None )
+        self.ResetStats( )
+
+    Mode  = property( lambda self : self._mode )
+    Stats = property( lambda self : dict(self._stats) )
+
+    def ResetStats( self ) :
+        self._stats = dict.fromkeys( ( 'checked', 'unchanged', 'linked', 'reflinked',
+                                       'copied', 'removed', 'dirs' ), 0 )
+
+    def FormatStats( self ) :
+        return ', '.join( [ '{}={}'.format(k, self._stats[k]) for k in sorted(self._stats) ] )
+
+    @staticmethod
+    def _IsSame( src_st, dst_st ) :
+        if (src_st.st_dev, src_st.st_ino) == (dst_st.st_dev, dst_st.st_ino) :
+            return True
+        return src_st.st_size == dst_st.st_size  and \
+            abs(src_st.st_mtime - dst_st.st_mtime) < 1.0
+
+    def _Link( self, source, tmp ) :
+        try :
+            os.link( source, tmp )
+            self._stats['linked'] += 1
+            return True
+        except OSError as e :
+            if e.errno in self._no_clone_errors :
+                return False
+            raise
+
+    def _Reflink( self, infp, outfp ) :
+        try :
+            fcntl.ioctl( outfp.fileno(), self._FICLONE, infp.fileno() )
+            self._stats['reflinked'] += 1
+            return True
+        except (IOError, OSError) as e :
+            if e.errno in self._no_clone_errors :
+                return False
+            raise
+
+    def _SendFile( self, infp, outfp, size ) :
+        if self._sendfile is None :
+            shutil.copyfileobj( infp, outfp, self._bufsize )
+        else :
+            offset = 0
+            while offset < size :
+                sent = self._sendfile( outfp.fileno(), infp.fileno(), offset, size - offset )
+                if sent == 0 :
+                    break
+                offset += sent
+        self._stats['copied'] += 1
+
+    def CopyFile( self, source, dest, src_st=None ) :
+        """
+        Copy source to dest if dest is missing or differs from source.
+        The new file is written to a temporary name and renamed over dest,
+        so a dest which is hard linked to source is never written through.
+        Returns True if dest was updated.
+        """
+        if src_st is None :
+            src_st = os.stat( source )
+        self._stats['checked'] += 1
+        try :
+            dst_st = os.stat( dest )
+        except OSError as e :
+            if e.errno != errno.ENOENT :
+                raise
+            dst_st = None
+        if dst_st is not None :
+            if stat.S_ISDIR( dst_st.st_mode ) :
+                raise IbCopierError( '"{:s}" is a directory'.format(dest) )
+            if self._IsSame( src_st, dst_st ) :
+                self._stats['unchanged'] += 1
+                return False
+
+        tmp = '{}.ib-copy.{}'.format( dest, os.getpid() )
+        try :
+            if self._mode != 'link'  or  not self._Link( source, tmp ) :
+                with open( source, 'rb' ) as infp :
+                    with open( tmp, 'wb' ) as outfp :
+                        if self._mode == 'copy'  or  not self._Reflink( infp, outfp ) :
+                            self._SendFile( infp, outfp, src_st.st_size )
+                shutil.copystat( source, tmp )
+                # utime() truncates to microseconds; never leave the copy
+                # older than its source, or DAG nodes will always be stale
+                os.utime( tmp, (src_st.st_atime, src_st.st_mtime + 1e-6) )
+            os.rename( tmp, dest )
+        except :
+            if os.path.lexists( tmp ) :
+                os.unlink( tmp )
+            raise
+        return True
+
+    def _Remove( self, path ) :
+        if os.path.isdir( path )  and  not os.path.islink( path ) :
+            shutil.rmtree( path )
+        else :
+            os.unlink( path )
+        self._stats['removed'] += 1
+
+    def SyncDir( self, source, dest ) :
+        """
+        Synchronize the dest tree with the source tree.  Only files which
+        differ are copied; if delete is enabled, entries in dest which don't
+        exist in source are removed.
+        """
+        if not os.path.isdir( dest ) :
+            if os.path.lexists( dest ) :
+                raise IbCopierError( '"{:s}" exists and is not a directory'.format(dest) )
+            os.makedirs( dest )
+            self._stats['dirs'] += 1
+        names = os.listdir( source )
+        for name in names :
+            src = os.path.join( source, name )
+            dst = os.path.join( dest, name )
+            st = os.stat( src )
+            if stat.S_ISDIR( st.st_mode ) :
+                if os.path.lexists( dst )  and  not os.path.isdir( dst ) :
+                    self._Remove( dst )
+                self.SyncDir( src, dst )
+            elif stat.S_ISREG( st.st_mode ) :
+                if os.path.isdir( dst )  and  not os.path.islink( dst ) :
+                    self._Remove( dst )
+                self.CopyFile( src, dst, st )
+        if self._delete :
+            for name in set(os.listdir(dest)) - set(names) :
+                self._Remove( os.path.join(dest, name) )
+
+class IbModule_util_copier( object ) :
+    modulePath = __file__
+
+if __name__ == "__main__" :
+    assert False, "not stand-alone"
+
+### Local Variables: ***
+### py-indent-offset:4 ***
+### python-indent:4 ***
+### python-continuation-offset:4 ***
+### tab-width:4  ***
+### End: ***
@@ -0,0 +1,184 @@
+#! /usr/bin/env python
+# ****************************************************************************
+# Licensed to Qualys, Inc. (QUALYS) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# QUALYS licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ****************************************************************************
+import re
+import os
+import sys
+import time
+import signal
+import threading
+import subprocess
+import collections
+
+class IbCoreReport( object ) :
+    """ Result of running gdb on one core file """
+    def __init__( self, core ) :
+        self.Core = core
+        self.Output = None
+        self.Signal = None
+        self.Frames = [ ]
+        self.Status = None
+        self.TimedOut = False
+        self.Error = None
+        self.Elapsed = 0.0
+
+class IbCoreTriage( object ) :
+    """
+    Run batch mode gdb on core files concurrently, collecting the crashing
+    thread's backtrace and full backtraces of all threads (written next to
+    each core as <core>.bt), and cluster the cores by the top frames of
+    the crashing thread.  Each gdb run is killed after a timeout.
+    """
+    _marker = '---ib-all-threads---'
+    _frame_re = re.compile( r'#(\d+)\s+(?:0x[0-9a-fA-F]+ in )?(.+?)(?: \(.*?\))?(?: (?:at|from) (\S+))?$' )
+    _signal_re = re.compile( r'Program terminated with signal (\w+)' )
+    # Frames which only show how the process died, not where
+    _skip_frames = frozenset( ( 'raise', 'abort', '__GI_raise', '__GI_abort', '__assert_fail',
+                                '__assert_fail_base', '__pthread_kill_implementation',
+                                '__pthread_kill_internal', '__pthread_kill', 'pthread_kill',
+                                '<signal handler called>' ) )
+
+    def __init__( self, executable, jobs=4, timeout=60.0, frames=5, gdb='gdb' ) :
+        self._executable = executable
+        self._jobs = max( jobs, 1 )
+        self._timeout = timeout
+        self._frames = frames
+        self._gdb = gdb
+        self._reports = [ ]
+
+    Reports = property( lambda self : list(self._reports) )
+
+    def _Command( self, core ) :
+        return [ self._gdb, '-batch', '-nx',
+                 '-ex', 'set pagination off',
+                 '-ex', 'bt',
+                 '-ex', 'echo {}\\n'.format(self._marker),
+                 '-ex', 'thread apply all bt full',
+                 self._executable, core ]
+
+    def _RunOne( self, report ) :
+        start = time.time( )
+        try :
+            with open( os.devnull ) as devnull :
+                p = subprocess.Popen( self._Command(report.Core), stdout=subprocess.PIPE,
+                                      stderr=subprocess.STDOUT, stdin=devnull )
+        except OSError as e :
+            report.Error = str( e )
+            return
+        def Kill( ) :
+            report.TimedOut = True
+            try :
+                p.kill( )
+            except OSError :
+                pass
+        timer = threading.Timer( self._timeout, Kill )
+        timer.start( )
+        try :
+            report.Output = p.communicate( )[0]
+            report.Status = p.returncode
+        finally :
+            timer.cancel( )
+        report.Elapsed = time.time( ) - start
+        self._Parse( report )
+        try :
+            with open( report.Core+'.bt', 'w' ) as fp :
+                fp.write( report.Output )
+        except IOError :
+            pass
+
+    def _Parse( self, report ) :
+        for line in report.Output.splitlines( ) :
+            if line.startswith( self._marker ) :
+                break
+            m = self._signal_re.match( line )
+            if m is not None :
+                report.Signal = m.group( 1 )
+                continue
+            m = self._frame_re.match( line )
+            if m is not None :
+                report.Frames.append( (m.group(2), m.group(3)) )
+
+    def Signature( self, report ) :
+        """ Top frames of the crashing thread, skipping abort / signal frames """
+        names = [ name for name, where in report.Frames if name not in self._skip_frames ]
+        if len(names) == 0 :
+            return '<no backtrace>'
+        return ' < '.join( names[:self._frames] )
+
+    def Run( self, cores ) :
+        """ Triage cores, jobs at a time; returns the reports """
+        reports = [ IbCoreReport(core) for core in cores ]
+        pending = collections.deque( reports )
+        lock = threading.Lock( )
+        def Worker( ) :
+            while True :
+                with lock :
+                    if len(pending) == 0 :
+                        return
+                    report = pending.popleft( )
+                self._RunOne( report )
+        threads = [ threading.Thread(target=Worker) for n in range(min(self._jobs, len(reports))) ]
+        for thread in threads :
+            thread.daemon = True
+            thread.start( )
+        for thread in threads :
+            thread.join( )
+        self._reports += reports
+        return reports
+
+    def Clusters( self ) :
+        """ Return [ ( signature, [reports] ) ], largest cluster first """
+        clusters = collections.OrderedDict( )
+        for report in self._reports :
+            clusters.setdefault( self.Signature(report), [ ] ).append( report )
+        return sorted( clusters.items(), key=lambda c : -len(c[1]) )
+
+    def FormatSummary( self, frames=15 ) :
+        lines = [ ]
+        failed = [ r for r in self._reports if r.Error is not None or r.TimedOut ]
+        clusters = self.Clusters( )
+        lines.append( '{} cores, {} clusters, {} failed / timed out'.format(
+            len(self._reports), len(clusters), len(failed)) )
+        for n, (signature, reports) in enumerate( clusters, 1 ) :
+            first = reports[0]
+            signals = collections.Counter( [r.Signal or '?' for r in reports] )
+            lines.append( '' )
+            lines.append( '#{} x{} [{}] {}'.format(
+                n, len(reports), ', '.join(['{} x{}'.format(s, c) for s, c in signals.most_common()]),
+                signature) )
+            for name, where in first.Frames[:frames] :
+                lines.append( '    {}{}'.format(name, '' if where is None else ' at '+where) )
+            for report in reports :
+                lines.append( '  {}{}'.format(report.Core, ' (timed out)' if report.TimedOut else '') )
+        for report in failed :
+            if report.Error is not None :
+                lines.append( '' )
+                lines.append( '{}: {}'.format(report.Core, report.Error) )
+        return lines
+
+class IbModule_util_core_triage( object ) :
+    modulePath = __file__
+
+if __name__ == "__main__" :
+    assert False, "not stand-alone"
+
+### Local Variables: ***
+### py-indent-offset:4 ***
+### python-indent:4 ***
+### python-continuation-offset:4 ***
+### tab-width:4  ***
+### End: ***
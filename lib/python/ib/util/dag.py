@@ -87,6 +87,17 @@ class _BaseDagObject( object ) :
 class IbDagNode( _BaseDagObject ) :
     _path_mtime_cache = { }
     _ib_module_paths = None
+    _use_mtimes = False
+    @classmethod
+    def SetUseModTimes( cls, tf ) :
+        """
+        When enabled, nodes with a path compare its modification time with
+        their sources and children, and only stale nodes are executed.
+        Otherwise all nodes are considered stale.
+        """
+        assert type(tf) == bool
+        cls._use_mtimes = tf
+
     @classmethod
     def _InitClass( cls ) :
         if cls._ib_module_paths is not None :
@@ -108,6 +119,7 @@ class IbDagNode( _BaseDagObject ) :
         self._dag      = dag
         self._sources  = set( )
         self._always   = always
+        self._forced   = False
         if sources is not None :
             self.AddSources( sources )
         self.Reset( )
@@ -149,6 +161,10 @@ class IbDagNode( _BaseDagObject ) :
         assert type(tf) == bool
         self._always = tf
 
+    def Invalidate( self ) :
+        """ Force the node (and the nodes which depend on it) to be stale. """
+        self._forced = True
+
     def GetModTime( self, path ) :
         full = self.GetFullPath( path )
         mtime = self._path_mtime_cache.get( full )
@@ -208,6 +224,8 @@ class IbDagNode( _BaseDagObject ) :
                 stale = True
             elif self.Path is None :
                 self._mtime = 0.0
+            elif self._use_mtimes :
+                self._mtime = self.GetModTime( self.Path )
             else :
                 self._mtime = None
         except IbDagNoFile :
@@ -221,7 +239,7 @@ class IbDagNode( _BaseDagObject ) :
                 .format(str(e), self.Name, self._dag.Name)
             raise IbDagNoFile( msg )
 
-        if self.Path is None  or  stale  or  self._mtime is None :
+        if self.Path is None  or  stale  or  self._mtime is None  or  self._forced :
             self._is_stale = True
         elif not self._is_stale :
             if maxtime > self._mtime  or  maxsource > self._mtime :
@@ -246,6 +264,13 @@ class IbDagNode( _BaseDagObject ) :
         for child in self._children :
             child.Execute( self, debug=debug, debug_fp=debug_fp, *args, **kwargs )
 
+        if self._use_mtimes  and  self._is_stale is False :
+            if debug > 2 :
+                print >>debug_fp, 'Not executing up to date node "{}" of DAG "{}"' \
+                    .format(self.Name, self.Dag.Name)
+            self._executed = True
+            return
+
         _recipe = None
         if self.Recipe is not None :
             _recipe = self.Recipe
@@ -308,6 +333,7 @@ class IbDagNode( _BaseDagObject ) :
     Recipe   = property( lambda self : self._recipe )
     IsPhony  = property( lambda self : self._path is None )
     Always   = property( lambda self : self._always, _setAlways )
+    Forced   = property( lambda self : self._forced )
 
 
 class IbDag( _BaseDagObject ) :
@@ -0,0 +1,382 @@
+#! /usr/bin/env python
+# ****************************************************************************
+# Licensed to Qualys, Inc. (QUALYS) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# QUALYS licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ****************************************************************************
+import re
+import bisect
+import difflib
+import collections
+
+def _Anchors( a, alo, ahi, b, blo, bhi ) :
+    """
+    Patience anchors: the longest increasing sequence (by position in b)
+    of the lines which occur exactly once in both a[alo:ahi] and
+    b[blo:bhi]
+    """
+    unique_b = { }
+    for j in xrange( blo, bhi ) :
+        h = b[j]
+        unique_b[h] = -1 if h in unique_b else j
+    unique_a = { }
+    for i in xrange( alo, ahi ) :
+        h = a[i]
+        unique_a[h] = -1 if h in unique_a else i
+    pairs = [ (i, unique_b[h]) for h, i in unique_a.iteritems()
+              if i >= 0  and  unique_b.get(h, -1) >= 0 ]
+    pairs.sort( )
+
+    # Patience sort by position in b, with back pointers
+    tops = [ ]
+    top_index = [ ]
+    back = [ ]
+    for n, (i, j) in enumerate( pairs ) :
+        k = bisect.bisect_left( tops, j )
+        back.append( top_index[k-1] if k > 0 else -1 )
+        if k == len(tops) :
+            tops.append( j )
+            top_index.append( n )
+        else :
+            tops[k] = j
+            top_index[k] = n
+    anchors = [ ]
+    n = top_index[-1] if top_index else -1
+    while n >= 0 :
+        anchors.append( pairs[n] )
+        n = back[n]
+    anchors.reverse( )
+    return anchors
+
+def _Match( a, b, fallback_limit ) :
+    """
+    Patience diff of two hash sequences; returns the sorted list of
+    matched (i, j) pairs.  Ranges with no unique lines in common are
+    matched with difflib if they're small enough, else left unmatched.
+    """
+    matches = [ ]
+    ranges = [ (0, len(a), 0, len(b)) ]
+    while ranges :
+        alo, ahi, blo, bhi = ranges.pop( )
+        while alo < ahi  and  blo < bhi  and  a[alo] == b[blo] :
+            matches.append( (alo, blo) )
+            alo += 1
+            blo += 1
+        while alo < ahi  and  blo < bhi  and  a[ahi-1] == b[bhi-1] :
+            ahi -= 1
+            bhi -= 1
+            matches.append( (ahi, bhi) )
+        if alo == ahi  or  blo == bhi :
+            continue
+        anchors = _Anchors( a, alo, ahi, b, blo, bhi )
+        if anchors :
+            for i, j in anchors :
+                matches.append( (i, j) )
+                ranges.append( (alo, i, blo, j) )
+                alo, blo = i + 1, j + 1
+            ranges.append( (alo, ahi, blo, bhi) )
+        elif (ahi - alo) * (bhi - blo) <= fallback_limit :
+            matcher = difflib.SequenceMatcher( None, a[alo:ahi], b[blo:bhi], autojunk=False )
+            for i, j, n in matcher.get_matching_blocks( ) :
+                for k in xrange( n ) :
+                    matches.append( (alo + i + k, blo + j + k) )
+    matches.sort( )
+    return matches
+
+
+class IbLogDiff( object ) :
+    """
+    Streaming line diff.  Lines are aligned by their hashes with patience
+    diff, within a window of lines from each input; the part of the
+    window up to the last match well before its end is emitted, and the
+    rest is carried over to the next window.  Memory use is bounded by
+    the window size, however long the inputs are.
+    """
+    def __init__( self, window=50000, fallback_limit=4*1000*1000 ) :
+        self._window = max( window, 16 )
+        self._margin = self._window // 4
+        self._fallback_limit = fallback_limit
+        self._stats = dict.fromkeys( ( 'equal', 'deleted', 'inserted' ), 0 )
+
+    Stats = property( lambda self : dict(self._stats) )
+
+    @staticmethod
+    def _Fill( lines, hashes, source, size ) :
+        for line in source :
+            lines.append( line )
+            hashes.append( hash(line) )
+            if len(lines) >= size :
+                return False
+        return True
+
+    def Diff( self, source1, source2 ) :
+        """
+        Yield (op, line) for the lines of the two sources, where op is
+        ' ' (in both), '-' (only in the first) or '+' (only in the
+        second)
+        """
+        source1 = iter( source1 )
+        source2 = iter( source2 )
+        a, ha, done_a = [ ], [ ], False
+        b, hb, done_b = [ ], [ ], False
+        stats = self._stats
+        while True :
+            if not done_a :
+                done_a = self._Fill( a, ha, source1, self._window )
+            if not done_b :
+                done_b = self._Fill( b, hb, source2, self._window )
+            if not a  and  not b :
+                break
+            matches = _Match( ha, hb, self._fallback_limit )
+
+            # Only commit matches which aren't near the end of a window
+            # which has more input to come
+            limit_a = len(a) if done_a else len(a) - self._margin
+            limit_b = len(b) if done_b else len(b) - self._margin
+            while matches  and  ( matches[-1][0] >= limit_a  or  matches[-1][1] >= limit_b ) :
+                matches.pop( )
+            if done_a  and  done_b :
+                cut_a, cut_b = len(a), len(b)
+            elif matches :
+                cut_a, cut_b = matches[-1][0] + 1, matches[-1][1] + 1
+            else :
+                cut_a, cut_b = max(limit_a, 0), max(limit_b, 0)
+
+            i = j = 0
+            for mi, mj in matches + [ (cut_a, cut_b) ] :
+                for n in xrange( i, mi ) :
+                    stats['deleted'] += 1
+                    yield '-', a[n]
+                for n in xrange( j, mj ) :
+                    stats['inserted'] += 1
+                    yield '+', b[n]
+                if mi == cut_a :
+                    break
+                # Equal hashes don't quite guarantee equal lines
+                if a[mi] == b[mj] :
+                    stats['equal'] += 1
+                    yield ' ', a[mi]
+                else :
+                    stats['deleted'] += 1
+                    stats['inserted'] += 1
+                    yield '-', a[mi]
+                    yield '+', b[mj]
+                i, j = mi + 1, mj + 1
+            del a[:cut_a], ha[:cut_a]
+            del b[:cut_b], hb[:cut_b]
+
+
+class IbLogDiffHunks( object ) :
+    """
+    Group a diff's (op, line) stream into unified diff hunks with context
+    lines of context; completed hunks are passed to the callback as
+    (start1, count1, start2, count2, lines).
+    """
+    def __init__( self, callback, context=3 ) :
+        self._callback = callback
+        self._context = context
+        self._line1 = 0
+        self._line2 = 0
+        self._before = collections.deque( maxlen=context )
+        self._hunk = None
+        self._trailing = 0
+        self._hunks = 0
+
+    Hunks = property( lambda self : self._hunks )
+
+    def _Flush( self, keep ) :
+        lines = self._hunk[2]
+        if len(lines) > keep :
+            extra = lines[keep:]
+            del lines[keep:]
+        else :
+            extra = [ ]
+        start1, start2 = self._hunk[0], self._hunk[1]
+        count1 = sum( 1 for op, _ in lines if op != '+' )
+        count2 = sum( 1 for op, _ in lines if op != '-' )
+        self._hunks += 1
+        self._callback( start1 + 1 if count1 else start1, count1,
+                        start2 + 1 if count2 else start2, count2, lines )
+        self._hunk = None
+        self._before.extend( extra )
+
+    def Add( self, op, line ) :
+        if op == ' ' :
+            if self._hunk is None :
+                self._before.append( (op, line) )
+            else :
+                self._hunk[2].append( (op, line) )
+                self._trailing += 1
+                if self._trailing > 2 * self._context :
+                    self._Flush( len(self._hunk[2]) - self._trailing + self._context )
+            self._line1 += 1
+            self._line2 += 1
+            return
+        if self._hunk is None :
+            before = list( self._before )
+            self._before.clear( )
+            self._hunk = ( self._line1 - len(before), self._line2 - len(before), before )
+        self._hunk[2].append( (op, line) )
+        self._trailing = 0
+        if op == '-' :
+            self._line1 += 1
+        else :
+            self._line2 += 1
+
+    def Close( self ) :
+        if self._hunk is not None :
+            self._Flush( len(self._hunk[2]) - self._trailing + min(self._trailing, self._context) )
+
+class IbLogTx( object ) :
+    """
+    One transaction of a run: its number (as ib-log-normalize numbers
+    them), its id in the log (UUID or number), its request signature and
+    the sequence of rule / phase events logged for it.
+    """
+    __slots__ = ( 'Num', 'Id', 'Signature', 'Events', 'Lines' )
+
+    def __init__( self, num, txid ) :
+        self.Num = num
+        self.Id = txid
+        self.Signature = None
+        self.Events = [ ]
+        self.Lines = 0
+
+    Name = property( lambda self : 'TX {:05d}'.format(self.Num) )
+
+class IbLogTxRun( object ) :
+    """
+    The transactions of one run, read from its log lines: either a raw
+    log, whose transactions are numbered in order of first appearance
+    (each UUID is one transaction), or ib-log-normalize output, whose
+    transaction numbers (including its renumbering of transactions which
+    reappear after clean up) are used as they are.  Only the structure of
+    each transaction is kept, so memory use is proportional to the number
+    of rule / phase events rather than the size of the log.
+    """
+    _tx_re      = re.compile( r'\[tx:([a-f0-9\-]{36}|\d+)\] ' )
+    _rule_re    = re.compile( r' \[rule:"([\w\-\.\d/]+)" rev:\d+\] ' )
+    _event_re   = re.compile( r' (RULE_START|RULE_END|PHASE|ACTION|EVENT|TARGET|TFN|OP|AUDIT)\b' )
+    _phase_re   = re.compile( r' PHASE\s+([\w:]+)' )
+    _request_re = re.compile( r' (GET|POST|HEAD|PUT|DELETE|OPTIONS|PATCH|TRACE|CONNECT) (\S+)' )
+
+    def __init__( self ) :
+        self._txs = { }
+        self._order = [ ]
+        self._lines = 0
+
+    Txs   = property( lambda self : list(self._order) )
+    Lines = property( lambda self : self._lines )
+
+    def _Event( self, line ) :
+        m = self._phase_re.search( line )
+        if m is not None :
+            return 'PHASE ' + m.group(1)
+        rule = self._rule_re.search( line )
+        event = self._event_re.search( line )
+        if rule is None  and  event is None :
+            return None
+        elif rule is None :
+            return event.group(1)
+        elif event is None :
+            return rule.group(1)
+        return rule.group(1) + ' ' + event.group(1)
+
+    def Read( self, source ) :
+        """ Group the lines of source by transaction """
+        for line in source :
+            self._lines += 1
+            m = self._tx_re.search( line )
+            if m is None :
+                continue
+            txid = m.group(1)
+            tx = self._txs.get( txid )
+            if tx is None :
+                num = int( txid ) if txid.isdigit() else len( self._order )
+                tx = IbLogTx( num, txid )
+                self._txs[txid] = tx
+                self._order.append( tx )
+            tx.Lines += 1
+            if tx.Signature is None :
+                r = self._request_re.search( line, m.end() )
+                if r is not None :
+                    tx.Signature = intern( r.group(1) + ' ' + r.group(2) )
+            event = self._Event( line )
+            if event is not None :
+                tx.Events.append( intern(event) )
+
+class IbLogTxDiff( object ) :
+    """
+    Pair the transactions of two runs by request signature (in order of
+    appearance for transactions with the same, or no, signature), and
+    compare their rule / phase event sequences.
+    """
+    def __init__( self, run1, run2 ) :
+        self._run1 = run1
+        self._run2 = run2
+        self._stats = dict.fromkeys( ( 'paired', 'same', 'differ', 'only1', 'only2' ), 0 )
+
+    Stats = property( lambda self : dict(self._stats) )
+
+    def Pairs( self ) :
+        """ Yield (tx1, tx2) pairs; either may be None if unmatched """
+        queues = collections.defaultdict( collections.deque )
+        for tx in self._run2.Txs :
+            queues[tx.Signature].append( tx )
+        for tx in self._run1.Txs :
+            queue = queues.get( tx.Signature )
+            if queue :
+                yield tx, queue.popleft( )
+            else :
+                yield tx, None
+        rest = [ tx for queue in queues.itervalues() for tx in queue ]
+        for tx in sorted( rest, key=lambda tx : tx.Num ) :
+            yield None, tx
+
+    def Diff( self, context=3 ) :
+        """
+        Yield (tx1, tx2, lines) for each pair whose event sequences differ,
+        where lines is a unified diff of the sequences, and for each
+        unmatched transaction (with lines None)
+        """
+        stats = self._stats
+        for tx1, tx2 in self.Pairs( ) :
+            if tx2 is None :
+                stats['only1'] += 1
+                yield tx1, None, None
+            elif tx1 is None :
+                stats['only2'] += 1
+                yield None, tx2, None
+            else :
+                stats['paired'] += 1
+                if tx1.Events == tx2.Events :
+                    stats['same'] += 1
+                    continue
+                stats['differ'] += 1
+                lines = difflib.unified_diff( tx1.Events, tx2.Events,
+                                              tx1.Name, tx2.Name, n=context, lineterm='' )
+                yield tx1, tx2, list(lines)[2:]
+
+class IbModule_util_log_diff( object ) :
+    modulePath = __file__
+
+if __name__ == "__main__" :
+    assert False, "not stand-alone"
+
+### Local Variables: ***
+### py-indent-offset:4 ***
+### python-indent:4 ***
+### python-continuation-offset:4 ***
+### tab-width:4  ***
+### End: ***
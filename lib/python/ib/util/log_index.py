@@ -0,0 +1,301 @@
+#! /usr/bin/env python
+# ****************************************************************************
+# Licensed to Qualys, Inc. (QUALYS) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# QUALYS licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ****************************************************************************
+import os
+import re
+import time
+import zlib
+import array
+import cPickle
+
+from ib.util.compress import *
+from ib.util.log_normalizer import *
+
+class IbLogIndexException( BaseException ) : pass
+class IbLogIndexError( IbLogIndexException ) : pass
+
+def _AddRun( runs, start, end ) :
+    """ Add [start, end) to the flat run list, merging adjacent runs """
+    if runs  and  runs[-1] == start :
+        runs[-1] = end
+    else :
+        runs.append( start )
+        runs.append( end )
+
+def _Union( run_lists ) :
+    """ Union of flat run lists, as a sorted list of (start, end) pairs """
+    pairs = sorted( (runs[i], runs[i+1]) for runs in run_lists for i in range(0, len(runs), 2) )
+    merged = [ ]
+    for start, end in pairs :
+        if merged  and  start <= merged[-1][1] :
+            merged[-1] = ( merged[-1][0], max(merged[-1][1], end) )
+        else :
+            merged.append( (start, end) )
+    return merged
+
+def _Intersect( a, b ) :
+    """ Intersection of two sorted lists of (start, end) pairs """
+    result = [ ]
+    i = j = 0
+    while i < len(a)  and  j < len(b) :
+        start = max( a[i][0], b[j][0] )
+        end = min( a[i][1], b[j][1] )
+        if start < end :
+            result.append( (start, end) )
+        if a[i][1] < b[j][1] :
+            i += 1
+        else :
+            j += 1
+    return result
+
+def IbLogParseTime( text ) :
+    """ Parse a local time stamp ("YYYY-MM-DD[T ]HH:MM[:SS]") to seconds """
+    text = text.replace( 'T', ' ' )
+    for fmt in ( '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d' ) :
+        try :
+            return time.mktime( time.strptime(text, fmt) )
+        except ValueError :
+            pass
+    raise ValueError( 'Invalid time "{}"'.format(text) )
+
+
+class IbLogIndex( object ) :
+    """
+    Byte offset index of an IronBee log: the runs of lines of each
+    transaction and of each PID, and the byte range of each time bucket.
+    Lines without a time stamp (i.e. continuations) belong with the line
+    before them.  The index is stored in a compressed sidecar file next
+    to the log; logs which have been appended to since the index was
+    built are indexed incrementally.
+    """
+    Version = 1
+    Suffix = '.ibidx'
+
+    _tx_re  = re.compile( r' \[tx:([a-f0-9\-]{36})\] ' )
+    _pid_re = re.compile( r' \[(\d+)\] ' )
+    _time1_re = IbLogNormalizer._regexs['Time1']
+    _time2_re = IbLogNormalizer._regexs['Time2']
+    _bufsize = 1024 * 1024
+
+    def __init__( self, path, index_path=None, bucket=60 ) :
+        self._path = path
+        self._index_path = path + self.Suffix if index_path is None else index_path
+        self._bucket = bucket
+        self._Reset( )
+
+    def _Reset( self ) :
+        self._size = 0
+        self._mtime = None
+        self._end = 0
+        self._last = ( None, None, None )
+        self._tx = { }
+        self._pid = { }
+        self._buckets = { }
+
+    Path      = property( lambda self : self._path )
+    IndexPath = property( lambda self : self._index_path )
+    Bucket    = property( lambda self : self._bucket )
+    Txs       = property( lambda self : sorted(self._tx) )
+    Pids      = property( lambda self : sorted(self._pid) )
+
+    def TimeRange( self ) :
+        if not self._buckets :
+            return None, None
+        return min(self._buckets) * self._bucket, (max(self._buckets) + 1) * self._bucket
+
+    def _Time( self, line, timecache ) :
+        m = self._time1_re.match( line )
+        if m is not None :
+            return timecache.Seconds( m ) + float( '0.'+m.group(8) )
+        m = self._time2_re.match( line )
+        if m is not None :
+            return timecache.Seconds( m )
+        return None
+
+    def Build( self ) :
+        """ Index the log, continuing from the end of the last build """
+        if IbCompress.Detect( self._path ) != 'none' :
+            raise IbLogIndexError( 'Can\'t index compressed log "{}"'.format(self._path) )
+        st = os.stat( self._path )
+        if st.st_size < self._end :
+            self._Reset( )
+        tx, pid, bucket = self._last
+        txs = self._tx
+        pids = self._pid
+        buckets = self._buckets
+        timecache = IbLogTimeCache( )
+        with open( self._path, 'rb' ) as fp :
+            fp.seek( self._end )
+            pos = self._end
+            for line in fp :
+                if not line.endswith( '\n' ) :
+                    break
+                end = pos + len(line)
+                t = self._Time( line, timecache )
+                if t is not None :
+                    m = self._tx_re.search( line )
+                    tx = None if m is None else m.group(1)
+                    m = self._pid_re.search( line )
+                    pid = None if m is None else int(m.group(1))
+                    bucket = int( t // self._bucket )
+                if tx is not None :
+                    _AddRun( self._Runs(txs, tx, True), pos, end )
+                if pid is not None :
+                    _AddRun( self._Runs(pids, pid, True), pos, end )
+                if bucket is not None :
+                    r = buckets.get( bucket )
+                    if r is None :
+                        buckets[bucket] = [ pos, end ]
+                    else :
+                        r[1] = end
+                pos = end
+        self._end = pos
+        self._last = ( tx, pid, bucket )
+        self._size = st.st_size
+        self._mtime = st.st_mtime
+
+    def _Runs( self, runs, key, create=False ) :
+        """ Get key's run list, unpacking it if it was loaded packed """
+        value = runs.get( key )
+        if value is None :
+            if not create :
+                return [ ]
+            value = runs[key] = [ ]
+        elif isinstance( value, str ) :
+            value = runs[key] = self._Unpack( value )
+        return value
+
+    @staticmethod
+    def _Pack( runs ) :
+        if isinstance( runs, str ) :
+            return runs
+        deltas = array.array( 'L', runs )
+        for i in range( len(runs) - 1, 0, -1 ) :
+            deltas[i] -= deltas[i-1]
+        return deltas.tostring( )
+
+    @staticmethod
+    def _Unpack( data ) :
+        runs = array.array( 'L' )
+        runs.fromstring( data )
+        for i in range( 1, len(runs) ) :
+            runs[i] += runs[i-1]
+        return runs.tolist( )
+
+    def Save( self ) :
+        data = {
+            'version' : self.Version,
+            'bucket'  : self._bucket,
+            'size'    : self._size,
+            'mtime'   : self._mtime,
+            'end'     : self._end,
+            'last'    : self._last,
+            'tx'      : dict( (k, self._Pack(v)) for k, v in self._tx.iteritems() ),
+            'pid'     : dict( (k, self._Pack(v)) for k, v in self._pid.iteritems() ),
+            'buckets' : self._buckets,
+        }
+        tmp = self._index_path + '.tmp'
+        with open( tmp, 'wb' ) as fp :
+            fp.write( zlib.compress(cPickle.dumps(data, cPickle.HIGHEST_PROTOCOL), 6) )
+        os.rename( tmp, self._index_path )
+
+    def Load( self ) :
+        """ Load the sidecar file; returns False if it's missing or unusable """
+        try :
+            with open( self._index_path, 'rb' ) as fp :
+                data = cPickle.loads( zlib.decompress(fp.read()) )
+        except (IOError, zlib.error, cPickle.UnpicklingError, EOFError) :
+            return False
+        if data.get('version') != self.Version  or  data['bucket'] != self._bucket :
+            return False
+        self._size = data['size']
+        self._mtime = data['mtime']
+        self._end = data['end']
+        self._last = data['last']
+        # Run lists are unpacked when they're used
+        self._tx = data['tx']
+        self._pid = data['pid']
+        self._buckets = data['buckets']
+        return True
+
+    def IsCurrent( self ) :
+        st = os.stat( self._path )
+        return st.st_size == self._size  and  st.st_mtime == self._mtime
+
+    def Update( self ) :
+        """
+        Load the index, and (re-)build it if it's missing or out of date;
+        returns True if the sidecar file was written.
+        """
+        if self.Load( )  and  self.IsCurrent( ) :
+            return False
+        self.Build( )
+        self.Save( )
+        return True
+
+    def Ranges( self, txs=None, pid=None, start=None, end=None ) :
+        """ Byte ranges of the lines matching all of the given criteria """
+        ranges = [ (0, self._end) ]
+        if txs :
+            ranges = _Intersect( ranges, _Union([self._Runs(self._tx, tx) for tx in txs]) )
+        if pid is not None :
+            ranges = _Intersect( ranges, _Union([self._Runs(self._pid, pid)]) )
+        if start is not None  or  end is not None :
+            first = None if start is None else int( start // self._bucket )
+            last = None if end is None else int( end // self._bucket )
+            selected = [ r for k, r in self._buckets.iteritems()
+                         if (first is None or k >= first)  and  (last is None or k <= last) ]
+            ranges = _Intersect( ranges, _Union(selected) )
+        return ranges
+
+    def Lines( self, txs=None, pid=None, start=None, end=None ) :
+        """
+        Yield the lines of the log matching all of the given criteria; a
+        time window is applied to each line's time stamp, since a bucket's
+        byte range may include lines from other buckets
+        """
+        timecache = IbLogTimeCache( )
+        with open( self._path, 'rb', self._bufsize ) as fp :
+            for rstart, rend in self.Ranges( txs, pid, start, end ) :
+                # Ranges may span most of the log; read them line by line
+                fp.seek( rstart )
+                pos = rstart
+                keep = True
+                while pos < rend :
+                    line = fp.readline( )
+                    if line == '' :
+                        break
+                    pos += len( line )
+                    if start is not None  or  end is not None :
+                        t = self._Time( line, timecache )
+                        if t is not None :
+                            keep = (start is None or t >= start)  and  (end is None or t < end)
+                    if keep :
+                        yield line
+
+class IbModule_util_log_index( object ) :
+    modulePath = __file__
+
+if __name__ == "__main__" :
+    assert False, "not stand-alone"
+
+### Local Variables: ***
+### py-indent-offset:4 ***
+### python-indent:4 ***
+### python-continuation-offset:4 ***
+### tab-width:4  ***
+### End: ***
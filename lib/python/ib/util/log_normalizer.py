@@ -0,0 +1,667 @@
+#! /usr/bin/env python
+# ****************************************************************************
+# Licensed to Qualys, Inc. (QUALYS) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# QUALYS licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ****************************************************************************
+import os
+import sys
+import re
+import time
+import heapq
+import collections
+
+from ib.util.output_tee import IbLogLevels
+from ib.util.compress import *
+
+class IbLogHandlePool( object ) :
+    """
+    Bounded pool of buffered output file handles for per-transaction
+    files, which are compressed if their suffix says so.  At most
+    max_open files are open at once; when the pool is full, the least
+    recently written file is closed, and it's re-opened for append on its
+    next write.
+    """
+    def __init__( self, max_open=256, bufsize=64*1024 ) :
+        self._max_open = max( max_open, 1 )
+        self._bufsize = bufsize
+        self._open = collections.OrderedDict( )
+        self._stats = dict.fromkeys( ( 'created', 'reopened', 'evicted', 'closed' ), 0 )
+
+    MaxOpen = property( lambda self : self._max_open )
+    Stats   = property( lambda self : dict(self._stats) )
+
+    def FormatStats( self ) :
+        return ', '.join( [ '{}={}'.format(k, self._stats[k]) for k in sorted(self._stats) ] )
+
+    def _Open( self, path, mode ) :
+        while len(self._open) >= self._max_open :
+            _, fh = self._open.popitem( last=False )
+            fh.close( )
+            self._stats['evicted'] += 1
+        fh = IbCompress.Open( path, append=(mode == 'a'), bufsize=self._bufsize )
+        self._open[path] = fh
+        return fh
+
+    def Create( self, path ) :
+        """ Create (truncate) path, and make it the most recently used """
+        self.Close( path )
+        self._stats['created'] += 1
+        return self._Open( path, 'w' )
+
+    def Handle( self, path ) :
+        """ Get the handle for path, re-opening it if it was evicted """
+        fh = self._open.pop( path, None )
+        if fh is None :
+            self._stats['reopened'] += 1
+            return self._Open( path, 'a' )
+        self._open[path] = fh
+        return fh
+
+    def Close( self, path ) :
+        fh = self._open.pop( path, None )
+        if fh is not None :
+            fh.close( )
+            self._stats['closed'] += 1
+
+    def CloseAll( self ) :
+        for path in self._open.keys( ) :
+            self.Close( path )
+
+
+class IbLogTxData( object ) :
+    """
+    Transaction data.  Transactions are written either to a shared output
+    file (fh), or to their own file (path), whose handle is managed by a
+    handle pool.
+    """
+    def __init__( self, num, real, ctime, fh=None, path=None, pool=None ) :
+        self._num = num
+        self._real = real
+        self._fh = fh
+        self._path = path
+        self._pool = pool
+        self._open = True
+        self._queue = None
+        self._ctime = ctime
+        self._mtime = ctime
+
+    @classmethod
+    def Create( cls, num, real, _ctime, path, pool ) :
+        pool.Create( path )
+        return cls( num, real, _ctime, path=path, pool=pool )
+
+    def ReOpen( self ) :
+        self._open = True
+
+    def Touch( self, mtime ) :
+        self._mtime = mtime
+
+    def SetQueue( self, queue ) :
+        self._queue = queue
+
+    def Close( self ) :
+        if self._open  and  self._path is not None :
+            self._pool.Close( self._path )
+            self._open = False
+
+    def _GetHandle( self ) :
+        if self._path is None :
+            return self._fh
+        elif not self._open :
+            return None
+        return self._pool.Handle( self._path )
+
+    Num     = property( lambda self : self._num )
+    RealNum = property( lambda self : self._real )
+    IsOpen  = property( lambda self : self._open )
+    Queue   = property( lambda self : self._queue )
+    Handle  = property( _GetHandle )
+    Path    = property( lambda self : self._path )
+    Ctime   = property( lambda self : self._ctime )
+    Mtime   = property( lambda self : self._mtime )
+
+
+class IbLogTimeCache( object ) :
+    """
+    Converts the whole-seconds part of a Time1 / Time2 match to seconds
+    since the epoch.  Consecutive log lines almost always share the same
+    second, so conversions are cached by the seconds-resolution prefix of
+    the time stamp; the caller adds the sub-second fraction.
+    """
+    _max_entries = 4096
+
+    def __init__( self, enabled=True ) :
+        self._enabled = enabled
+        self._cache = { }
+        self._last_key = None
+        self._last_value = None
+        self._hits = 0
+        self._misses = 0
+
+    Enabled = property( lambda self : self._enabled )
+    Hits    = property( lambda self : self._hits )
+    Misses  = property( lambda self : self._misses )
+
+    @staticmethod
+    def _Convert( m ) :
+        tstr = "%s-%s-%s %s:%s:%s" % m.groups()[1:7]
+        timeinfo = time.strptime( tstr, r'%Y-%m-%d %H:%M:%S' )
+        return time.mktime( timeinfo )
+
+    def Seconds( self, m ) :
+        if not self._enabled :
+            self._misses += 1
+            return self._Convert( m )
+        key = m.string[m.start(2):m.end(7)]
+        if key == self._last_key :
+            self._hits += 1
+            return self._last_value
+        value = self._cache.get( key )
+        if value is None :
+            self._misses += 1
+            value = self._Convert( m )
+            if len(self._cache) >= self._max_entries :
+                self._cache.clear( )
+            self._cache[key] = value
+        else :
+            self._hits += 1
+        self._last_key = key
+        self._last_value = value
+        return value
+
+    def AddStats( self, hits, misses ) :
+        self._hits += hits
+        self._misses += misses
+
+    def FormatStats( self ) :
+        total = self._hits + self._misses
+        return 'hits={} misses={} hit-rate={:.1f}%'.format(
+            self._hits, self._misses, 100.0 * self._hits / max(total, 1) )
+
+
+class IbLogNormalizer( object ) :
+    """
+    IronBee log normalizer: makes time stamps relative (or removes them),
+    removes PIDs and source line numbers, numbers transactions and
+    pointers, and optionally remaps log levels and splits the output into
+    per-transaction files.
+
+    This is the original ("legacy") engine, which runs a separate regex
+    search for each kind of token, on the line as modified so far.
+    """
+    Engine = 'legacy'
+
+    _log_levels = IbLogLevels
+    _log_level_pat = r'(' + r'|'.join(_log_levels) + r')'
+    _rule_log_strings = (
+        'RULE_START',
+        'RULE_END',
+        'TX_START',
+        'TX_END',
+        'REQ_HEADER'
+        'RES_LINE'
+        'REQ_BODY',
+        'RES_HEADER'
+        'RES_LINE',
+        'RES_BODY',
+        'AUDIT',
+        'PHASE',
+        'TFN',
+        'ACTION',
+        'EVENT',
+        'TARGET',
+        'TRUE', 'FALSE', 'ERROR',
+        'OP',
+        )
+
+    _regexs = {
+        'Time1'    : re.compile( r'((\d{4})-(\d{2})-(\d{2})T' \
+                                 r'(\d{2}):(\d{2}):(\d{2})\.(\d{4,})([-\+]\d{4}))' ),
+        'Time2'    : re.compile( r'((\d{4})(\d{2})(\d{2})\.(\d{2})h(\d{2})m(\d{2})s)' ),
+        'PID'      : re.compile( r'\ \[(\d+)\] ' ),
+        'TX'       : re.compile( r'\ \[tx:([a-f0-9\-]{36})\] ' ),
+        'Ptr'      : re.compile( r'(0x[\da-fA-F]+)' ),
+        'Src'      : re.compile( r' (\(\s*([\w\./]+):(\d+\s*)\))' ),
+        'Level'    : re.compile( r' ((' + r'|'.join(_log_levels) + r')\s+ )-' ),
+        'Rule'     : re.compile( r' \[rule:"[\w\-\.\d/]+" rev:\d+\] ' ),
+        'RuleLog'  : re.compile( r'(?: ' + r'|'.join(_rule_log_strings) + r')' ),
+        'PostConf' : re.compile( r'(?: \[tx:[a-f0-9\-]{36}\] |CONN EVENT)' ),
+    }
+
+    def __init__( self, outfile, txfiles=None, time_mode='relative', source='remove-num',
+                  pointer='num', log_remap=None, filter_rules=False, skip_config=True,
+                  quiet=False, time_cache=True, tx_max_open=256 ) :
+        self._outfile = outfile
+        self._txfiles = txfiles
+        self._time = time_mode
+        self._source = source
+        self._pointer = pointer
+        self._log_remap = { } if log_remap is None else log_remap
+        self._filter_rules = filter_rules
+        self._skip_config = skip_config
+        self._quiet = quiet
+        self._lines = 0
+        self._cont = None
+        self._pid = None
+        self._txs = { }
+        self._numtx = 0
+        self._expiry = [ ]
+        self._forget = [ ]
+        self._pool = None if txfiles is None else IbLogHandlePool( tx_max_open )
+        self._ptrs = { }
+        self._starttime = None
+        self._cleantime = None
+        self._config = True
+        self._timecache = IbLogTimeCache( time_cache )
+
+    Lines      = property( lambda self : self._lines )
+    TimeCache  = property( lambda self : self._timecache )
+    HandlePool = property( lambda self : self._pool )
+
+    def _FixPointers( self, line ) :
+        ptrs = self._ptrs
+        while True :
+            m = self._regexs['Ptr'].search( line )
+            if m is None :
+                break
+            ptr = m.group(1)
+            if ptr not in ptrs :
+                ptrs[ptr] = len(ptrs)
+            if self._pointer == 'remove' :
+                line = line.replace( ptr, '' )
+            elif self._pointer == 'zero' :
+                line = line.replace( ptr, '0X0000' )
+            elif self._pointer == 'num' :
+                line = line.replace( ptr, 'PTR-%06x' % ptrs[ptr] )
+        return line
+
+    def _Ignore( self, linenum ) :
+        print >>sys.stderr, "Ignoring line ", linenum
+
+    def _CheckPid( self, pidinfo ) :
+        if self._pid is None :
+            self._pid = pidinfo
+        else :
+            assert self._pid == pidinfo
+
+    def _GetTime( self, m ) :
+        return self._timecache.Seconds( m )
+
+    def _Queue( self, heap, uuid, txdata ) :
+        txdata.SetQueue( heap )
+        heapq.heappush( heap, (txdata.Mtime, txdata.RealNum, uuid) )
+
+    def _Dequeue( self, heap, mtime ) :
+        """ Pop the entries older than mtime, yield the current ones """
+        while heap  and  heap[0][0] < mtime :
+            _, num, uuid = heapq.heappop( heap )
+            txdata = self._txs.get( uuid )
+            if txdata is not None  and  txdata.RealNum == num  and  txdata.Queue is heap :
+                yield uuid, txdata
+
+    def _CleanTxs( self, timefloat ) :
+        """
+        Clean up old transactions every 5 minutes (of log time): close
+        transactions idle for 2 minutes, and forget those idle for an
+        hour.  Open transactions are queued on the expiry heap, closed
+        ones on the forget heap, ordered by their last activity when they
+        were queued; transactions which have been active since are
+        re-queued.  Returns True if the clean up ran.
+        """
+        if self._cleantime is None :
+            self._cleantime = timefloat + (5 * 60)
+            return False
+        elif timefloat < self._cleantime :
+            return False
+        self._cleantime = timefloat + (5 * 60)
+        clean_mtime = timefloat - (60 * 60)
+        close_mtime = timefloat -  (2 * 60)
+        for uuid, txdata in self._Dequeue( self._expiry, close_mtime ) :
+            if txdata.Mtime >= close_mtime :
+                self._Queue( self._expiry, uuid, txdata )
+            else :
+                txdata.Close( )
+                self._Queue( self._forget, uuid, txdata )
+        for uuid, txdata in self._Dequeue( self._forget, clean_mtime ) :
+            if txdata.Mtime >= clean_mtime :
+                self._Queue( self._expiry, uuid, txdata )
+            else :
+                del self._txs[uuid]
+        return True
+
+    def _FixTx( self, line, uuid, txdata, timefloat ) :
+        """ Number the transaction; returns the line and tx data """
+        if txdata is None :
+            if self._txfiles is None :
+                txdata = IbLogTxData(self._numtx, self._numtx, timefloat, fh=self._outfile)
+            else :
+                path = self._txfiles.format( self._numtx )
+                txdata = IbLogTxData.Create(0, self._numtx, timefloat, path, self._pool)
+                if not self._quiet :
+                    print "Created tx file", path, "for transaction", self._numtx
+            self._txs[uuid] = txdata
+            self._Queue( self._expiry, uuid, txdata )
+            self._numtx += 1
+        elif not txdata.IsOpen :
+            txdata.Touch( timefloat )
+            txdata.ReOpen( )
+            if txdata.Queue is not self._expiry :
+                self._Queue( self._expiry, uuid, txdata )
+            if not self._quiet :
+                print "Re-opened tx file", txdata.Path, "for transaction", txdata.RealNum
+        else :
+            txdata.Touch( timefloat )
+        if txdata is not None :
+            new = '{:05d}'.format(txdata.Num)
+            line = line.replace( uuid, new )
+        return line, txdata
+
+    def _Write( self, line, txdata ) :
+        if txdata is None :
+            print >>self._outfile, line
+        else :
+            print >>txdata.Handle, line
+            if "TX DESTROY" in line :
+                txdata.Close( )
+
+    def NormalizeLine( self, line ) :
+        self._lines += 1
+        line = line.rstrip()
+        linenum = self._lines
+        timefloat = 0.0
+        txs = self._txs
+
+        if 'CONFIG Passing "' in line  and  line.count( '"' ) % 2 :
+            self._cont = line
+            return
+        elif self._cont is not None :
+            assert line.startswith( '"' )
+            line = self._cont + line
+            linenum -= 1
+            self._cont = None
+
+        if self._config  and  self._regexs['PostConf'].search( line ) :
+            self._config = False
+        if self._skip_config  and  self._config :
+            return
+
+        try :
+            uuid = self._regexs['TX'].search( line ).group(1)
+            txdata = txs.get(uuid)
+        except AttributeError as e :
+            uuid = None
+            txdata = None
+
+        # Fixup time stamp
+        try :
+            m = self._regexs['Time1'].match( line )
+            if m is None :
+                m = self._regexs['Time2'].match( line )
+            if m is None :
+                self._Ignore( linenum )
+                return
+            timestr = m.group(1)
+            timefloat = self._GetTime( m )
+            try :
+                timefloat += float('0.'+m.group(8))
+            except IndexError :
+                pass
+            if self._starttime is None :
+                self._starttime = timefloat
+            if self._time == 'relative' :
+                line = line.replace(timestr, '%012.6f' % (timefloat - self._starttime) )
+            elif self._time == 'relative-tx' :
+                if uuid is None :
+                    txstart = self._starttime
+                elif txdata is None :
+                    txstart = timefloat
+                else :
+                    txstart = txdata.Mtime
+                line = line.replace(timestr, '%012.6f' % (timefloat - txstart) )
+            elif self._time == 'remove' :
+                line = line.replace(timestr+' ', '')
+        except AttributeError as e :
+            self._Ignore( linenum )
+            return
+
+        # Filter vebose rule logging
+        if self._filter_rules  and  self._regexs['Rule'].search( line ) :
+            if not self._regexs['RuleLog'].search( line ) :
+                return
+
+        # Clean up old transactions
+        if timefloat is not None :
+            if self._CleanTxs( timefloat )  and  uuid is not None :
+                txdata = txs.get( uuid )
+
+        # Fixup log levels
+        m = self._regexs['Level'].search( line )
+        if m is not None :
+            level = m.group(2)
+            slen = len(m.group(1))
+            new = self._log_remap.get(level)
+            if new is not None :
+                while len(new) <= slen :
+                    new += ' '
+                line = line.replace( level, new )
+
+        # Fixup PID
+        try :
+            pidinfo  = self._regexs['PID'].search( line ).group(1)
+            line = line.replace( ' ['+pidinfo+']', '' )
+            self._CheckPid( pidinfo )
+            line = line.replace( ' ['+pidinfo+']', '' )
+        except AttributeError :
+            pass
+
+        # Fixup source
+        if self._source != 'leave' :
+            m = self._regexs['Src'].search( line )
+            if m is not None :
+                old = m.group(1) if self._source == 'remove' else m.group(3)
+                line = line.replace( old, '' )
+
+        # Fixup TX UUID
+        if uuid is not None :
+            line, txdata = self._FixTx( line, uuid, txdata, timefloat )
+
+        # Fixup pointers
+        if self._pointer != 'leave' :
+            line = self._FixPointers( line )
+
+        # Write out the modified line
+        self._Write( line, txdata )
+
+    def Normalize( self, infile ) :
+        for line in infile :
+            self.NormalizeLine( line )
+
+    def Close( self ) :
+        for txdata in self._txs.values( ) :
+            txdata.Close( )
+        if self._pool is not None :
+            self._pool.CloseAll( )
+
+
+class IbLogNormalizerFast( IbLogNormalizer ) :
+    """
+    Normalizer engine for the usual line layout: the time stamp is
+    followed by the PID, TX, rule, level and source tokens (some of them
+    optional), so a single match finds the first occurrence of each, and
+    all pointers are rewritten from one scan.  Lines with another layout,
+    or where the legacy engine's line-wide replacements could create or
+    destroy tokens, are handed to the legacy engine, so the output is
+    identical.
+    """
+    Engine = 'fast'
+
+    # Tokens start with a space; trailing context is a look-ahead, so the
+    # next token can start with it
+    _prefix_re = re.compile(
+        r'(?: \[(?P<pid>\d+)\](?= ))?'
+        r'(?: \[tx:(?P<tx>[a-f0-9\-]{36})\](?= ))?'
+        r'(?: \[rule:"[\w\-\.\d/]+" rev:\d+\](?= ))?'
+        r' (?P<lvall>(?P<level>' + r'|'.join(IbLogLevels) + r')\s+ )-'
+        r'(?: (?P<src>\(\s*[\w\./]+:(?P<num>\d+\s*)\)))?' )
+
+    def _FixPointers( self, line ) :
+        if '0x' not in line  or  self._pointer == 'remove' :
+            return IbLogNormalizer._FixPointers( self, line )
+        ptr_re = self._regexs['Ptr']
+        tokens = ptr_re.findall( line )
+        found = [ ]
+        for ptr in tokens :
+            if ptr not in found :
+                # Replacing a pointer which also occurs elsewhere (i.e. as
+                # the prefix of another pointer) would change the others
+                if line.count( ptr ) != tokens.count( ptr ) :
+                    return IbLogNormalizer._FixPointers( self, line )
+                found.append( ptr )
+        ptrs = self._ptrs
+        new = { }
+        fixed = line
+        for ptr in found :
+            num = ptrs.get( ptr )
+            if num is None :
+                num = new[ptr] = len(ptrs) + len(new)
+            if self._pointer == 'zero' :
+                fixed = fixed.replace( ptr, '0X0000' )
+            else :
+                fixed = fixed.replace( ptr, 'PTR-%06x' % num )
+        # A replacement followed by "x<hex>" makes a new pointer
+        if ptr_re.search( fixed ) is not None :
+            return IbLogNormalizer._FixPointers( self, line )
+        ptrs.update( new )
+        return fixed
+
+    def NormalizeLine( self, line ) :
+        # Configuration, continuations and time stamp removal (which
+        # destroys the space starting the first token) go the legacy way
+        if self._config  or  self._cont is not None  or  self._time == 'remove'  or  \
+           'CONFIG Passing "' in line :
+            return IbLogNormalizer.NormalizeLine( self, line )
+        stripped = line.rstrip()
+        m = self._regexs['Time1'].match( stripped )
+        if m is None :
+            return IbLogNormalizer.NormalizeLine( self, line )
+        p = self._prefix_re.match( stripped, m.end() )
+        if p is None :
+            return IbLogNormalizer.NormalizeLine( self, line )
+        timestr = m.group(1)
+        # Replacing a time stamp, level or PID which occurs more than once
+        # could create or destroy other tokens
+        if stripped.count( timestr ) != 1 :
+            return IbLogNormalizer.NormalizeLine( self, line )
+        level = p.group('level')
+        new = self._log_remap.get(level)
+        if new is not None  and  stripped.count( level ) != 1 :
+            return IbLogNormalizer.NormalizeLine( self, line )
+        pidinfo = p.group('pid')
+        if pidinfo is not None  and  \
+           0 <= stripped.find( '(' ) < stripped.rfind( ' ['+pidinfo+']' ) :
+            return IbLogNormalizer.NormalizeLine( self, line )
+
+        self._lines += 1
+        line = stripped
+        txs = self._txs
+        uuid = p.group('tx')
+        if uuid is None :
+            tx = self._regexs['TX'].search( line )
+            if tx is not None :
+                uuid = tx.group(1)
+        txdata = None if uuid is None else txs.get(uuid)
+
+        # Fixup time stamp
+        timefloat = self._GetTime( m ) + float('0.'+m.group(8))
+        if self._starttime is None :
+            self._starttime = timefloat
+        if self._time == 'relative' :
+            line = line.replace(timestr, '%012.6f' % (timefloat - self._starttime) )
+        elif self._time == 'relative-tx' :
+            if uuid is None :
+                txstart = self._starttime
+            elif txdata is None :
+                txstart = timefloat
+            else :
+                txstart = txdata.Mtime
+            line = line.replace(timestr, '%012.6f' % (timefloat - txstart) )
+
+        # Filter vebose rule logging
+        if self._filter_rules  and  self._regexs['Rule'].search( line ) :
+            if not self._regexs['RuleLog'].search( line ) :
+                return
+
+        # Clean up old transactions
+        if self._CleanTxs( timefloat )  and  uuid is not None :
+            txdata = txs.get( uuid )
+
+        # Fixup log levels
+        if new is not None :
+            slen = len(p.group('lvall'))
+            while len(new) <= slen :
+                new += ' '
+            line = line.replace( level, new )
+
+        # Fixup PID; if it's not in the usual place, search for it, and
+        # for the source, as the legacy engine does
+        src = p.group('src')
+        if pidinfo is None :
+            pid = self._regexs['PID'].search( line )
+            if pid is not None :
+                pidinfo = pid.group(1)
+                src = None
+        if pidinfo is not None :
+            line = line.replace( ' ['+pidinfo+']', '' )
+            self._CheckPid( pidinfo )
+            line = line.replace( ' ['+pidinfo+']', '' )
+
+        # Fixup source
+        if self._source != 'leave' :
+            if src is not None :
+                old = src if self._source == 'remove' else p.group('num')
+                line = line.replace( old, '' )
+            else :
+                s = self._regexs['Src'].search( line )
+                if s is not None :
+                    old = s.group(1) if self._source == 'remove' else s.group(3)
+                    line = line.replace( old, '' )
+
+        # Fixup TX UUID
+        if uuid is not None :
+            line, txdata = self._FixTx( line, uuid, txdata, timefloat )
+
+        # Fixup pointers
+        if self._pointer != 'leave' :
+            line = self._FixPointers( line )
+
+        self._Write( line, txdata )
+
+IbLogNormalizerEngines = {
+    'legacy' : IbLogNormalizer,
+    'fast'   : IbLogNormalizerFast,
+}
+
+class IbModule_util_log_normalizer( object ) :
+    modulePath = __file__
+
+if __name__ == "__main__" :
+    assert False, "not stand-alone"
+
+### Local Variables: ***
+### py-indent-offset:4 ***
+### python-indent:4 ***
+### python-continuation-offset:4 ***
+### tab-width:4  ***
+### End: ***
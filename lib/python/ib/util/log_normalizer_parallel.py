@@ -0,0 +1,246 @@
+#! /usr/bin/env python
+# ****************************************************************************
+# Licensed to Qualys, Inc. (QUALYS) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# QUALYS licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ****************************************************************************
+import os
+import stat
+import collections
+import multiprocessing
+
+from ib.util.log_normalizer import *
+
+class _IbLogChunkMixin( object ) :
+    """
+    Chunk worker mix-in for a normalizer engine: runs the engine's text
+    transformations on the lines of a chunk, but leaves the steps which
+    depend on state from earlier chunks (transaction clean up and
+    numbering, pointer numbering, the PID check) to the parent, recording
+    what it needs instead.  Continuation lines, which may span chunks,
+    are left to the parent as well.
+    """
+    def __init__( self, starttime, **kwargs ) :
+        super(_IbLogChunkMixin, self).__init__( None, **kwargs )
+        self._config = False
+        self._starttime = starttime
+
+    def _Ignore( self, linenum ) :
+        self._ignored = True
+
+    def _CheckPid( self, pidinfo ) :
+        self._pidinfo = pidinfo
+
+    def _CleanTxs( self, timefloat ) :
+        self._timefloat = timefloat
+        return None
+
+    def _FixTx( self, line, uuid, txdata, timefloat ) :
+        self._uuid = uuid
+        return line, None
+
+    def _FixPointers( self, line ) :
+        return line
+
+    def _Write( self, line, txdata ) :
+        self._written = line
+
+    def _Record( self, line ) :
+        self._ignored = False
+        self._pidinfo = None
+        self._timefloat = None
+        self._uuid = None
+        self._written = None
+        self.NormalizeLine( line )
+        if self._written is not None :
+            return ( 'line', line, self._written, self._uuid, self._timefloat, self._pidinfo )
+        elif self._ignored :
+            return ( 'ignore', line )
+        else :
+            return ( 'skip', line )
+
+    def NormalizeChunk( self, path, start, end ) :
+        """ Returns one record per line of the chunk [start, end) """
+        records = [ ]
+        raw = False
+        with open( path ) as fp :
+            fp.seek( start )
+            pos = start
+            while pos < end :
+                line = fp.readline( )
+                if line == '' :
+                    break
+                # A chunk may start with the end of a continued line
+                if pos == start  and  line.startswith( '"' ) :
+                    raw = True
+                pos += len( line )
+                if 'CONFIG Passing "' in line  and  line.count( '"' ) % 2 :
+                    records.append( ( 'raw', line ) )
+                    raw = True
+                elif raw :
+                    records.append( ( 'raw', line ) )
+                    raw = False
+                else :
+                    records.append( self._Record(line) )
+        return records
+
+_chunk_classes = { }
+def _NormalizeChunk( args ) :
+    path, start, end, engine, starttime, kwargs = args
+    cls = _chunk_classes.get( engine )
+    if cls is None :
+        cls = type( '_IbLogChunk_'+engine, (_IbLogChunkMixin, IbLogNormalizerEngines[engine]), { } )
+        _chunk_classes[engine] = cls
+    worker = cls( starttime, **kwargs )
+    records = worker.NormalizeChunk( path, start, end )
+    return records, worker.TimeCache.Hits, worker.TimeCache.Misses
+
+
+class IbLogParallelNormalizer( object ) :
+    """
+    Normalize a log file with jobs worker processes.  After the
+    configuration section is normalized serially, the rest of the file is
+    split at line boundaries into chunks of about chunk_size bytes, which
+    the workers normalize without knowledge of the earlier chunks; only a
+    few chunks per worker are in flight at a time, so memory use doesn't
+    grow with the size of the log.  The results are merged in order, and
+    the parent reconciles the shared state: it numbers transactions and
+    pointers from the global tables, checks the PID, and re-normalizes the
+    lines which the workers can't (continuations and lines which trigger
+    transaction clean up) itself.
+
+    Inputs which aren't named regular files (the workers re-open the file
+    by name), small files and relative-tx time stamps (which depend on
+    per-transaction state) are normalized serially.
+    """
+    def __init__( self, engine, outfile, jobs=None, chunk_size=4*1024*1024,
+                  txfiles=None, **kwargs ) :
+        self._engine = engine
+        self._jobs = multiprocessing.cpu_count() if jobs is None else jobs
+        self._chunk_size = max( chunk_size, 1 )
+        self._kwargs = kwargs
+        self._normalizer = IbLogNormalizerEngines[engine]( outfile, txfiles=txfiles, **kwargs )
+        self._chunks = 0
+        self._serial = 0
+
+    Lines      = property( lambda self : self._normalizer.Lines )
+    TimeCache  = property( lambda self : self._normalizer.TimeCache )
+    HandlePool = property( lambda self : self._normalizer.HandlePool )
+    Chunks     = property( lambda self : self._chunks )
+
+    def FormatStats( self ) :
+        return 'chunks={} serial-lines={}'.format( self._chunks, self._serial )
+
+    def _CanSplit( self, infile ) :
+        if self._jobs <= 1  or  self._kwargs.get('time_mode') == 'relative-tx' :
+            return False
+        # Only plain files can be split; not pipes or decompressing readers.
+        # The workers open the file by name, so that has to name it, too
+        # (which stdin redirected from a file doesn't)
+        if not isinstance( infile, file ) :
+            return False
+        try :
+            st = os.fstat( infile.fileno() )
+            named = os.stat( infile.name )
+        except (AttributeError, ValueError, TypeError, OSError) :
+            return False
+        return stat.S_ISREG( st.st_mode )  and  \
+            (st.st_dev, st.st_ino) == (named.st_dev, named.st_ino)
+
+    def _Merge( self, records ) :
+        n = self._normalizer
+        for rec in records :
+            kind = rec[0]
+            if n._cont is not None  or  kind == 'raw' :
+                pass
+            elif kind == 'line' :
+                text, uuid, timefloat, pidinfo = rec[2:]
+                if n._cleantime is not None  and  timefloat < n._cleantime :
+                    n._lines += 1
+                    if pidinfo is not None :
+                        n._CheckPid( pidinfo )
+                    txdata = None
+                    if uuid is not None :
+                        text, txdata = n._FixTx( text, uuid, n._txs.get(uuid), timefloat )
+                    if n._pointer != 'leave' :
+                        text = n._FixPointers( text )
+                    n._Write( text, txdata )
+                    continue
+            elif kind == 'ignore' :
+                n._lines += 1
+                n._Ignore( n._lines )
+                continue
+            else :
+                n._lines += 1
+                continue
+            self._serial += 1
+            n.NormalizeLine( rec[1] )
+
+    def Normalize( self, infile ) :
+        n = self._normalizer
+        if not self._CanSplit( infile ) :
+            n.Normalize( infile )
+            return
+
+        # The configuration section and the start time are global state
+        while n._config  or  n._starttime is None  or  n._cont is not None :
+            line = infile.readline( )
+            if line == '' :
+                return
+            self._serial += 1
+            n.NormalizeLine( line )
+
+        start = infile.tell( )
+        size = os.fstat( infile.fileno() ).st_size
+        if size - start < 2 * self._chunk_size :
+            for line in infile :
+                self._serial += 1
+                n.NormalizeLine( line )
+            return
+        kwargs = dict( self._kwargs, quiet=True )
+        pool = multiprocessing.Pool( self._jobs )
+        pending = collections.deque( )
+        try :
+            while start < size  or  pending :
+                while start < size  and  len(pending) < 2 * self._jobs :
+                    infile.seek( min(start + self._chunk_size, size) - 1 )
+                    infile.readline( )
+                    end = min( infile.tell(), size )
+                    args = (infile.name, start, end, self._engine, n._starttime, kwargs)
+                    pending.append( pool.apply_async(_NormalizeChunk, (args,)) )
+                    self._chunks += 1
+                    start = end
+                records, hits, misses = pending.popleft().get( )
+                n.TimeCache.AddStats( hits, misses )
+                self._Merge( records )
+        finally :
+            pool.terminate( )
+            pool.join( )
+        infile.seek( size )
+
+    def Close( self ) :
+        self._normalizer.Close( )
+
+class IbModule_util_log_normalizer_parallel( object ) :
+    modulePath = __file__
+
+if __name__ == "__main__" :
+    assert False, "not stand-alone"
+
+### Local Variables: ***
+### py-indent-offset:4 ***
+### python-indent:4 ***
+### python-continuation-offset:4 ***
+### tab-width:4  ***
+### End: ***
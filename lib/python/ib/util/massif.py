@@ -0,0 +1,209 @@
+#! /usr/bin/env python
+# ****************************************************************************
+# Licensed to Qualys, Inc. (QUALYS) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# QUALYS licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ****************************************************************************
+import re
+import os
+import sys
+
+class IbMassifException( BaseException ) : pass
+class IbMassifParseError( IbMassifException ) : pass
+
+class IbMassifNode( object ) :
+    """ Node of a massif allocation tree """
+    __slots__ = ( 'Bytes', 'Desc', 'Children' )
+    def __init__( self, nbytes, desc ) :
+        self.Bytes = nbytes
+        self.Desc = desc
+        self.Children = [ ]
+
+class IbMassifSnapshot( object ) :
+    __slots__ = ( 'Index', 'Time', 'Heap', 'HeapExtra', 'Stacks', 'TreeKind' )
+    def __init__( self, index ) :
+        self.Index = index
+        self.Time = 0
+        self.Heap = 0
+        self.HeapExtra = 0
+        self.Stacks = 0
+        self.TreeKind = 'empty'
+    Total = property( lambda self : self.Heap + self.HeapExtra + self.Stacks )
+
+class IbMassifProfile( object ) :
+    """
+    Parser for massif.out files.  All snapshots are kept (they're small);
+    only the allocation tree of the peak snapshot is kept, so memory use
+    doesn't depend on the number of detailed snapshots.
+    """
+    _node_re = re.compile( r'( *)n(\d+): (\d+) (.*)$' )
+    _snapshot_fields = { 'time'             : 'Time',
+                         'mem_heap_B'       : 'Heap',
+                         'mem_heap_extra_B' : 'HeapExtra',
+                         'mem_stacks_B'     : 'Stacks' }
+
+    def __init__( self, path=None ) :
+        self._path = path
+        self._header = { }
+        self._snapshots = [ ]
+        self._peak = None
+        self._peak_tree = None
+        if path is not None :
+            self.ParseFile( path )
+
+    Path      = property( lambda self : self._path )
+    Header    = property( lambda self : dict(self._header) )
+    Command   = property( lambda self : self._header.get('cmd') )
+    TimeUnit  = property( lambda self : self._header.get('time_unit', 'i') )
+    Snapshots = property( lambda self : list(self._snapshots) )
+    PeakTree  = property( lambda self : self._peak_tree )
+
+    def _GetPeak( self ) :
+        if self._peak is not None :
+            return self._peak
+        if len(self._snapshots) == 0 :
+            return None
+        return max( self._snapshots, key=lambda s : s.Heap + s.HeapExtra )
+    Peak = property( _GetPeak )
+
+    def ParseFile( self, path ) :
+        self._path = path
+        if path == '-' :
+            self.Parse( sys.stdin )
+        else :
+            with open( path ) as fp :
+                self.Parse( fp )
+
+    def Parse( self, lines ) :
+        snapshot = None
+        stack = None
+        tree = None
+        for lineno, line in enumerate( lines, 1 ) :
+            line = line.rstrip( '\n' )
+            if line == ''  or  line.startswith( '#' ) :
+                continue
+            if stack is not None :
+                m = self._node_re.match( line )
+                if m is not None :
+                    node = IbMassifNode( int(m.group(3)), m.group(4) )
+                    depth = len( m.group(1) )
+                    del stack[depth:]
+                    if depth == 0 :
+                        tree = node
+                    elif len(stack) == depth :
+                        stack[-1].Children.append( node )
+                    else :
+                        raise IbMassifParseError( 'Line {}: bad tree depth'.format(lineno) )
+                    stack.append( node )
+                    continue
+                if snapshot.TreeKind == 'peak' :
+                    self._peak_tree = tree
+                stack = None
+                tree = None
+            name, sep, value = line.partition( '=' )
+            if sep  and  ':' not in name :
+                if name == 'snapshot' :
+                    snapshot = IbMassifSnapshot( int(value) )
+                    self._snapshots.append( snapshot )
+                elif snapshot is None :
+                    raise IbMassifParseError( 'Line {}: "{}" outside of a snapshot'.format(lineno, name) )
+                elif name == 'heap_tree' :
+                    snapshot.TreeKind = value
+                    if value == 'peak' :
+                        self._peak = snapshot
+                    if value in ( 'peak', 'detailed' ) :
+                        stack = [ ]
+                elif name in self._snapshot_fields :
+                    setattr( snapshot, self._snapshot_fields[name], int(value) )
+                continue
+            name, sep, value = line.partition( ':' )
+            if sep :
+                self._header[name] = value.strip( )
+            else :
+                raise IbMassifParseError( 'Line {}: unrecognized line "{}"'.format(lineno, line) )
+        if stack is not None  and  snapshot.TreeKind == 'peak' :
+            self._peak_tree = tree
+
+    def FormatTree( self, depth=4, threshold=1.0 ) :
+        """ Format the peak allocation tree, down to depth levels """
+        lines = [ ]
+        if self._peak_tree is None :
+            return lines
+        total = self._peak_tree.Bytes or 1
+        def Walk( node, level ) :
+            pct = 100.0 * node.Bytes / total
+            if level > 0  and  pct < threshold :
+                return
+            lines.append( '{:>12d} {:6.2f}%  {}{}'.format(node.Bytes, pct, '  '*level, node.Desc) )
+            if level < depth :
+                for child in sorted( node.Children, key=lambda n : -n.Bytes ) :
+                    Walk( child, level+1 )
+        Walk( self._peak_tree, 0 )
+        return lines
+
+    def TopSites( self, top=10 ) :
+        """
+        Return the top allocation sites at peak: ( bytes, desc ) for the
+        direct callers of the allocation functions.
+        """
+        if self._peak_tree is None :
+            return [ ]
+        sites = sorted( self._peak_tree.Children, key=lambda n : -n.Bytes )
+        return [ (n.Bytes, n.Desc) for n in sites[:top] ]
+
+    def FormatSummary( self, top=10, depth=4, threshold=1.0, tree=True ) :
+        lines = [ ]
+        if self.Command is not None :
+            lines.append( 'Command: {}'.format(self.Command) )
+        peak = self.Peak
+        if peak is None :
+            lines.append( 'No snapshots' )
+            return lines
+        final = self._snapshots[-1]
+        lines.append( '{} snapshots, time unit "{}"'.format(len(self._snapshots), self.TimeUnit) )
+        lines.append( 'Peak:  snapshot {} at {}: heap {} B, extra {} B, stacks {} B'.format(
+            peak.Index, peak.Time, peak.Heap, peak.HeapExtra, peak.Stacks) )
+        lines.append( 'Final: snapshot {} at {}: heap {} B, extra {} B, stacks {} B'.format(
+            final.Index, final.Time, final.Heap, final.HeapExtra, final.Stacks) )
+        sites = self.TopSites( top )
+        if len(sites) :
+            lines.append( '' )
+            lines.append( 'Top {} allocation sites at peak:'.format(top) )
+            for nbytes, desc in sites :
+                lines.append( '  {:>12d} {:6.2f}%  {}'.format(nbytes, 100.0 * nbytes / (peak.Heap or 1), desc) )
+        if tree  and  self._peak_tree is not None :
+            lines.append( '' )
+            lines.append( 'Allocation tree at peak:' )
+            lines += self.FormatTree( depth, threshold )
+        return lines
+
+    def WriteCsv( self, fp ) :
+        """ Write heap usage over time as CSV """
+        print >>fp, 'snapshot,time,heap,heap_extra,stacks,total,tree'
+        for s in self._snapshots :
+            print >>fp, '{},{},{},{},{},{},{}'.format(
+                s.Index, s.Time, s.Heap, s.HeapExtra, s.Stacks, s.Total, s.TreeKind )
+
+class IbModule_util_massif( object ) :
+    modulePath = __file__
+
+if __name__ == "__main__" :
+    assert False, "not stand-alone"
+
+### Local Variables: ***
+### py-indent-offset:4 ***
+### python-indent:4 ***
+### python-continuation-offset:4 ***
+### tab-width:4  ***
+### End: ***
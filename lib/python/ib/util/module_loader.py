@@ -0,0 +1,154 @@
+#! /usr/bin/env python
+# ****************************************************************************
+# Licensed to Qualys, Inc. (QUALYS) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# QUALYS licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ****************************************************************************
+import os
+import sys
+import imp
+import marshal
+import hashlib
+
+class IbModuleLoaderException( BaseException ) : pass
+
+class IbModuleLoader( object ) :
+    """
+    Load Python source modules by name from a search path, keeping the
+    compiled code objects in a cache directory (marshal'ed, keyed by the
+    source path and its stat identity) and the loaded modules in a
+    process-wide registry.  A module whose source hasn't changed is
+    neither recompiled nor re-executed.
+    """
+    _registry = { }
+    _suffix = '.ibc'
+
+    def __init__( self, cache_dir=None, verbose=0 ) :
+        self._cache_dir = cache_dir
+        self._verbose = verbose
+        self.ResetStats( )
+
+    CacheDir = property( lambda self : self._cache_dir )
+    Stats    = property( lambda self : dict(self._stats) )
+
+    def ResetStats( self ) :
+        self._stats = dict.fromkeys( ('registry', 'cached', 'compiled', 'cache_errors'), 0 )
+
+    def FormatStats( self ) :
+        return ', '.join( [ '{}={}'.format(k, self._stats[k]) for k in sorted(self._stats) ] )
+
+    @staticmethod
+    def FindSource( name, path=None ) :
+        """ Find the source file for module name in path (or sys.path) """
+        for d in ( sys.path if path is None else path ) :
+            full = os.path.join( d or '.', name+'.py' )
+            if os.path.isfile( full ) :
+                return os.path.realpath( full )
+        raise ImportError( 'No module named '+name )
+
+    @staticmethod
+    def _Identity( st ) :
+        return ( st.st_dev, st.st_ino, st.st_size, st.st_mtime )
+
+    def _CachePath( self, source ) :
+        digest = hashlib.md5( source ).hexdigest()[:16]
+        base = os.path.splitext( os.path.basename(source) )[0]
+        return os.path.join( self._cache_dir, '{}-{}{}'.format(base, digest, self._suffix) )
+
+    def _ReadCache( self, source, ident ) :
+        if self._cache_dir is None :
+            return None
+        try :
+            with open( self._CachePath(source), 'rb' ) as fp :
+                if fp.read( len(imp.get_magic()) ) != imp.get_magic() :
+                    return None
+                cached_source, cached_ident, code = marshal.load( fp )
+        except (IOError, OSError, EOFError, ValueError, TypeError) :
+            return None
+        if cached_source != source  or  tuple(cached_ident) != ident :
+            return None
+        return code
+
+    def _WriteCache( self, source, ident, code ) :
+        if self._cache_dir is None :
+            return
+        path = self._CachePath( source )
+        tmp = '{}.{}'.format( path, os.getpid() )
+        try :
+            if not os.path.isdir( self._cache_dir ) :
+                os.makedirs( self._cache_dir )
+            with open( tmp, 'wb' ) as fp :
+                fp.write( imp.get_magic() )
+                marshal.dump( (source, ident, code), fp )
+            os.rename( tmp, path )
+        except (IOError, OSError) as e :
+            self._stats['cache_errors'] += 1
+            if self._verbose :
+                print >>sys.stderr, 'Failed to write code cache "{}": {}'.format( path, e )
+            if os.path.exists( tmp ) :
+                os.unlink( tmp )
+
+    def _GetCode( self, source, ident ) :
+        code = self._ReadCache( source, ident )
+        if code is not None :
+            self._stats['cached'] += 1
+            return code
+        with open( source, 'rU' ) as fp :
+            text = fp.read( )
+        try :
+            code = compile( text, source, 'exec' )
+        except SyntaxError as e :
+            raise ImportError( 'Error compiling "{}": {}'.format(source, e) )
+        self._stats['compiled'] += 1
+        self._WriteCache( source, ident, code )
+        return code
+
+    def Load( self, name, path=None ) :
+        """
+        Load module name, found in path.  Returns the registered module if
+        its source is unchanged since it was last loaded.
+        """
+        source = self.FindSource( name, path )
+        ident = self._Identity( os.stat(source) )
+        try :
+            mod, mod_ident = self._registry[source]
+            if mod_ident == ident :
+                self._stats['registry'] += 1
+                return mod
+        except KeyError :
+            pass
+        code = self._GetCode( source, ident )
+        mod = imp.new_module( name )
+        mod.__file__ = source
+        sys.modules[name] = mod
+        try :
+            exec code in mod.__dict__
+        except :
+            del sys.modules[name]
+            raise
+        self._registry[source] = ( mod, ident )
+        return mod
+
+class IbModule_util_module_loader( object ) :
+    modulePath = __file__
+
+if __name__ == "__main__" :
+    assert False, "not stand-alone"
+
+### Local Variables: ***
+### py-indent-offset:4 ***
+### python-indent:4 ***
+### python-continuation-offset:4 ***
+### tab-width:4  ***
+### End: ***
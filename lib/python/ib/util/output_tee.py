@@ -0,0 +1,141 @@
+#! /usr/bin/env python
+# ****************************************************************************
+# Licensed to Qualys, Inc. (QUALYS) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# QUALYS licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ****************************************************************************
+import re
+import sys
+import threading
+
+IbLogLevels = (
+    'EMERGENCY',
+    'ALERT',
+    'CRITICAL',
+    'ERROR',
+    'WARNING',
+    'NOTICE',
+    'INFO',
+    'DEBUG',
+    'DEBUG2',
+    'DEBUG3',
+    'TRACE')
+
+class IbLogLineFilter( object ) :
+    """
+    Filter IronBee log lines by log level and include / exclude patterns.
+    Excludes win over includes, and includes win over the level; lines
+    without a log level are only subject to the patterns.
+    """
+    _level_re = re.compile( r' ((' + r'|'.join(IbLogLevels) + r')\s+ )-' )
+
+    def __init__( self, max_level=None, include=None, exclude=None ) :
+        assert max_level is None or max_level in IbLogLevels
+        self._max_level = None if max_level is None else IbLogLevels.index( max_level )
+        self._include = self._Compile( include )
+        self._exclude = self._Compile( exclude )
+
+    @staticmethod
+    def _Compile( patterns ) :
+        if not patterns :
+            return None
+        return re.compile( '|'.join(['(?:'+pat+')' for pat in patterns]) )
+
+    Active = property( lambda self : self._max_level is not None  or
+                       self._include is not None  or  self._exclude is not None )
+
+    def Accept( self, line ) :
+        if self._exclude is not None  and  self._exclude.search( line ) :
+            return False
+        if self._include is not None  and  self._include.search( line ) :
+            return True
+        if self._max_level is not None :
+            m = self._level_re.search( line )
+            if m is not None  and  IbLogLevels.index( m.group(2) ) > self._max_level :
+                return False
+        return True
+
+class _TeeStream( threading.Thread ) :
+    def __init__( self, tee, name, pipe, outfp, console ) :
+        threading.Thread.__init__( self, name='ib-tee-'+name )
+        self.daemon = True
+        self._tee = tee
+        self._pipe = pipe
+        self._outfp = outfp
+        self._console = console
+        self.Stream = name
+        self.Lines = 0
+        self.Bytes = 0
+        self.Filtered = 0
+
+    def run( self ) :
+        accept = self._tee.Filter.Accept
+        # readline() rather than iteration, which reads ahead in large blocks
+        for line in iter( self._pipe.readline, '' ) :
+            self.Lines += 1
+            self.Bytes += len(line)
+            if not accept( line ) :
+                self.Filtered += 1
+                continue
+            if self._outfp is not None :
+                self._outfp.write( line )
+            if self._console is not None :
+                self._tee.WriteConsole( self._console, line )
+        self._pipe.close( )
+
+class IbOutputTee( object ) :
+    """
+    Drain a child's output pipes with one reader thread per pipe, so the
+    child never stalls on a full pipe, copying the lines which pass the
+    filter to an output file (possibly compressed) and / or the console.
+    """
+    def __init__( self, line_filter=None ) :
+        self._filter = IbLogLineFilter( ) if line_filter is None else line_filter
+        self._lock = threading.Lock( )
+        self._streams = [ ]
+
+    Filter = property( lambda self : self._filter )
+
+    def AddStream( self, name, pipe, outfp=None, console=None ) :
+        self._streams.append( _TeeStream(self, name, pipe, outfp, console) )
+
+    def WriteConsole( self, console, line ) :
+        with self._lock :
+            console.write( line )
+            console.flush( )
+
+    def Start( self ) :
+        for stream in self._streams :
+            stream.start( )
+
+    def Join( self ) :
+        for stream in self._streams :
+            stream.join( )
+
+    def FormatStats( self ) :
+        return [ '{}: {} lines, {} bytes, {} filtered'.format(
+                    s.Stream, s.Lines, s.Bytes, s.Filtered) for s in self._streams ]
+
+class IbModule_util_output_tee( object ) :
+    modulePath = __file__
+
+if __name__ == "__main__" :
+    assert False, "not stand-alone"
+
+### Local Variables: ***
+### py-indent-offset:4 ***
+### python-indent:4 ***
+### python-continuation-offset:4 ***
+### tab-width:4  ***
+### End: ***
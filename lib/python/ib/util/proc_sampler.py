@@ -0,0 +1,179 @@
+#! /usr/bin/env python
+# ****************************************************************************
+# Licensed to Qualys, Inc. (QUALYS) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# QUALYS licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ****************************************************************************
+import os
+import sys
+import time
+import threading
+
+class IbProcSampler( threading.Thread ) :
+    """
+    Background thread which samples a process' resource usage from
+    /proc/<pid>/{stat,status,io,fd} at a fixed interval.  Samples are
+    optionally written as a tab separated time series; only running peak /
+    total values are kept in memory, for a summary once sampling stops.
+    """
+    Columns = ( 'time', 'cpu_pct', 'rss_kb', 'threads', 'fds',
+                'vol_csw', 'invol_csw', 'read_kb', 'write_kb' )
+    _summary_columns = Columns[1:]
+    _status_fields = { 'VmRSS'                      : 'rss_kb',
+                       'Threads'                    : 'threads',
+                       'voluntary_ctxt_switches'    : 'vol_csw',
+                       'nonvoluntary_ctxt_switches' : 'invol_csw' }
+    _io_fields = { 'read_bytes' : 'read_kb', 'write_bytes' : 'write_kb' }
+    _rate_columns = ( 'vol_csw', 'invol_csw', 'read_kb', 'write_kb' )
+
+    def __init__( self, pid, interval=1.0, outpath=None ) :
+        threading.Thread.__init__( self, name='ib-proc-sampler' )
+        self.daemon = True
+        self._pid = pid
+        self._interval = interval
+        self._outpath = outpath
+        self._stop_event = threading.Event( )
+        self._ticks = float( os.sysconf('SC_CLK_TCK') )
+        self._count = 0
+        self._peaks = { }
+        self._totals = dict.fromkeys( self._summary_columns, 0 )
+        self._last = None
+
+    Pid      = property( lambda self : self._pid )
+    Interval = property( lambda self : self._interval )
+    OutPath  = property( lambda self : self._outpath )
+    Count    = property( lambda self : self._count )
+
+    def _Read( self, name ) :
+        with open( '/proc/{}/{}'.format(self._pid, name) ) as fp :
+            return fp.read( )
+
+    def _ReadCpuTicks( self ) :
+        # The command name may contain spaces or parens; split after it
+        fields = self._Read( 'stat' ).rsplit( ')', 1 )[1].split( )
+        return int(fields[11]) + int(fields[12])
+
+    def _ReadCounters( self ) :
+        values = dict.fromkeys( self.Columns[2:], 0 )
+        for line in self._Read( 'status' ).splitlines( ) :
+            name, sep, value = line.partition( ':' )
+            column = self._status_fields.get( name )
+            if column is not None :
+                values[column] = int( value.split()[0] )
+        try :
+            for line in self._Read( 'io' ).splitlines( ) :
+                name, sep, value = line.partition( ':' )
+                column = self._io_fields.get( name )
+                if column is not None :
+                    values[column] = int( value ) // 1024
+        except (IOError, OSError) :
+            pass   # io requires ptrace access; leave it zero
+        try :
+            values['fds'] = len( os.listdir('/proc/{}/fd'.format(self._pid)) )
+        except OSError :
+            pass
+        return values
+
+    def Sample( self ) :
+        """ Take one sample, return it (None if the process is gone) """
+        try :
+            now = time.time( )
+            ticks = self._ReadCpuTicks( )
+            values = self._ReadCounters( )
+        except (IOError, OSError, IndexError, ValueError) :
+            return None
+        sample = dict( values )
+        if self._last is None :
+            self._start = now
+            sample['cpu_pct'] = 0.0
+            for column in self._rate_columns :
+                sample[column] = 0
+        else :
+            last_now, last_ticks, last_values = self._last
+            elapsed = max( now - last_now, 1e-6 )
+            sample['cpu_pct'] = 100.0 * (ticks - last_ticks) / self._ticks / elapsed
+            # Counters are reported as the change since the previous sample
+            for column in self._rate_columns :
+                sample[column] = values[column] - last_values[column]
+        sample['time'] = now - self._start
+        self._last = ( now, ticks, values )
+        self._Accumulate( sample )
+        return sample
+
+    def _Accumulate( self, sample ) :
+        self._count += 1
+        for column in self._summary_columns :
+            value = sample[column]
+            self._totals[column] += value
+            if column not in self._peaks  or  value > self._peaks[column] :
+                self._peaks[column] = value
+
+    def _FormatSample( self, sample ) :
+        return '\t'.join( [ '{:.3f}'.format(sample['time']), '{:.1f}'.format(sample['cpu_pct']) ] +
+                          [ str(sample[c]) for c in self.Columns[2:] ] )
+
+    def run( self ) :
+        fp = None
+        try :
+            if self._outpath is not None :
+                fp = open( self._outpath, 'w' )
+                print >>fp, '#' + '\t'.join( self.Columns )
+            while True :
+                sample = self.Sample( )
+                if sample is None :
+                    break
+                if fp is not None :
+                    print >>fp, self._FormatSample( sample )
+                    fp.flush( )
+                if self._stop_event.wait( self._interval ) :
+                    break
+        finally :
+            if fp is not None :
+                fp.close( )
+
+    def Stop( self ) :
+        self._stop_event.set( )
+        if self.is_alive( ) :
+            self.join( )
+
+    def Summary( self ) :
+        """ Return a dict of column -> ( peak, mean ) """
+        summary = { }
+        if self._count == 0 :
+            return summary
+        for column in self._summary_columns :
+            summary[column] = ( self._peaks[column], float(self._totals[column]) / self._count )
+        return summary
+
+    def FormatSummary( self ) :
+        summary = self.Summary( )
+        lines = [ '{:d} samples of PID {:d} every {:g}s'.format(self._count, self._pid, self._interval) ]
+        for column in self._summary_columns :
+            if column in summary :
+                peak, mean = summary[column]
+                lines.append( '  {:<10s} peak {:>12.1f}  mean {:>12.1f}'.format(column, peak, mean) )
+        return lines
+
+class IbModule_util_proc_sampler( object ) :
+    modulePath = __file__
+
+if __name__ == "__main__" :
+    assert False, "not stand-alone"
+
+### Local Variables: ***
+### py-indent-offset:4 ***
+### python-indent:4 ***
+### python-continuation-offset:4 ***
+### tab-width:4  ***
+### End: ***
@@ -0,0 +1,57 @@
+#! /usr/bin/env python
+# ****************************************************************************
+# Licensed to Qualys, Inc. (QUALYS) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# QUALYS licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ****************************************************************************
+import time
+
+class IbStopwatch( object ) :
+    """
+    Simple wall-clock stopwatch which records named laps, each measured
+    from the start time.
+    """
+    def __init__( self, start=None ) :
+        self._start = time.time() if start is None else start
+        self._laps = [ ]
+
+    def Lap( self, name ) :
+        elapsed = time.time() - self._start
+        self._laps.append( (name, elapsed) )
+        return elapsed
+
+    def Format( self ) :
+        lines = [ ]
+        last = 0.0
+        for name, elapsed in self._laps :
+            lines.append( '  {:<16s} {:8.3f}s  (+{:.3f}s)'.format(name, elapsed, elapsed-last) )
+            last = elapsed
+        return lines
+
+    Start   = property( lambda self : self._start )
+    Laps    = property( lambda self : list(self._laps) )
+    Elapsed = property( lambda self : time.time() - self._start )
+
+class IbModule_util_stopwatch( object ) :
+    modulePath = __file__
+
+if __name__ == "__main__" :
+    assert False, "not stand-alone"
+
+### Local Variables: ***
+### py-indent-offset:4 ***
+### python-indent:4 ***
+### python-continuation-offset:4 ***
+### tab-width:4  ***
+### End: ***
@@ -0,0 +1,411 @@
+#! /usr/bin/env python
+# ****************************************************************************
+# Licensed to Qualys, Inc. (QUALYS) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# QUALYS licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ****************************************************************************
+import re
+import os
+import sys
+import math
+import heapq
+import collections
+
+class IbLatencyHistogram( object ) :
+    """
+    Fixed-size log-scale latency histogram; values are bucketed with a
+    resolution of 2^(1/4) (~19%), which is enough to estimate percentiles
+    in constant memory.
+    """
+    _steps = 4
+    _floor = 1e-7
+
+    def __init__( self ) :
+        self._buckets = collections.Counter( )
+        self._count = 0
+        self._total = 0.0
+        self._min = None
+        self._max = None
+
+    def Add( self, value ) :
+        self._count += 1
+        self._total += value
+        if self._min is None  or  value < self._min :
+            self._min = value
+        if self._max is None  or  value > self._max :
+            self._max = value
+        self._buckets[self._Bucket(value)] += 1
+
+    def _Bucket( self, value ) :
+        return int( math.floor(math.log(max(value, self._floor), 2) * self._steps) )
+
+    def _Upper( self, bucket ) :
+        return 2.0 ** ( float(bucket + 1) / self._steps )
+
+    def Percentile( self, pct ) :
+        """ Estimate the pct'th percentile (upper bound of its bucket) """
+        if self._count == 0 :
+            return None
+        target = self._count * pct / 100.0
+        seen = 0
+        for bucket in sorted( self._buckets ) :
+            seen += self._buckets[bucket]
+            if seen >= target :
+                return min( self._Upper(bucket), self._max )
+        return self._max
+
+    Count = property( lambda self : self._count )
+    Total = property( lambda self : self._total )
+    Min   = property( lambda self : self._min )
+    Max   = property( lambda self : self._max )
+    Mean  = property( lambda self : self._total / self._count if self._count else None )
+
+class _SyscallStats( object ) :
+    __slots__ = ( 'count', 'errors', 'latency', 'error_names' )
+    def __init__( self ) :
+        self.count = 0
+        self.errors = 0
+        self.latency = IbLatencyHistogram( )
+        self.error_names = collections.Counter( )
+
+class IbStraceAnalyzer( object ) :
+    """
+    Streaming analyzer for strace output, as written with -f, -tt and -T
+    (all are optional).  Handles "[pid N]" and "N " prefixes, per-process
+    -ff files, and <unfinished ...> / <... resumed> pairs.  Memory use is
+    bounded: latencies are kept in fixed histograms, slow calls in a top-N
+    heap and file descriptor hot spots in a capped table.
+    """
+    _line_re = re.compile( r'(?:\[pid\s+(\d+)\]\s*|(\d+)\s+)?'
+                           r'(?:(\d+):(\d\d):(\d\d(?:\.\d+)?)\s+|(\d+\.\d+)\s+)?(.*)$' )
+    _call_re = re.compile( r'(\w+)\((.*)$' )
+    _resumed_re = re.compile( r'<\.\.\. (\w+) resumed>\s*(.*)$' )
+    _result_re = re.compile( r'\)\s+=\s+(-?\d+|0x[0-9a-fA-F]+|\?)(?:\s+(E[A-Z0-9_]+))?'
+                             r'(?:\s+\([^<]*\))?(?:\s+<(\d+\.\d+)>)?\s*$' )
+    _unfinished = '<unfinished ...>'
+    _path_re = re.compile( r'"((?:[^"\\]|\\.)*)"' )
+    _inet_re = re.compile( r'inet_(?:addr|pton)\((?:AF_INET6?, )?"([^"]+)"\).*?htons\((\d+)\)|'
+                           r'htons\((\d+)\).*?inet_(?:addr|pton)\((?:AF_INET6?, )?"([^"]+)"' )
+    _unix_re = re.compile( r'sun_path="([^"]*)"' )
+
+    _fd_syscalls = frozenset( ( 'read', 'write', 'pread64', 'pwrite64', 'readv', 'writev',
+                                'preadv', 'pwritev', 'recv', 'recvfrom', 'recvmsg', 'recvmmsg',
+                                'send', 'sendto', 'sendmsg', 'sendmmsg', 'sendfile', 'fstat',
+                                'lseek', 'fsync', 'fdatasync', 'ioctl', 'fcntl', 'getdents',
+                                'getdents64', 'close', 'shutdown', 'setsockopt', 'getsockopt',
+                                'connect', 'accept', 'accept4', 'bind', 'listen', 'flock',
+                                'ftruncate', 'fallocate', 'splice' ) )
+    _path_syscalls = frozenset( ( 'open', 'creat', 'stat', 'lstat', 'access', 'readlink',
+                                  'unlink', 'mkdir', 'rmdir', 'rename', 'chmod', 'chown',
+                                  'truncate', 'execve', 'statfs' ) )
+    _at_syscalls = frozenset( ( 'openat', 'newfstatat', 'fstatat64', 'faccessat', 'faccessat2',
+                                'readlinkat', 'unlinkat', 'mkdirat', 'renameat', 'renameat2',
+                                'statx', 'openat2' ) )
+    _open_syscalls = frozenset( ( 'open', 'openat', 'openat2', 'creat' ) )
+    _dup_syscalls = frozenset( ( 'dup', 'dup2', 'dup3' ) )
+    _socket_syscalls = frozenset( ( 'socket', 'accept', 'accept4' ) )
+
+    def __init__( self, top=20, max_paths=10000 ) :
+        self._top = top
+        self._max_paths = max_paths
+        self._syscalls = collections.defaultdict( _SyscallStats )
+        self._threads = collections.defaultdict( lambda : [0, 0.0] )
+        self._paths = { }
+        self._slow = [ ]
+        self._pending = { }
+        self._fds = { }
+        self._signals = collections.Counter( )
+        self._lines = 0
+        self._unparsed = 0
+        self._first_time = None
+        self._last_time = None
+
+    Lines    = property( lambda self : self._lines )
+    Unparsed = property( lambda self : self._unparsed )
+    Syscalls = property( lambda self : dict(self._syscalls) )
+    Threads  = property( lambda self : dict(self._threads) )
+    Paths    = property( lambda self : dict(self._paths) )
+    Signals  = property( lambda self : dict(self._signals) )
+    Duration = property( lambda self : None if self._first_time is None else
+                         self._last_time - self._first_time )
+
+    def SlowCalls( self ) :
+        """ Return the top-N slowest calls as ( seconds, pid, line ) """
+        return sorted( self._slow, reverse=True )
+
+    def Feed( self, lines, pid=None ) :
+        """ Analyze lines; pid is the process ID for -ff output files """
+        for line in lines :
+            self.FeedLine( line, pid )
+
+    @staticmethod
+    def FfPid( path ) :
+        """
+        The PID of a file written by strace -ff (<prefix>.<pid>), or None.
+        A numeric suffix alone isn't enough (the run's own trace file is
+        named <name>.<pid> of the run, too); other <prefix>.<number>
+        files have to exist alongside it
+        """
+        prefix, ext = os.path.splitext( path )
+        if not ext[1:].isdigit( ) :
+            return None
+        dirname, base = os.path.split( prefix )
+        try :
+            names = os.listdir( dirname or '.' )
+        except OSError :
+            return None
+        siblings = [ name for name in names
+                     if name.startswith( base+'.' )  and  name[len(base)+1:].isdigit() ]
+        return int( ext[1:] ) if len(siblings) > 1 else None
+
+    def FeedFile( self, path, ff=None ) :
+        """
+        Analyze a file; ff says whether it's a "name.N" file from -ff,
+        whose lines are given PID N (None: guess from its siblings)
+        """
+        pid = None
+        if path != '-' :
+            if ff is None :
+                pid = self.FfPid( path )
+            elif ff :
+                ext = os.path.splitext( path )[1][1:]
+                pid = int( ext ) if ext.isdigit( ) else None
+        if path == '-' :
+            self.Feed( sys.stdin, pid )
+        else :
+            with open( path ) as fp :
+                self.Feed( fp, pid )
+
+    def FeedLine( self, line, pid=None ) :
+        self._lines += 1
+        m = self._line_re.match( line.rstrip('\n') )
+        if m.group(1) is not None :
+            pid = int( m.group(1) )
+        elif m.group(2) is not None :
+            pid = int( m.group(2) )
+        elif pid is None :
+            pid = 0
+        if m.group(3) is not None :
+            self._SetTime( int(m.group(3))*3600 + int(m.group(4))*60 + float(m.group(5)) )
+        elif m.group(6) is not None :
+            self._SetTime( float(m.group(6)) )
+        rest = m.group(7)
+
+        if rest.startswith( '<...' ) :
+            m = self._resumed_re.match( rest )
+            if m is None :
+                self._unparsed += 1
+                return
+            name = m.group(1)
+            start = self._pending.pop( (pid, name), '' )
+            self._Finish( pid, name, start + m.group(2), rest )
+            return
+        if rest.startswith( '---' ) :
+            fields = rest.split( )
+            if len(fields) > 1 :
+                self._signals[fields[1]] += 1
+            return
+        if rest.startswith( '+++' ) :
+            return
+        m = self._call_re.match( rest )
+        if m is None :
+            self._unparsed += 1
+            return
+        name, args = m.groups()
+        if args.endswith( self._unfinished ) :
+            self._pending[(pid, name)] = args[:-len(self._unfinished)]
+            return
+        self._Finish( pid, name, args, rest )
+
+    def _SetTime( self, t ) :
+        if self._first_time is None :
+            self._first_time = t
+        self._last_time = t
+
+    def _Finish( self, pid, name, args, line ) :
+        m = self._result_re.search( args )
+        if m is None :
+            self._unparsed += 1
+            return
+        result, errname, elapsed = m.groups()
+        elapsed = 0.0 if elapsed is None else float(elapsed)
+        stats = self._syscalls[name]
+        stats.count += 1
+        stats.latency.Add( elapsed )
+        if errname is not None :
+            stats.errors += 1
+            stats.error_names[errname] += 1
+        thread = self._threads[pid]
+        thread[0] += 1
+        thread[1] += elapsed
+
+        if self._top > 0 :
+            item = ( elapsed, pid, line[:200] )
+            if len(self._slow) < self._top :
+                heapq.heappush( self._slow, item )
+            elif elapsed > self._slow[0][0] :
+                heapq.heapreplace( self._slow, item )
+
+        self._TrackFiles( pid, name, args[:m.start()], result, errname is None, elapsed )
+
+    def _FirstFd( self, args ) :
+        fd = args.split( ',', 1 )[0]
+        return int(fd) if fd.isdigit() else None
+
+    def _FirstPath( self, args ) :
+        m = self._path_re.search( args )
+        return None if m is None else m.group(1)
+
+    def _LookupFd( self, pid, fd ) :
+        # Threads share descriptors, and -f traces can't tell threads from
+        # processes, so fall back to the last descriptor opened by anyone
+        name = self._fds.get( (pid, fd) )
+        if name is None :
+            name = self._fds.get( (None, fd) )
+        return name
+
+    def _SetFd( self, pid, fd, name ) :
+        self._fds[(pid, fd)] = name
+        self._fds[(None, fd)] = name
+
+    def _TrackFiles( self, pid, name, args, result, ok, elapsed ) :
+        path = None
+        if name in self._fd_syscalls :
+            fd = self._FirstFd( args )
+            if fd is None :
+                return
+            path = self._LookupFd( pid, fd )
+            if path is None :
+                path = 'fd:{}'.format( fd )
+            if name == 'connect' :
+                path = self._SocketName( args, path )
+                if ok  or  result == '-1' :
+                    self._SetFd( pid, fd, path )
+            elif name == 'close' :
+                self._fds.pop( (pid, fd), None )
+            if ok  and  name in ( 'accept', 'accept4' )  and  result.isdigit() :
+                self._SetFd( pid, int(result), self._SocketName(args, 'socket:accept') )
+        elif name in self._path_syscalls  or  name in self._at_syscalls :
+            path = self._FirstPath( args )
+            if ok  and  name in self._open_syscalls  and  path is not None  and  result.isdigit() :
+                self._SetFd( pid, int(result), path )
+        elif name in self._dup_syscalls :
+            fd = self._FirstFd( args )
+            if ok  and  fd is not None  and  result.isdigit() :
+                src = self._LookupFd( pid, fd )
+                if src is not None :
+                    self._SetFd( pid, int(result), src )
+            return
+        elif name == 'socket' :
+            if ok  and  result.isdigit() :
+                self._SetFd( pid, int(result), 'socket:'+args.split(',', 1)[0] )
+            return
+        if path is None :
+            return
+        entry = self._paths.get( path )
+        if entry is None :
+            if len(self._paths) >= self._max_paths :
+                path = '<other>'
+                entry = self._paths.get( path )
+            if entry is None :
+                entry = [ 0, 0.0 ]
+                self._paths[path] = entry
+        entry[0] += 1
+        entry[1] += elapsed
+
+    def _SocketName( self, args, default ) :
+        m = self._inet_re.search( args )
+        if m is not None :
+            if m.group(1) is not None :
+                return '{}:{}'.format( m.group(1), m.group(2) )
+            return '{}:{}'.format( m.group(4), m.group(3) )
+        m = self._unix_re.search( args )
+        if m is not None :
+            return 'unix:'+m.group(1)
+        return default
+
+    def FormatSummary( self ) :
+        """ Format the totals and the per-syscall table as a list of lines """
+        lines = [ ]
+        calls = sum( [ s.count for s in self._syscalls.values() ] )
+        total = sum( [ s.latency.Total for s in self._syscalls.values() ] )
+        duration = self.Duration
+        lines.append( '{:d} lines, {:d} syscalls in {:d} threads, {:.6f}s in syscalls{}'.format(
+            self._lines, calls, len(self._threads), total,
+            '' if duration is None else ', {:.3f}s traced'.format(duration) ) )
+        if self._unparsed :
+            lines.append( '{:d} unparsed lines'.format(self._unparsed) )
+        if len(self._pending) :
+            lines.append( '{:d} unfinished calls'.format(len(self._pending)) )
+
+        lines.append( '' )
+        lines.append( '{:<16s} {:>9s} {:>7s} {:>6s} {:>11s} {:>10s} {:>10s} {:>10s} {:>10s} {:>10s}'.format(
+            'syscall', 'calls', 'errors', '%time', 'total(s)', 'mean(us)',
+            'p50(us)', 'p90(us)', 'p99(us)', 'max(us)') )
+        for name, stats in sorted( self._syscalls.items(), key=lambda i : -i[1].latency.Total ) :
+            h = stats.latency
+            lines.append( '{:<16s} {:>9d} {:>7d} {:>6.2f} {:>11.6f} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+                name, stats.count, stats.errors,
+                100.0 * h.Total / total if total else 0.0, h.Total,
+                h.Mean * 1e6, h.Percentile(50) * 1e6, h.Percentile(90) * 1e6,
+                h.Percentile(99) * 1e6, h.Max * 1e6 ) )
+        return lines
+
+    def FormatReport( self, top=None ) :
+        """ Format the full analysis as a list of lines """
+        top = self._top if top is None else top
+        lines = self.FormatSummary( )
+
+        errors = [ (n, s) for n, s in self._syscalls.items() if s.errors ]
+        if len(errors) :
+            lines.append( '' )
+            lines.append( 'Errors:' )
+            for name, stats in sorted( errors, key=lambda i : -i[1].errors ) :
+                lines.append( '  {:<16s} {}'.format(
+                    name, ', '.join( ['{}={}'.format(e, c) for e, c in stats.error_names.most_common()] ) ) )
+
+        lines.append( '' )
+        lines.append( 'Threads (top {}):'.format(top) )
+        for pid, (count, elapsed) in sorted( self._threads.items(), key=lambda i : -i[1][1] )[:top] :
+            lines.append( '  {:>8d} {:>9d} calls {:>11.6f}s'.format(pid, count, elapsed) )
+
+        if len(self._paths) :
+            lines.append( '' )
+            lines.append( 'File / socket hot spots (top {}):'.format(top) )
+            for path, (count, elapsed) in sorted( self._paths.items(), key=lambda i : -i[1][1] )[:top] :
+                lines.append( '  {:>9d} calls {:>11.6f}s  {}'.format(count, elapsed, path) )
+
+        if len(self._slow) :
+            lines.append( '' )
+            lines.append( 'Slowest calls:' )
+            for elapsed, pid, line in self.SlowCalls( )[:top] :
+                lines.append( '  {:>11.6f}s {:>8d} {}'.format(elapsed, pid, line) )
+
+        if len(self._signals) :
+            lines.append( '' )
+            lines.append( 'Signals: ' + ', '.join( ['{}={}'.format(s, c) for s, c in self._signals.most_common()] ) )
+        return lines
+
+class IbModule_util_strace_analyzer( object ) :
+    modulePath = __file__
+
+if __name__ == "__main__" :
+    assert False, "not stand-alone"
+
+### Local Variables: ***
+### py-indent-offset:4 ***
+### python-indent:4 ***
+### python-continuation-offset:4 ***
+### tab-width:4  ***
+### End: ***
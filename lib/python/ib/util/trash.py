@@ -0,0 +1,175 @@
+#! /usr/bin/env python
+# ****************************************************************************
+# Licensed to Qualys, Inc. (QUALYS) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# QUALYS licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ****************************************************************************
+import os
+import sys
+import time
+import errno
+import fcntl
+import shutil
+import subprocess
+
+class IbTrashException( BaseException ) : pass
+
+class IbTrash( object ) :
+    """
+    Deferred deletion of directories: Move() renames a directory into the
+    trash directory (cheap and atomic on the same file system), and
+    StartPurge() deletes the trash in a detached, low priority (nice /
+    idle I/O class) background process.  The most recent trash entries
+    may be kept, within a size and / or age budget (0 is unlimited); with
+    no budget at all, the whole trash is purged.
+    """
+    _lock_name = '.lock'
+
+    def __init__( self, trash_dir, keep_bytes=0, keep_age=0.0 ) :
+        self._dir = trash_dir
+        self._keep_bytes = keep_bytes
+        self._keep_age = keep_age
+        self._count = 0
+        self._moved = 0
+
+    Dir   = property( lambda self : self._dir )
+    Moved = property( lambda self : self._moved )
+
+    def Move( self, path ) :
+        """
+        Move path into the trash; if that's not possible (the trash is on
+        another file system), path is removed synchronously.  Returns the
+        trash path, or None if path was removed.
+        """
+        if not os.path.isdir( self._dir ) :
+            os.makedirs( self._dir )
+        self._count += 1
+        name = '{}.{:.6f}.{}.{}'.format( os.path.basename(os.path.normpath(path)),
+                                          time.time(), os.getpid(), self._count )
+        dest = os.path.join( self._dir, name )
+        try :
+            os.rename( path, dest )
+        except OSError as e :
+            if e.errno != errno.EXDEV :
+                raise
+            shutil.rmtree( path )
+            return None
+        self._moved += 1
+        return dest
+
+    @staticmethod
+    def _Size( path ) :
+        size = 0
+        for dirpath, dirs, files in os.walk( path ) :
+            for name in files :
+                try :
+                    size += os.lstat( os.path.join(dirpath, name) ).st_size
+                except OSError :
+                    pass
+        return size
+
+    def _Expired( self ) :
+        """ Trash entries outside of the budget, newest first """
+        entries = [ ]
+        for name in os.listdir( self._dir ) :
+            if name == self._lock_name :
+                continue
+            path = os.path.join( self._dir, name )
+            try :
+                entries.append( (os.lstat(path).st_ctime, path) )
+            except OSError :
+                pass
+        entries.sort( reverse=True )
+        keep = self._keep_bytes > 0  or  self._keep_age > 0
+        expired = [ ]
+        total = 0
+        now = time.time( )
+        for ctime, path in entries :
+            if keep  and  self._keep_age > 0  and  now - ctime > self._keep_age :
+                keep = False
+            if keep  and  self._keep_bytes > 0 :
+                total += self._Size( path )
+                keep = total <= self._keep_bytes
+            if not keep :
+                expired.append( path )
+        return expired
+
+    def Purge( self ) :
+        """ Delete the trash entries outside of the budget; returns the count """
+        if not os.path.isdir( self._dir ) :
+            return 0
+        with open( os.path.join(self._dir, self._lock_name), 'w' ) as lock :
+            try :
+                fcntl.flock( lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB )
+            except IOError :
+                return 0
+            # Entries may be added while purging; repeat until nothing's left
+            # but the entries which couldn't be deleted
+            count = 0
+            failed = set( )
+            while True :
+                expired = [ path for path in self._Expired() if path not in failed ]
+                if len(expired) == 0 :
+                    return count
+                for path in expired :
+                    if os.path.isdir( path )  and  not os.path.islink( path ) :
+                        shutil.rmtree( path, ignore_errors=True )
+                    else :
+                        try :
+                            os.unlink( path )
+                        except OSError :
+                            pass
+                    if os.path.lexists( path ) :
+                        failed.add( path )
+                    else :
+                        count += 1
+
+    def StartPurge( self ) :
+        """ Purge in a detached, low priority grandchild process """
+        if not os.path.isdir( self._dir ) :
+            return None
+        sys.stdout.flush( )
+        sys.stderr.flush( )
+        pid = os.fork( )
+        if pid != 0 :
+            os.waitpid( pid, 0 )
+            return pid
+        try :
+            os.setsid( )
+            if os.fork( ) != 0 :
+                os._exit( 0 )
+            devnull = os.open( os.devnull, os.O_RDWR )
+            for fd in range(3) :
+                os.dup2( devnull, fd )
+            os.nice( 19 )
+            try :
+                subprocess.call( ('ionice', '-c', '3', '-p', str(os.getpid())) )
+            except OSError :
+                pass
+            self.Purge( )
+        finally :
+            os._exit( 0 )
+
+class IbModule_util_trash( object ) :
+    modulePath = __file__
+
+if __name__ == "__main__" :
+    assert False, "not stand-alone"
+
+### Local Variables: ***
+### py-indent-offset:4 ***
+### python-indent:4 ***
+### python-continuation-offset:4 ***
+### tab-width:4  ***
+### End: ***
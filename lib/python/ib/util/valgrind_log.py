@@ -0,0 +1,537 @@
+#! /usr/bin/env python
+# ****************************************************************************
+# Licensed to Qualys, Inc. (QUALYS) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# QUALYS licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ****************************************************************************
+import re
+import os
+import sys
+import fnmatch
+import hashlib
+import multiprocessing
+import xml.etree.cElementTree as ElementTree
+
+class IbValgrindIssue( object ) :
+    """ One unique valgrind error (or leak), and how often it occurred """
+    def __init__( self, kind, signature, offset, lines ) :
+        self.Kind = kind
+        self.Signature = signature
+        self.Count = 0
+        self.Bytes = 0
+        self.Blocks = 0
+        self.Pids = set( )
+        self.Offset = offset
+        self.Lines = lines
+        self.Suppression = None
+
+    def Merge( self, other ) :
+        self.Count += other.Count
+        self.Bytes += other.Bytes
+        self.Blocks += other.Blocks
+        self.Pids |= other.Pids
+        if other.Offset < self.Offset :
+            self.Offset = other.Offset
+            self.Lines = other.Lines
+        if self.Suppression is None :
+            self.Suppression = other.Suppression
+
+class IbValgrindLogAnalyzer( object ) :
+    """
+    Streaming analyzer for valgrind text logs (memcheck, helgrind, drd).
+    Log lines are grouped into records (separated by empty "==PID=="
+    lines, tracked per PID); records with stack frames are errors, which
+    are deduplicated by a signature made of the normalized error kind
+    and the top frames of each of its stacks.  Only the first occurrence
+    of each unique error is kept, so memory doesn't grow with log size.
+    """
+    _prefix_re = re.compile( r'==(\d+)== ?(.*)$' )
+    _frame_re = re.compile( r'\s+(?:at|by) 0x[0-9A-Fa-f]+: (.*?)(?: \((?:in )?([^()]*)\))?$' )
+    _leak_re = re.compile( r'([\d,]+)(?: \(([\d,]+) direct, ([\d,]+) indirect\))? bytes in ([\d,]+) blocks '
+                           r'are (.*?) in loss record' )
+    _hex_re = re.compile( r'0x[0-9A-Fa-f]+' )
+    _num_re = re.compile( r'\b\d[\d,]*\b' )
+    _line_re = re.compile( r':\d+$' )
+    _announce_re = re.compile( r'-{3,}|Thread #\d+ (?:was created|is the program)|'
+                               r'Lock at 0x[0-9A-Fa-f]+ was first observed|'
+                               r'Thread \d+ has been created|Thread \d+:$' )
+    _continue_re = re.compile( r'This conflicts with a previous|Address 0x[0-9A-Fa-f]+ is|'
+                               r'Block was alloc\'d|Uninitialised value was created' )
+    _max_example = 60
+
+    def __init__( self, frames=8, with_lines=False, kind_filter=None ) :
+        self._frames = frames
+        self._with_lines = with_lines
+        self._kind_filter = None if kind_filter is None else re.compile( kind_filter )
+        self._issues = { }
+        self._records = { }
+        self._pending = { }
+        self._summaries = { }
+        self._lines = 0
+        self._errors = 0
+        self._announcements = 0
+
+    Issues        = property( lambda self : self._issues )
+    Lines         = property( lambda self : self._lines )
+    Errors        = property( lambda self : self._errors )
+    Announcements = property( lambda self : self._announcements )
+    Summaries     = property( lambda self : dict(self._summaries) )
+
+    def Feed( self, lines, offset=0 ) :
+        for line in lines :
+            self.FeedLine( line, offset )
+            offset += len( line )
+        self.Flush( )
+
+    def FeedLine( self, line, offset=0 ) :
+        self._lines += 1
+        m = self._prefix_re.match( line )
+        if m is None :
+            return
+        pid = int( m.group(1) )
+        text = m.group(2).rstrip( )
+        record = self._records.get( pid )
+        if text == '' :
+            if record is not None :
+                self._EndRecord( pid, record )
+                del self._records[pid]
+            return
+        if record is None :
+            self._records[pid] = ( offset, [text] )
+        else :
+            record[1].append( text )
+
+    def Flush( self ) :
+        for pid, record in self._records.items( ) :
+            self._EndRecord( pid, record )
+        self._records = { }
+        for pid, record in self._pending.items( ) :
+            self._AddError( pid, record )
+        self._pending = { }
+
+    def _NormalizeKind( self, text ) :
+        return self._num_re.sub( 'N', self._hex_re.sub('0x', text) )
+
+    def _NormalizeFrame( self, fn, where ) :
+        if where is None :
+            return fn
+        if not self._with_lines :
+            where = self._line_re.sub( '', where )
+        return '{} ({})'.format( fn, os.path.basename(where) )
+
+    def _EndRecord( self, pid, record ) :
+        offset, lines = record
+        head = lines[0]
+        pending = self._pending.pop( pid, None )
+        if pending is not None :
+            # Helgrind separates the parts of one error with empty lines
+            if self._continue_re.match( head ) :
+                pending[1].extend( lines )
+                self._pending[pid] = pending
+                return
+            self._AddError( pid, pending )
+        if 'SUMMARY:' in head :
+            for text in lines :
+                if text.startswith( 'ERROR SUMMARY' ) :
+                    self._summaries[pid] = text
+        elif self._announce_re.match( head ) :
+            self._announcements += 1
+        elif any( [self._frame_re.match(text) for text in lines[1:]] ) :
+            self._pending[pid] = record
+
+    def _AddError( self, pid, record ) :
+        offset, lines = record
+        head = lines[0]
+        stacks = [ ]
+        stack = None
+        for text in lines[1:] :
+            m = self._frame_re.match( text )
+            if m is None :
+                stack = None
+                continue
+            if stack is None :
+                stack = [ ]
+                stacks.append( stack )
+            if len(stack) < self._frames :
+                stack.append( self._NormalizeFrame(*m.groups()) )
+        if len(stacks) == 0 :
+            return
+
+        nbytes = blocks = 0
+        m = self._leak_re.match( head )
+        if m is not None :
+            kind = 'Leak: ' + m.group(5)
+            nbytes = int( m.group(1).replace(',', '') )
+            blocks = int( m.group(4).replace(',', '') )
+        else :
+            kind = self._NormalizeKind( head )
+        self._AddIssue( pid, kind, stacks, offset, lines, nbytes, blocks )
+
+    def _AddIssue( self, pid, kind, stacks, offset, lines, nbytes=0, blocks=0, suppression=None ) :
+        if self._kind_filter is not None  and  not self._kind_filter.search( kind ) :
+            return
+        self._errors += 1
+        signature = '\n'.join( [kind] + [ '|'.join(s) for s in stacks ] )
+        issue = self._issues.get( signature )
+        if issue is None :
+            issue = IbValgrindIssue( kind, signature, offset, lines[:self._max_example] )
+            issue.Suppression = suppression
+            self._issues[signature] = issue
+        issue.Count += 1
+        issue.Bytes += nbytes
+        issue.Blocks += blocks
+        issue.Pids.add( pid )
+
+    def Merge( self, other ) :
+        self._lines += other._lines
+        self._errors += other._errors
+        self._announcements += other._announcements
+        self._summaries.update( other._summaries )
+        for signature, issue in other._issues.items( ) :
+            mine = self._issues.get( signature )
+            if mine is None :
+                self._issues[signature] = issue
+            else :
+                mine.Merge( issue )
+
+    def Ranked( self ) :
+        """ Unique issues, most frequent (for leaks: most bytes) first """
+        return sorted( self._issues.values(),
+                       key=lambda i : (-i.Count, -i.Bytes, i.Offset) )
+
+    def FormatReport( self, top=20, stacks=True ) :
+        lines = [ ]
+        lines.append( '{}{} errors, {} unique'.format(
+            '{} lines, '.format(self._lines) if self._lines else '',
+            self._errors, len(self._issues)) )
+        kinds = { }
+        for issue in self._issues.values( ) :
+            entry = kinds.setdefault( issue.Kind, [0, 0, 0] )
+            entry[0] += 1
+            entry[1] += issue.Count
+            entry[2] += issue.Bytes
+        if len(kinds) :
+            lines.append( '' )
+            lines.append( '{:>7s} {:>9s} {:>12s}  {}'.format('unique', 'count', 'bytes', 'kind') )
+            for kind, (unique, count, nbytes) in sorted( kinds.items(), key=lambda i : -i[1][1] ) :
+                lines.append( '{:>7d} {:>9d} {:>12s}  {}'.format(unique, count, str(nbytes or ''), kind) )
+        for n, issue in enumerate( self.Ranked()[:top], 1 ) :
+            lines.append( '' )
+            extra = '' if issue.Bytes == 0 else ', {} bytes in {} blocks'.format(issue.Bytes, issue.Blocks)
+            lines.append( '#{} {} x{} (pids {}){}'.format(
+                n, issue.Kind, issue.Count, ','.join([str(p) for p in sorted(issue.Pids)][:8]), extra) )
+            if stacks :
+                for text in issue.Lines :
+                    lines.append( '    ' + text )
+        if len(self._summaries) :
+            lines.append( '' )
+            for pid, text in sorted( self._summaries.items() ) :
+                lines.append( '{}: {}'.format(pid, text) )
+        return lines
+
+class IbValgrindXmlAnalyzer( IbValgrindLogAnalyzer ) :
+    """
+    Analyzer for valgrind --xml=yes output, producing the same
+    deduplicated issues as the text analyzer.  The XML is consumed
+    incrementally (each <error> is discarded once recorded), so memory
+    use doesn't grow with the file size.  If valgrind was run with
+    --gen-suppressions, the suppression of each unique error is kept.
+    """
+    _camel_re = re.compile( r'([a-z])([A-Z])' )
+
+    def Feed( self, fp, offset=0 ) :
+        pid = 0
+        root = None
+        count = 0
+        for event, elem in ElementTree.iterparse( fp, events=('start', 'end') ) :
+            if event == 'start' :
+                if root is None :
+                    root = elem
+                continue
+            tag = elem.tag
+            if tag == 'pid'  and  elem.text is not None :
+                pid = int( elem.text )
+            elif tag == 'error' :
+                count += 1
+                self._AddXmlError( pid, elem, count )
+                elem.clear( )
+                root.clear( )
+            elif tag == 'errorcounts' :
+                root.clear( )
+
+    def _AddXmlError( self, pid, elem, offset ) :
+        what = elem.findtext( 'what' )
+        xwhat = elem.find( 'xwhat' )
+        nbytes = blocks = 0
+        if what is None  and  xwhat is not None :
+            what = xwhat.findtext( 'text', '' )
+        kind = elem.findtext( 'kind', '' )
+        if kind.startswith( 'Leak_' ) :
+            nbytes = int( xwhat.findtext('leakedbytes', '0') )
+            blocks = int( xwhat.findtext('leakedblocks', '0') )
+            # Leak_DefinitelyLost -> "Leak: definitely lost", as in text logs
+            kind = 'Leak: ' + self._camel_re.sub( r'\1 \2', kind[5:] ).lower()
+        else :
+            kind = self._NormalizeKind( what or kind )
+        lines = [ what or kind ]
+        stacks = [ ]
+        for child in elem :
+            if child.tag in ( 'auxwhat', 'xauxwhat' ) :
+                lines.append( child.text if child.tag == 'auxwhat' else child.findtext('text', '') )
+            elif child.tag == 'stack' :
+                stack = [ ]
+                for n, frame in enumerate( child.findall('frame') ) :
+                    fn = frame.findtext( 'fn', '???' )
+                    filename = frame.findtext( 'file' )
+                    line = frame.findtext( 'line' )
+                    where = frame.findtext( 'obj' ) if filename is None else \
+                            filename if line is None else '{}:{}'.format( filename, line )
+                    lines.append( '   {} {}: {}{}'.format(
+                        'at' if n == 0 else 'by', frame.findtext('ip', '0x0'), fn,
+                        '' if where is None else ' ({})'.format(where)) )
+                    if len(stack) < self._frames :
+                        stack.append( self._NormalizeFrame(fn, where) )
+                stacks.append( stack )
+        if len(stacks) == 0 :
+            return
+        suppression = None
+        supp = elem.find( 'suppression' )
+        if supp is not None :
+            suppression = IbValgrindSuppression.FromXml( supp )
+        self._AddIssue( pid, kind, stacks, offset, lines, nbytes, blocks, suppression )
+
+class IbValgrindSuppression( object ) :
+    """ A single suppression: kind, extra lines (match-leak-kinds) and frames """
+    def __init__( self, name, skind, frames, extras=None ) :
+        self.Name = name
+        self.Kind = skind
+        self.Frames = list( frames )
+        self.Extras = list( extras or [] )
+
+    @classmethod
+    def FromXml( cls, elem ) :
+        frames = [ ]
+        for sframe in elem.findall( 'sframe' ) :
+            if sframe.findtext( 'fun' ) is not None :
+                frames.append( 'fun:'+sframe.findtext('fun') )
+            elif sframe.findtext( 'obj' ) is not None :
+                frames.append( 'obj:'+sframe.findtext('obj') )
+        extras = [ ]
+        if elem.findtext( 'skaux' ) is not None :
+            extras.append( elem.findtext('skaux').strip() )
+        else :
+            rawtext = elem.findtext( 'rawtext' ) or ''
+            for line in rawtext.splitlines( ) :
+                if line.strip().startswith( 'match-leak-kinds:' ) :
+                    extras.append( line.strip() )
+        return cls( elem.findtext('sname', ''), elem.findtext('skind', ''), frames, extras )
+
+    def _Match( self, frames, mine ) :
+        if len(mine) == 0 :
+            return True
+        if mine[0] == '...' :
+            return any( [self._Match(frames[n:], mine[1:]) for n in range(len(frames)+1)] )
+        if len(frames) == 0  or  not fnmatch.fnmatchcase( frames[0], mine[0] ) :
+            return False
+        return self._Match( frames[1:], mine[1:] )
+
+    def Covers( self, other ) :
+        """ Does this suppression suppress (the error of) other? """
+        if self.Kind != other.Kind :
+            return False
+        return self._Match( other.Frames, self.Frames )
+
+    def Format( self ) :
+        return '\n'.join( [ '{', '   '+self.Name, '   '+self.Kind ] +
+                          [ '   '+e for e in self.Extras ] +
+                          [ '   '+f for f in self.Frames ] + [ '}' ] )
+
+class IbValgrindSuppressions( object ) :
+    """ Set of suppressions read from a valgrind suppressions file """
+    def __init__( self, path=None ) :
+        self._suppressions = [ ]
+        if path is not None :
+            self.Load( path )
+
+    Suppressions = property( lambda self : list(self._suppressions) )
+
+    def Load( self, path ) :
+        lines = None
+        for line in open( path ) :
+            line = line.strip( )
+            if line == ''  or  line.startswith( '#' ) :
+                continue
+            if line == '{' :
+                lines = [ ]
+            elif line == '}' :
+                if lines is not None  and  len(lines) >= 2 :
+                    extras = [ l for l in lines[2:] if ':' in l  and  l.split(':')[0] not in ('fun', 'obj', 'src') ]
+                    frames = [ l for l in lines[2:] if l not in extras ]
+                    self._suppressions.append( IbValgrindSuppression(lines[0], lines[1], frames, extras) )
+                lines = None
+            elif lines is not None :
+                lines.append( line )
+
+    def Covers( self, suppression ) :
+        for mine in self._suppressions :
+            if mine.Covers( suppression ) :
+                return True
+        return False
+
+    def Candidates( self, issues, prefix='ib-auto' ) :
+        """
+        Return suppressions for issues (in order) which aren't covered by
+        this set or by an earlier candidate, named <prefix>-<hash>.
+        """
+        candidates = [ ]
+        for issue in issues :
+            supp = issue.Suppression
+            if supp is None  or  self.Covers( supp ) :
+                continue
+            if any( [c.Covers(supp) for c in candidates] ) :
+                continue
+            digest = hashlib.md5( issue.Signature ).hexdigest()[:8]
+            candidates.append( IbValgrindSuppression('{}-{}'.format(prefix, digest),
+                                                     supp.Kind, supp.Frames, supp.Extras) )
+        return candidates
+
+def IbValgrindIsXml( path ) :
+    """ Does the file at path contain valgrind XML output? """
+    if path == '-' :
+        return False
+    with open( path ) as fp :
+        return fp.read( 64 ).lstrip().startswith( '<?xml' )
+
+class _IbValgrindChunkAnalyzer( IbValgrindLogAnalyzer ) :
+    """
+    Analyzer for a chunk of a log which doesn't start at its beginning.
+    Until a PID's first record which can't be part of an earlier error
+    (an empty "==PID==" line followed by a record which isn't a helgrind
+    continuation), its lines are kept as fragments for the analyzer of
+    the preceding chunks to feed; the records still open at the end of
+    the chunk are left unflushed, for it to adopt.
+    """
+    def __init__( self, **kwargs ) :
+        IbValgrindLogAnalyzer.__init__( self, **kwargs )
+        self._fragments = [ ]
+        self._blank = set( )
+        self._synced = set( )
+
+    def FeedLine( self, line, offset=0 ) :
+        m = self._prefix_re.match( line )
+        if m is not None :
+            pid = int( m.group(1) )
+            if pid not in self._synced :
+                text = m.group(2).rstrip( )
+                if pid in self._blank  and  text != ''  and  not self._continue_re.match( text ) :
+                    self._synced.add( pid )
+                else :
+                    if text == '' :
+                        self._blank.add( pid )
+                    else :
+                        self._blank.discard( pid )
+                    self._fragments.append( (line, offset) )
+                    return
+        IbValgrindLogAnalyzer.FeedLine( self, line, offset )
+
+def _AdoptChunk( analyzer, chunk ) :
+    """ Continue analyzer's (unflushed) analysis with the following chunk """
+    for line, offset in chunk._fragments :
+        analyzer.FeedLine( line, offset )
+    for pid in chunk._synced :
+        # The chunk's first record for pid ends whatever was open
+        record = analyzer._records.pop( pid, None )
+        if record is not None :
+            analyzer._EndRecord( pid, record )
+        pending = analyzer._pending.pop( pid, None )
+        if pending is not None :
+            analyzer._AddError( pid, pending )
+    analyzer.Merge( chunk )
+    analyzer._records.update( chunk._records )
+    analyzer._pending.update( chunk._pending )
+
+def _AnalyzeChunk( args ) :
+    path, start, end, kwargs = args
+    if start == 0 :
+        analyzer = IbValgrindLogAnalyzer( **kwargs )
+    else :
+        analyzer = _IbValgrindChunkAnalyzer( **kwargs )
+    for offset, line in IbValgrindChunkLines( path, start, end ) :
+        analyzer.FeedLine( line, offset )
+    return analyzer
+
+def IbValgrindChunkLines( path, start, end ) :
+    """
+    Yield ( offset, line ) for the lines of path which start in the
+    chunk [start, end)
+    """
+    with open( path ) as fp :
+        if start > 0 :
+            fp.seek( start - 1 )
+            fp.readline( )
+        pos = fp.tell( )
+        for line in fp :
+            if pos >= end :
+                break
+            yield pos, line
+            pos += len( line )
+
+def IbValgrindAnalyzeFile( path, jobs=1, min_chunk=16*1024*1024, **kwargs ) :
+    """
+    Analyze a valgrind log file, splitting it into chunks which are
+    analyzed by jobs worker processes.  Records which straddle a chunk
+    boundary are completed as the chunk results are joined, in order.
+    XML files are analyzed serially.
+    """
+    if IbValgrindIsXml( path ) :
+        analyzer = IbValgrindXmlAnalyzer( **kwargs )
+        with open( path ) as fp :
+            analyzer.Feed( fp )
+        return analyzer
+    size = os.path.getsize( path ) if path != '-' else 0
+    if jobs <= 1  or  size < 2 * min_chunk :
+        analyzer = IbValgrindLogAnalyzer( **kwargs )
+        if path == '-' :
+            analyzer.Feed( sys.stdin )
+        else :
+            with open( path ) as fp :
+                analyzer.Feed( fp )
+        return analyzer
+    nchunks = min( jobs * 4, max(size // min_chunk, 1) )
+    bounds = [ size * n // nchunks for n in range(nchunks + 1) ]
+    chunks = [ (path, bounds[n], bounds[n+1], kwargs) for n in range(nchunks) ]
+    pool = multiprocessing.Pool( jobs )
+    try :
+        results = pool.imap( _AnalyzeChunk, chunks, 1 )
+        analyzer = next( results )
+        for result in results :
+            _AdoptChunk( analyzer, result )
+    finally :
+        pool.close( )
+        pool.join( )
+    analyzer.Flush( )
+    return analyzer
+
+class IbModule_util_valgrind_log( object ) :
+    modulePath = __file__
+
+if __name__ == "__main__" :
+    assert False, "not stand-alone"
+
+### Local Variables: ***
+### py-indent-offset:4 ***
+### python-indent:4 ***
+### python-continuation-offset:4 ***
+### tab-width:4  ***
+### End: ***
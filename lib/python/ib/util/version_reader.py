@@ -19,17 +19,26 @@ import re
 import os
 import sys
 import string
-import magic
 
 from ib.util.version import *
 
 class IbVersionReader( object ) :
     def __init__( self ) :
-        self._magic = magic.open(magic.NONE)
-        self._magic.load( )
+        self._magic = None
 
+    def _GetMagic( self ) :
+        # Loading libmagic and its database is slow; only do it when needed
+        if self._magic is None :
+            import magic
+            self._magic = magic.open(magic.NONE)
+            self._magic.load( )
+        return self._magic
+
+    _lib_re = re.compile( r'\.(a|so)(\.[\d\.]+)?$' )
     def GetAutoVersion( self, path ) :
-        ftype = self._magic.file( os.path.realpath(path) )
+        if self._lib_re.search( path ) :
+            return self.GetBinVersion( path )
+        ftype = self._GetMagic().file( os.path.realpath(path) )
         self._last_path = path
         if 'ASCII' in ftype  or  'text' in ftype :
             return self.GetTextVersion( path )